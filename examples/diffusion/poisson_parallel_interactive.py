@@ -56,7 +56,10 @@ Parallel runs::
 
   $ mpiexec -n 5 python examples/diffusion/poisson_parallel_interactive.py output-parallel -2 --shape=101,101 --verify --metis -ksp_monitor -ksp_converged_reason
 
-View the results using::
+The tasks save their parts of the solution in parallel, tied together by the
+``sol_part.xdmf`` file that can be viewed e.g. in ParaView. Use the
+``--gather`` option to save also the whole solution gathered to the task of
+rank zero, and view it using::
 
   $ python postproc.py output-parallel/sol.h5 --wireframe -b -d'u,plot_warp_scalar'
 """
@@ -343,14 +346,16 @@ def solve_problem(mesh_filename, options, comm):
     u_i.set_data(sol0_i)
     out = u_i.create_output()
 
-    filename = os.path.join(options.output_dir, 'sol_%02d.h5' % comm.rank)
-    pb.domain.mesh.write(filename, io='auto', out=out)
+    # Each task saves its part, no data are sent to the task of rank zero.
+    filename = os.path.join(options.output_dir, 'sol_part.h5')
+    pl.save_partitioned(filename, pb.domain.mesh, out=out, comm=comm)
 
-    gather_to_zero = pl.create_gather_to_zero(psol)
+    if options.gather:
+        gather_to_zero = pl.create_gather_to_zero(psol)
 
-    psol_full = gather_to_zero(psol)
+        psol_full = gather_to_zero(psol)
 
-    if comm.rank == 0:
+    if options.gather and (comm.rank == 0):
         sol = psol_full[...].copy()[id_map]
 
         u = FieldVariable('u', 'parameter', field,
@@ -440,6 +445,9 @@ helps = {
     'new_stats' :
     'create a new stats file with a header line (overwrites existing!)',
     'silent' : 'do not print messages to screen',
+    'gather' :
+    'gather the solution to the task of rank zero and save it also as a whole'
+    ' (uses the linearization option)',
     'clear' :
     'clear old solution files from output directory'
     ' (DANGEROUS - use with care!)',
@@ -491,6 +499,9 @@ def main():
     parser.add_argument('--silent',
                         action='store_true', dest='silent',
                         default=False, help=helps['silent'])
+    parser.add_argument('--gather',
+                        action='store_true', dest='gather',
+                        default=False, help=helps['gather'])
     parser.add_argument('--clear',
                         action='store_true', dest='clear',
                         default=False, help=helps['clear'])
@@ -528,7 +539,8 @@ def main():
 
         if options.clear:
             remove_files_patterns(output_dir,
-                                  ['*.h5', '*.mesh', '*.txt', '*.png'],
+                                  ['*.h5', '*.xdmf', '*.mesh', '*.txt',
+                                   '*.png'],
                                   ignores=['output_log_%02d.txt' % ii
                                            for ii in range(comm.size)],
                                   verbose=True)
@@ -41,6 +41,11 @@ Solve using the Bathe method::
 
   python simple.py examples/linear_elasticity/elastodynamic.py -O "ts='tsb'"
 
+Solve using the explicit central difference method with the lumped mass
+matrix and the time step set automatically from the element sizes::
+
+  python simple.py examples/linear_elasticity/elastodynamic.py -O "ts='tscd'"
+
 View the resulting deformation using:
 
 - color by :math:`\ul{u}`::
@@ -242,6 +247,22 @@ solvers = {
 
         'verbose' : 1,
     }),
+    'tscd' : ('ts.central_difference', {
+        # Explicit method -> the time step is set automatically using
+        # the longitudinal wave speed and the element sizes.
+        't0' : 0.0,
+        't1' : t1,
+        'dt' : None,
+        'n_step' : None,
+
+        'is_linear'  : True,
+
+        'mass_lumping' : 'row_sum',
+        'dt_safety' : 0.9,
+        'wave_speed' : cl,
+
+        'verbose' : 1,
+    }),
     'tsn' : ('ts.newmark', {
         't0' : 0.0,
         't1' : t1,
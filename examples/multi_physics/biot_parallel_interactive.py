@@ -77,7 +77,13 @@ Using FieldSplit preconditioner::
 
   $ mpiexec -n 8 python examples/multi_physics/biot_parallel_interactive.py output-parallel --shape=1001,1001 --metis -snes_monitor -snes_converged_reason -ksp_monitor -pc_type fieldsplit -pc_fieldsplit_type additive
 
-View the results using (strip linearization or approximation orders one)::
+The tasks save their parts of the solution in parallel, tied together by the
+``sol_part.xdmf`` file that can be viewed e.g. in ParaView. Use the
+``--gather`` option to save also the whole solution gathered to the task of
+rank zero.
+
+View the gathered results using (strip linearization or approximation orders
+one)::
 
   $ python postproc.py output-parallel/sol.h5 --wireframe -b -d'p,plot_warp_scalar:u,plot_displacements'
 
@@ -336,14 +342,16 @@ def solve_problem(mesh_filename, options, comm):
     state.set_full(sol0_i)
     out = state.create_output_dict()
 
-    filename = os.path.join(options.output_dir, 'sol_%02d.h5' % comm.rank)
-    pb.domain.mesh.write(filename, io='auto', out=out)
+    # Each task saves its part, no data are sent to the task of rank zero.
+    filename = os.path.join(options.output_dir, 'sol_part.h5')
+    pl.save_partitioned(filename, pb.domain.mesh, out=out, comm=comm)
 
-    gather_to_zero = pl.create_gather_to_zero(psol)
+    if options.gather:
+        gather_to_zero = pl.create_gather_to_zero(psol)
 
-    psol_full = gather_to_zero(psol)
+        psol_full = gather_to_zero(psol)
 
-    if comm.rank == 0:
+    if options.gather and (comm.rank == 0):
         sol = psol_full[...].copy()
 
         u = FieldVariable('u', 'parameter', field1,
@@ -420,6 +428,9 @@ helps = {
     'new_stats' :
     'create a new stats file with a header line (overwrites existing!)',
     'silent' : 'do not print messages to screen',
+    'gather' :
+    'gather the solution to the task of rank zero and save it also as a whole'
+    ' (uses the linearization option)',
     'clear' :
     'clear old solution files from output directory'
     ' (DANGEROUS - use with care!)',
@@ -465,6 +476,9 @@ def main():
     parser.add_argument('--silent',
                         action='store_true', dest='silent',
                         default=False, help=helps['silent'])
+    parser.add_argument('--gather',
+                        action='store_true', dest='gather',
+                        default=False, help=helps['gather'])
     parser.add_argument('--clear',
                         action='store_true', dest='clear',
                         default=False, help=helps['clear'])
@@ -500,7 +514,7 @@ def main():
 
         if options.clear:
             remove_files_patterns(output_dir,
-                                  ['*.h5', '*.mesh', '*.txt'],
+                                  ['*.h5', '*.xdmf', '*.mesh', '*.txt'],
                                   ignores=['output_log_%02d.txt' % ii
                                            for ii in range(comm.size)],
                                   verbose=True)
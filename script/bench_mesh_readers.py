@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Benchmark the mesh readers: generate a hexahedral block mesh with a given
+number of cells, write it in the legacy text formats (and in some other
+formats for reference), and compare the read times.
+
+Examples::
+
+  $ ./script/bench_mesh_readers.py
+  $ ./script/bench_mesh_readers.py -n 100000 -f mesh3d,gambit,mmap
+"""
+from __future__ import absolute_import
+import sys
+import os
+import os.path as op
+sys.path.append('.')
+from argparse import RawDescriptionHelpFormatter, ArgumentParser
+
+import numpy as nm
+
+from sfepy.base.base import output
+from sfepy.base.ioutils import ensure_path
+from sfepy.base.timing import Timer
+from sfepy.discrete.fem import Mesh
+from sfepy.mesh.mesh_generators import gen_block_mesh
+
+helps = {
+    'n_cell' :
+    'the approximate number of mesh cells [default: %(default)s]',
+    'formats' :
+    'the comma-separated list of formats to benchmark [default: %(default)s]',
+    'output_dir' :
+    'the output directory [default: %(default)s]',
+    'keep' :
+    'keep the generated mesh files',
+}
+
+def write_mesh3d(filename, coors, conn):
+    with open(filename, 'w') as fd:
+        fd.write('# vertices\n%d\n' % len(coors))
+        nm.savetxt(fd, coors, fmt='%.15e')
+        fd.write('\n# tetras\n0\n\n# hexes\n%d\n' % len(conn))
+        nm.savetxt(fd, conn + 1, fmt='%d')
+        fd.write('\n# prisms\n0\n\n# tris\n0\n\n# quads\n0\n')
+
+def write_hmascii(filename, coors, conn):
+    n_nod, n_el = len(coors), len(conn)
+    with open(filename, 'w') as fd:
+        nm.savetxt(fd, nm.c_[nm.arange(1, n_nod + 1), coors],
+                   fmt='*node(%d,%.15e,%.15e,%.15e,0,0,,,)')
+        fd.write('*component(1,"block",0)\n')
+        nm.savetxt(fd, nm.c_[nm.arange(1, n_el + 1), nm.ones(n_el), conn + 1],
+                   fmt='*hexa8(' + ','.join(['%d'] * 10) + ')')
+
+def write_gambit(filename, coors, conn):
+    n_nod, n_el = len(coors), len(conn)
+    # The node order is the same as in NEUMeshIO.read().
+    conn = conn[:, [0, 1, 3, 2, 4, 5, 7, 6]] + 1
+    eids = nm.arange(1, n_el + 1)
+    with open(filename, 'w') as fd:
+        fd.write('        CONTROL INFO 2.4.6\n** GAMBIT NEUTRAL FILE\nblock\n'
+                 'PROGRAM:                Gambit     VERSION:  2.4.6\n\n'
+                 '     NUMNP     NELEM     NGRPS    NBSETS     NDFCD'
+                 '     NDFVL\n%10d%10d%10d%10d%10d%10d\nENDOFSECTION\n'
+                 % (n_nod, n_el, 1, 0, 3, 3))
+        fd.write('   NODAL COORDINATES 2.4.6\n')
+        nm.savetxt(fd, nm.c_[nm.arange(1, n_nod + 1), coors],
+                   fmt='%10d%20.11e%20.11e%20.11e')
+        fd.write('ENDOFSECTION\n      ELEMENTS/CELLS 2.4.6\n')
+        # A hexahedron record continues on the next line.
+        nm.savetxt(fd, nm.c_[eids, 4 * nm.ones(n_el), 8 * nm.ones(n_el),
+                             conn],
+                   fmt='%8d %2d %2d' + '%8d' * 7 + '\n' + ' ' * 15 + '%8d')
+        fd.write('ENDOFSECTION\n       ELEMENT GROUP 2.4.6\n'
+                 'GROUP: %10d ELEMENTS: %10d MATERIAL: %10d NFLAGS: %10d\n'
+                 '%32s\n%8d\n' % (1, n_el, 2, 1, 'block', 0))
+        n_row = (n_el + 9) // 10
+        aux = nm.zeros(n_row * 10, dtype=eids.dtype)
+        aux[:n_el] = eids
+        lines = [' '.join('%8d' % ii for ii in row if ii)
+                 for row in aux.reshape((n_row, 10))]
+        fd.write('\n'.join(lines) + '\nENDOFSECTION\n')
+
+def write_ansys_cdb(filename, coors, conn):
+    n_nod, n_el = len(coors), len(conn)
+    with open(filename, 'w') as fd:
+        # The three fields of the NBLOCK line mean the solid model format.
+        fd.write('/PREP7\nNBLOCK,6,SOLID\n(3i9,6e21.13e3)\n')
+        nm.savetxt(fd, nm.c_[nm.arange(1, n_nod + 1), nm.zeros((n_nod, 2)),
+                             coors],
+                   fmt='%9d%9d%9d%21.13e%21.13e%21.13e')
+        fd.write('N,R5.3,LOC,       -1,\nEBLOCK,19,SOLID,%10d,%10d\n(19i9)\n'
+                 % (n_el, n_el))
+        ones = nm.ones(n_el, dtype=nm.int32)
+        head = nm.c_[ones, ones, ones, ones, 0 * ones, 0 * ones, 0 * ones,
+                     0 * ones, 8 * ones, 0 * ones,
+                     nm.arange(1, n_el + 1)]
+        nm.savetxt(fd, nm.c_[head, conn + 1], fmt='%9d' * 19)
+        fd.write('       -1\n')
+
+writers = {
+    'mesh3d' : ('.mesh3d', write_mesh3d),
+    'hmascii' : ('.hmascii', write_hmascii),
+    'gambit' : ('.neu', write_gambit),
+    'ansys_cdb' : ('.cdb', write_ansys_cdb),
+    'xyz' : ('.xyz', None),
+    'medit' : ('.mesh', None),
+    'vtk' : ('.vtk', None),
+    'mmap' : ('.smm', None),
+}
+
+def main():
+    parser = ArgumentParser(description=__doc__.rstrip(),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--n-cell', metavar='int', type=int,
+                        action='store', dest='n_cell',
+                        default=1000000, help=helps['n_cell'])
+    parser.add_argument('-f', '--formats', metavar='list',
+                        action='store', dest='formats',
+                        default=','.join(sorted(writers.keys())),
+                        help=helps['formats'])
+    parser.add_argument('-o', '--output-dir', metavar='path',
+                        action='store', dest='output_dir',
+                        default='output/bench_mesh_readers',
+                        help=helps['output_dir'])
+    parser.add_argument('--keep',
+                        action='store_true', dest='keep',
+                        default=False, help=helps['keep'])
+    options = parser.parse_args()
+
+    formats = options.formats.split(',')
+    for fmt in formats:
+        if fmt not in writers:
+            raise ValueError('unsupported format! (%s)' % fmt)
+
+    n1 = max(int(round(options.n_cell**(1.0 / 3.0))), 1) + 1
+    mesh = gen_block_mesh([1, 1, 1], [n1, n1, n1], [0, 0, 0],
+                          name='block', verbose=False)
+    coors = mesh.coors
+    conn = mesh.get_conn('3_8')
+    output('mesh: %d vertices, %d cells' % (mesh.n_nod, mesh.n_el))
+
+    times = {}
+    for fmt in formats:
+        suffix, write = writers[fmt]
+        filename = op.join(options.output_dir, 'block' + suffix)
+        ensure_path(filename)
+
+        output('writing %s...' % filename)
+        timer = Timer(start=True)
+        if write is None:
+            mesh.write(filename, io='auto')
+
+        else:
+            write(filename, coors, conn)
+
+        output('...done in %.2f s' % timer.stop())
+
+        timer.start()
+        mesh1 = Mesh.from_file(filename)
+        times[fmt] = timer.stop()
+
+        ok = ((mesh1.n_nod == mesh.n_nod) and (mesh1.n_el == mesh.n_el)
+              and nm.allclose(mesh1.coors, mesh.coors))
+        if not ok:
+            output('wrong mesh read from %s!' % filename)
+
+        size = op.getsize(filename)
+        if not options.keep:
+            os.remove(filename)
+            if fmt == 'xyz':
+                os.remove(op.splitext(filename)[0] + '.ien')
+
+        times[fmt] = (times[fmt], size)
+
+    output('read times of a mesh with %d cells:' % mesh.n_el)
+    for fmt, (t, size) in sorted(times.items(), key=lambda x: x[1][0]):
+        output('%10s: %8.2f s %10.1f MB' % (fmt, t, size / 1024.0**2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark the point location strategies of
+:func:`sfepy.discrete.common.global_interp.get_ref_coors()`: generate a block
+mesh with a given number of cells, optionally perturb or stretch it, and
+locate random points in it using the given strategies.
+
+Examples::
+
+  $ ./script/bench_point_location.py
+  $ ./script/bench_point_location.py -n 100000 -p 1000000 -s convex,bbox
+  $ ./script/bench_point_location.py --stretch 100
+"""
+from __future__ import absolute_import
+import sys
+sys.path.append('.')
+from argparse import RawDescriptionHelpFormatter, ArgumentParser
+
+import numpy as nm
+
+from sfepy.base.base import output
+from sfepy.base.timing import Timer
+from sfepy.discrete.fem import FEDomain, Field
+from sfepy.discrete.common.global_interp import get_ref_coors
+from sfepy.mesh.mesh_generators import gen_block_mesh
+
+helps = {
+    'n_cell' :
+    'the approximate number of mesh cells [default: %(default)s]',
+    'n_point' :
+    'the number of points to locate [default: %(default)s]',
+    'strategies' :
+    'the comma-separated list of strategies to benchmark'
+    ' [default: %(default)s]',
+    'stretch' :
+    'the stretching factor of the mesh in the x direction'
+    ' [default: %(default)s]',
+    'perturb' :
+    'the relative random perturbation of the inner mesh vertices'
+    ' [default: %(default)s]',
+    'close_limit' :
+    'the maximum distance of a point from the closest element allowed for'
+    ' extrapolation [default: %(default)s]',
+}
+
+def main():
+    parser = ArgumentParser(description=__doc__.rstrip(),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--n-cell', metavar='int', type=int,
+                        action='store', dest='n_cell',
+                        default=10000, help=helps['n_cell'])
+    parser.add_argument('-p', '--n-point', metavar='int', type=int,
+                        action='store', dest='n_point',
+                        default=100000, help=helps['n_point'])
+    parser.add_argument('-s', '--strategies', metavar='list',
+                        action='store', dest='strategies',
+                        default='general,convex,bbox',
+                        help=helps['strategies'])
+    parser.add_argument('--stretch', metavar='float', type=float,
+                        action='store', dest='stretch',
+                        default=1.0, help=helps['stretch'])
+    parser.add_argument('--perturb', metavar='float', type=float,
+                        action='store', dest='perturb',
+                        default=0.2, help=helps['perturb'])
+    parser.add_argument('-c', '--close-limit', metavar='float', type=float,
+                        action='store', dest='close_limit',
+                        default=0.1, help=helps['close_limit'])
+    options = parser.parse_args()
+
+    strategies = options.strategies.split(',')
+    for strategy in strategies:
+        if strategy not in ('general', 'convex', 'bbox'):
+            raise ValueError('unsupported strategy! (%s)' % strategy)
+
+    n1 = max(int(round(options.n_cell**(1.0 / 3.0))), 1) + 1
+    dims = nm.array([options.stretch, 1.0, 1.0])
+    mesh = gen_block_mesh(dims, [n1, n1, n1], 0.5 * dims,
+                          name='block', verbose=False)
+
+    # Perturb the inner vertices to get irregular cells.
+    coors = mesh.coors
+    inner = ((coors > 0) & (coors < dims)).all(axis=1)
+    dx = dims / (n1 - 1)
+    coors[inner] += (options.perturb * dx
+                     * (nm.random.rand(inner.sum(), 3) - 0.5))
+
+    output('mesh: %d vertices, %d cells' % (mesh.n_nod, mesh.n_el))
+
+    domain = FEDomain('domain', mesh)
+    omega = domain.create_region('Omega', 'all')
+    field = Field.from_args('fu', nm.float64, 1, omega, approx_order=1)
+
+    points = (nm.random.rand(options.n_point, 3) * 1.1 - 0.05) * dims
+    output('points: %d' % options.n_point)
+
+    results = {}
+    timer = Timer()
+    for strategy in strategies:
+        output('strategy %s...' % strategy)
+        timer.start()
+        ref_coors, cells, status = get_ref_coors(
+            field, points, strategy=strategy,
+            close_limit=options.close_limit, verbose=True
+        )
+        results[strategy] = (timer.stop(), cells, status)
+        output('...done in %.2f s' % results[strategy][0])
+
+        if strategy == 'bbox':
+            # The index is cached in the field.
+            timer.start()
+            get_ref_coors(field, points, strategy=strategy,
+                          close_limit=options.close_limit)
+            output('...repeated in %.2f s' % timer.stop())
+
+    output('location times of %d points in a mesh with %d cells:'
+           % (options.n_point, mesh.n_el))
+    ref = results[strategies[0]][2]
+    for strategy, (t, cells, status) in sorted(results.items(),
+                                               key=lambda x: x[1][0]):
+        output('%10s: %8.2f s, inside: %d, status agrees with %s: %.2f %%'
+               % (strategy, t, (status == 0).sum(), strategies[0],
+                  100.0 * (status == ref).mean()))
+
+if __name__ == '__main__':
+    main()
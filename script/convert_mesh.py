@@ -10,6 +10,11 @@ Examples::
   $ ./script/convert_mesh.py meshes/3d/cylinder.mesh new.vtk -s0.5,2,1 -c 0
   $ ./script/convert_mesh.py meshes/3d/cylinder.mesh new.mesh --remesh='q2/0 a1e-8 O9/7 V'
   $ ./script/convert_mesh.py meshes/3d/cylinder.mesh new2.mesh --remesh='rq2/0 a1e-8 O9/7 V'
+
+Convert a mesh to the memory-mapped binary format for fast loading of large
+meshes::
+
+  $ ./script/convert_mesh.py meshes/3d/cylinder.mesh new.smm
 """
 from __future__ import absolute_import
 import sys
@@ -193,6 +193,8 @@ def check_versions(show_only=False):
                   show_only=show_only)
     package_check('dask', INFO.DASK_MIN_VERSION, optional=True,
                   show_only=show_only)
+    package_check('numba', INFO.NUMBA_MIN_VERSION, optional=True,
+                  show_only=show_only)
 
 def setup_package():
     if not 'sdist' in sys.argv[1:]:
@@ -24,9 +24,45 @@ def validate_bool(val):
     else:
         raise ValueError('Could not convert "%s" to boolean!' % val)
 
+def validate_nonnegative_int(val):
+    """
+    Convert val to a non-negative integer or raise a ValueError.
+    """
+    try:
+        cval = int(val)
+
+    except (TypeError, ValueError):
+        raise ValueError('Could not convert "%s" to int!' % (val,))
+
+    if cval < 0:
+        raise ValueError('Value must be non-negative! (%s)' % (val,))
+
+    return cval
+
+def validate_nonnegative_float(val):
+    """
+    Convert val to a non-negative float or raise a ValueError.
+    """
+    try:
+        cval = float(val)
+
+    except (TypeError, ValueError):
+        raise ValueError('Could not convert "%s" to float!' % (val,))
+
+    if cval < 0:
+        raise ValueError('Value must be non-negative! (%s)' % (val,))
+
+    return cval
+
 default_goptions = {
     'verbose' : [True, validate_bool],
     'check_term_finiteness' : [False, validate_bool],
+    # The number of threads used for assembling (0 = all cores).
+    'assemble_n_threads' : [1, validate_nonnegative_int],
+    # The memory limit in MB of the cell values of a single term evaluated
+    # in the 'weak' mode (0 = no limit). Terms supporting it are evaluated
+    # and assembled in chunks of cells that fit into the limit.
+    'eval_memory_limit' : [0.0, validate_nonnegative_float],
 }
 
 class ValidatedDict(dict):
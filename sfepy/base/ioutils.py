@@ -35,6 +35,154 @@ class InDir(Struct):
     def __call__(self, filename):
         return op.join(self.dir, filename)
 
+class BackgroundWriter(Struct):
+    """
+    Call output writing functions in a background thread.
+
+    At most `queue_size` writes can be pending, so that the memory used by
+    the data waiting for writing is bounded. When the queue is full,
+    :func:`BackgroundWriter.submit()` blocks - the number of such waits and
+    the total waiting time are reported by :func:`BackgroundWriter.flush()`.
+
+    An exception raised in a write is re-raised by the next call of
+    :func:`BackgroundWriter.submit()` or :func:`BackgroundWriter.flush()`.
+    The subsequent writes are skipped until then.
+
+    The data passed to :func:`BackgroundWriter.submit()` must not be
+    modified by the caller afterwards.
+
+    PyTables is not thread-safe, so while the writer is running, any other
+    HDF5 access has to be done in its thread as well, using
+    :func:`BackgroundWriter.call()`.
+    """
+
+    def __init__(self, queue_size=2, name='background writer'):
+        import atexit
+        import threading
+        from six.moves import queue
+
+        Struct.__init__(self, queue_size=queue_size, name=name,
+                        n_write=0, n_wait=0, wait_time=0.0, error=None)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+        atexit.register(self.close, raise_error=False)
+
+    def _run(self):
+        while 1:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    break
+
+                fun, args, kwargs, result = job
+                if result is not None:
+                    try:
+                        result.value = fun(*args, **kwargs)
+
+                    except Exception as exc:
+                        result.error = exc
+
+                    finally:
+                        result.done.set()
+
+                elif self.error is None:
+                    fun(*args, **kwargs)
+
+            except Exception as exc:
+                self.error = exc
+
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self, raise_error=True):
+        if self.error is None:
+            return
+
+        error, self.error = self.error, None
+        if raise_error:
+            raise error
+
+        else:
+            output('%s: error in a write (skipped): %s' % (self.name, error))
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def submit(self, fun, *args, **kwargs):
+        """
+        Call `fun(*args, **kwargs)` in the background thread.
+        """
+        self._check_error()
+        self._put((fun, args, kwargs, None))
+
+    def call(self, fun, *args, **kwargs):
+        """
+        Call `fun(*args, **kwargs)` in the background thread after the pending
+        writes, wait for it to finish and return its result. An exception
+        raised by `fun` is re-raised.
+        """
+        import threading
+
+        result = Struct(value=None, error=None, done=threading.Event())
+        self._put((fun, args, kwargs, result))
+        result.done.wait()
+
+        if result.error is not None:
+            raise result.error
+
+        return result.value
+
+    def _put(self, job):
+        from six.moves import queue
+        from sfepy.base.timing import Timer
+
+        if not self.is_running():
+            raise ValueError('%s is closed!' % self.name)
+
+        try:
+            self._queue.put_nowait(job)
+
+        except queue.Full:
+            timer = Timer(start=True)
+            self._queue.put(job)
+            self.n_wait += 1
+            self.wait_time += timer.stop()
+
+        self.n_write += 1
+
+    def flush(self, raise_error=True):
+        """
+        Wait for all pending writes to finish.
+        """
+        if self.is_running():
+            self._queue.join()
+
+        if self.n_wait:
+            output('%s: %d of %d writes waited %.2f [s] for a free buffer'
+                   % (self.name, self.n_wait, self.n_write, self.wait_time))
+
+        self._check_error(raise_error=raise_error)
+
+    def close(self, raise_error=True):
+        """
+        Flush the pending writes and stop the background thread.
+        """
+        import atexit
+
+        atexit.unregister(self.close)
+        if not self.is_running():
+            return
+
+        try:
+            self.flush(raise_error=raise_error)
+
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
 def ensure_path(filename):
     """
     Check if path to `filename` exists and if not, create the necessary
@@ -48,6 +196,29 @@ def ensure_path(filename):
         if not os.path.isdir(dirname):
             raise IOError('cannot ensure path for "%s"!' % filename)
 
+def write_file_atomic(filename, write, mode='wb'):
+    """
+    Write `filename` by calling `write(fd)` with the file object `fd` opened
+    in `mode`. The file is written to a temporary name in the same directory
+    first and then renamed, so that other processes (e.g. sharing a cache
+    directory) never see an incomplete file.
+    """
+    import tempfile
+
+    ensure_path(filename)
+
+    dirname = op.dirname(filename) or os.curdir
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fd:
+            write(fd)
+        os.replace(tmp_filename, filename)
+
+    except Exception:
+        if op.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
 def locate_files(pattern, root_dir=os.curdir, **kwargs):
     """
     Locate all files matching fiven filename pattern in and below
@@ -288,6 +459,66 @@ def read_array(fd, n_row, n_col, dtype):
 
     return val
 
+def parse_array(text, dtype=nm.float64, n_col=None, sep=None, comments=None):
+    """
+    Convert a text with rows of numbers to a NumPy array of type `dtype` and
+    shape `(n_row, n_col)` in a single pass, instead of parsing the rows one
+    by one.
+
+    Parameters
+    ----------
+    text : str or list of str
+        The text or its lines.
+    dtype : dtype
+        The array data type. The values are parsed as floats and cast to
+        `dtype`, so that integers can be written also in the float notation.
+    n_col : int, optional
+        The number of columns. If None, it is determined from the first
+        non-empty row.
+    sep : str, optional
+        The number separator, if not whitespace.
+    comments : str, optional
+        If given, the rest of each line after `comments` is ignored.
+
+    Returns
+    -------
+    val : array
+        The parsed array.
+    """
+    if not isinstance(text, basestr):
+        text = '\n'.join(text)
+
+    if (comments is not None) and (comments in text):
+        text = '\n'.join(line.split(comments, 1)[0]
+                         for line in text.splitlines())
+
+    if sep is not None:
+        text = text.replace(sep, ' ')
+
+    if n_col is None:
+        n_col = 0
+        pos = 0
+        while pos < len(text):
+            eol = text.find('\n', pos)
+            if eol < 0:
+                eol = len(text)
+
+            n_col = len(text[pos:eol].split())
+            if n_col: break
+
+            pos = eol + 1
+
+    if not n_col:
+        return nm.zeros((0, 0), dtype=dtype)
+
+    val = nm.fromstring(text, dtype=nm.float64, sep=' ')
+    if val.shape[0] % n_col:
+        raise ValueError('array parsing failed! (%d values, %d columns)'
+                         % (val.shape[0], n_col))
+
+    val = val.reshape((-1, n_col))
+    return nm.asarray(val, dtype=dtype)
+
 ##
 # c: 05.02.2008, r: 05.02.2008
 def read_list(fd, n_item, dtype):
@@ -911,6 +1142,183 @@ def read_from_hdf5(fd, group, cache=None):
 
     return _read_from_hdf5(group)
 
+class HDF5Checkpoints(Struct):
+    """
+    A chain of snapshots of named arrays stored in a single HDF5 file.
+
+    The arrays are stored under keys derived from their contents, so an array
+    equal to an array of any previous snapshot in the chain is not stored
+    again. The first snapshot of a chain is thus a full snapshot, and the
+    following snapshots store only the arrays that changed. The arrays are
+    compressed using `complevel` and `complib` PyTables filter settings.
+
+    The file is opened only for the duration of :func:`save()` and
+    :func:`load()` calls, so that an interrupted run leaves the previous
+    snapshots readable.
+    """
+    title = 'SfePy checkpoint file'
+
+    @staticmethod
+    def get_digest(arr):
+        """
+        Return the hexadecimal digest of the array dtype, shape and data.
+        """
+        import hashlib
+
+        # Unlike ascontiguousarray(), keeps the shape of 0-d arrays.
+        arr = nm.asarray(arr, order='C')
+        digest = hashlib.sha1(enc(arr.dtype.str + str(arr.shape)))
+        digest.update(nm.atleast_1d(arr).view(nm.uint8))
+
+        return digest.hexdigest()
+
+    def __init__(self, filename, mode='a', complevel=4, complib='zlib'):
+        Struct.__init__(self, filename=filename, complevel=complevel,
+                        complib=complib, n_snapshot=0)
+
+        if (mode == 'w') or not op.exists(filename):
+            fd = pt.open_file(filename, mode='w', title=self.title)
+            fd.create_group('/', 'arrays', 'arrays')
+            fd.create_group('/', 'snapshots', 'snapshots')
+            fd.close()
+
+        else:
+            fd = pt.open_file(filename, mode='r')
+            try:
+                if fd.title != self.title:
+                    raise IOError('not a checkpoint file! ("%s" != "%s")'
+                                  % (fd.title, self.title))
+                self.n_snapshot = fd.root.snapshots._v_nchildren
+
+            finally:
+                fd.close()
+
+    def save(self, key, arrays, info=None):
+        """
+        Append a snapshot of `arrays` to the chain.
+
+        Parameters
+        ----------
+        key : int or str
+            The snapshot key, for example the time step.
+        arrays : dict
+            The arrays to save, as a name - array dictionary.
+        info : dict, optional
+            Additional (small) data stored with the snapshot.
+
+        Returns
+        -------
+        n_new : int
+            The number of arrays actually written.
+        """
+        filters = pt.Filters(complevel=self.complevel, complib=self.complib,
+                             shuffle=True)
+
+        fd = pt.open_file(self.filename, mode='a')
+        try:
+            agroup = fd.root.arrays
+            digests = {}
+            n_new = 0
+            for name, arr in six.iteritems(arrays):
+                arr = nm.asarray(arr, order='C')
+                digest = self.get_digest(arr)
+                digests[name] = digest
+
+                aname = 'a' + digest
+                if aname in agroup:
+                    continue
+
+                if arr.ndim and arr.size:
+                    fd.create_carray(agroup, aname, obj=arr, filters=filters)
+
+                else:
+                    fd.create_array(agroup, aname, arr)
+
+                n_new += 1
+
+            sgroup = fd.create_group(fd.root.snapshots,
+                                     'snapshot%06d' % self.n_snapshot)
+            sgroup._v_attrs.key = key
+            sgroup._v_attrs.digests = digests
+            sgroup._v_attrs.info = {} if info is None else info
+
+        finally:
+            fd.close()
+
+        self.n_snapshot += 1
+
+        return n_new
+
+    def get_keys(self):
+        """
+        Return the keys of the stored snapshots, oldest first.
+        """
+        fd = pt.open_file(self.filename, mode='r')
+        try:
+            keys = [sgroup._v_attrs.key for sgroup in
+                    self._iter_snapshots(fd)]
+
+        finally:
+            fd.close()
+
+        return keys
+
+    def load(self, key=None):
+        """
+        Load a snapshot.
+
+        Parameters
+        ----------
+        key : int or str, optional
+            The snapshot key. If not given, the last snapshot is loaded.
+
+        Returns
+        -------
+        key : int or str
+            The snapshot key.
+        arrays : dict
+            The snapshot arrays.
+        info : dict
+            The additional snapshot data.
+        """
+        fd = pt.open_file(self.filename, mode='r')
+        try:
+            sgroups = list(self._iter_snapshots(fd))
+            if not len(sgroups):
+                raise IOError('no snapshots in "%s"!' % self.filename)
+
+            if key is None:
+                sgroup = sgroups[-1]
+
+            else:
+                for sgroup in sgroups:
+                    if sgroup._v_attrs.key == key:
+                        break
+
+                else:
+                    raise KeyError('no snapshot with key %s in "%s"!'
+                                   % (key, self.filename))
+
+            attrs = sgroup._v_attrs
+            arrays = {}
+            for name, digest in six.iteritems(attrs.digests):
+                arrays[name] = nm.asarray(
+                    fd.root.arrays._f_get_child('a' + digest).read()
+                )
+
+            key, info = attrs.key, attrs.info
+
+        finally:
+            fd.close()
+
+        return key, arrays, info
+
+    @staticmethod
+    def _iter_snapshots(fd):
+        sgroup = fd.root.snapshots
+        for name in sorted(sgroup._v_children.keys()):
+            yield sgroup._f_get_child(name)
+
 class HDF5ContextManager:
     def __init__(self, filename, *args, **kwargs):
         self.filename = filename
@@ -1,6 +1,12 @@
 # -*- Mode: Python -*-
 """
 Low level finite element assembling functions.
+
+The assembling loops run without the GIL, so that several Python threads can
+assemble disjoint groups of cells (see :func:`color_cells()`) concurrently.
+The optional `ii` argument of the assembling functions selects the positions
+in `iels` (and the first axis of the element contributions) to assemble - by
+default, all cells are assembled.
 """
 cimport cython
 
@@ -9,38 +15,170 @@ cimport numpy as np
 
 from types cimport int32, float64, complex128
 
+ctypedef np.uint64_t uint64
+
+@cython.boundscheck(False)
+cdef inline void _assemble_vector(float64 *val, float64 *vec_in_el0,
+                                  int32 *piels, int32 *pii, int32 num,
+                                  float64 sign, int32 *pconn0, int32 n_ep,
+                                  int32 cell_size) nogil:
+    cdef int32 jj, ii, iel, ir, irg
+    cdef (int32 *) pconn
+    cdef (float64 *) vec_in_el
+
+    for jj in range(0, num):
+        ii = pii[jj] if pii != NULL else jj
+        iel = piels[ii]
+
+        pconn = pconn0 + iel * n_ep
+        vec_in_el = vec_in_el0 + ii * cell_size
+
+        for ir in range(0, n_ep):
+            irg = pconn[ir]
+            if irg < 0: continue
+
+            val[irg] += sign * vec_in_el[ir]
+
+@cython.boundscheck(False)
+cdef inline void _assemble_vector_complex(complex128 *val,
+                                          complex128 *vec_in_el0,
+                                          int32 *piels, int32 *pii,
+                                          int32 num, complex128 sign,
+                                          int32 *pconn0, int32 n_ep,
+                                          int32 cell_size) nogil:
+    cdef int32 jj, ii, iel, ir, irg
+    cdef (int32 *) pconn
+    cdef (complex128 *) vec_in_el
+
+    for jj in range(0, num):
+        ii = pii[jj] if pii != NULL else jj
+        iel = piels[ii]
+
+        pconn = pconn0 + iel * n_ep
+        vec_in_el = vec_in_el0 + ii * cell_size
+
+        for ir in range(0, n_ep):
+            irg = pconn[ir]
+            if irg < 0: continue
+
+            val[irg] = val[irg] + sign * vec_in_el[ir]
+
+@cython.boundscheck(False)
+cdef inline int32 _assemble_matrix(float64 *val, int32 *_prows, int32 *_cols,
+                                   float64 *mtx_in_el0,
+                                   int32 *piels, int32 *pii, int32 num,
+                                   float64 sign,
+                                   int32 *prow_conn0, int32 n_epr,
+                                   int32 *pcol_conn0, int32 n_epc,
+                                   int32 cell_size,
+                                   int32 *pirg, int32 *picg) nogil:
+    cdef int32 jj, ii, iel, ir, ic, irg, icg, ik, iloc, found
+    cdef (int32 *) prow_conn, pcol_conn
+    cdef (float64 *) mtx_in_el
+
+    for jj in range(0, num):
+        ii = pii[jj] if pii != NULL else jj
+        iel = piels[ii]
+
+        prow_conn = prow_conn0 + iel * n_epr
+        pcol_conn = pcol_conn0 + iel * n_epc
+        mtx_in_el = mtx_in_el0 + ii * cell_size
+
+        for ir in range(0, n_epr):
+            irg = prow_conn[ir]
+            if irg < 0: continue
+
+            for ic in range(0, n_epc):
+                icg = pcol_conn[ic]
+                if icg < 0: continue
+
+                iloc = n_epc * ir + ic
+
+                found = 0
+                for ik in range(_prows[irg], _prows[irg + 1]):
+                    if _cols[ik] == icg:
+                        val[ik] += sign * mtx_in_el[iloc]
+                        found = 1
+                        break
+
+                if not found:
+                    pirg[0] = irg
+                    picg[0] = icg
+                    return 1
+
+    return 0
+
+@cython.boundscheck(False)
+cdef inline int32 _assemble_matrix_complex(complex128 *val,
+                                           int32 *_prows, int32 *_cols,
+                                           complex128 *mtx_in_el0,
+                                           int32 *piels, int32 *pii,
+                                           int32 num, complex128 sign,
+                                           int32 *prow_conn0, int32 n_epr,
+                                           int32 *pcol_conn0, int32 n_epc,
+                                           int32 cell_size,
+                                           int32 *pirg, int32 *picg) nogil:
+    cdef int32 jj, ii, iel, ir, ic, irg, icg, ik, iloc, found
+    cdef (int32 *) prow_conn, pcol_conn
+    cdef (complex128 *) mtx_in_el
+
+    for jj in range(0, num):
+        ii = pii[jj] if pii != NULL else jj
+        iel = piels[ii]
+
+        prow_conn = prow_conn0 + iel * n_epr
+        pcol_conn = pcol_conn0 + iel * n_epc
+        mtx_in_el = mtx_in_el0 + ii * cell_size
+
+        for ir in range(0, n_epr):
+            irg = prow_conn[ir]
+            if irg < 0: continue
+
+            for ic in range(0, n_epc):
+                icg = pcol_conn[ic]
+                if icg < 0: continue
+
+                iloc = n_epc * ir + ic
+
+                found = 0
+                for ik in range(_prows[irg], _prows[irg + 1]):
+                    if _cols[ik] == icg:
+                        val[ik] = val[ik] + sign * mtx_in_el[iloc]
+                        found = 1
+                        break
+
+                if not found:
+                    pirg[0] = irg
+                    picg[0] = icg
+                    return 1
+
+    return 0
+
 @cython.boundscheck(False)
 def assemble_vector(np.ndarray[float64, mode='c', ndim=1] vec not None,
                     np.ndarray[float64, mode='c', ndim=4] vec_in_els not None,
                     np.ndarray[int32, mode='c', ndim=1] iels not None,
                     float64 sign,
-                    np.ndarray[int32, mode='c', ndim=2] conn not None):
-    cdef int32 ii, iel, ir, irg
+                    np.ndarray[int32, mode='c', ndim=2] conn not None,
+                    np.ndarray[int32, mode='c', ndim=1] ii=None):
     cdef int32 num = iels.shape[0]
     cdef int32 n_ep = conn.shape[1]
     # Allow both row or column vectors.
     cdef int32 cell_size = vec_in_els.shape[2] * vec_in_els.shape[3]
-    cdef (int32 *) pconn0, pconn
-    cdef int32 *piels = &iels[0]
-    cdef float64 *val = &vec[0]
-    cdef (float64 *) vec_in_el0, vec_in_el
+    cdef int32 *pii = NULL
 
     assert num == vec_in_els.shape[0]
 
-    pconn0 = &conn[0, 0]
-    vec_in_el0 = &vec_in_els[0, 0, 0, 0]
+    if ii is not None:
+        num = ii.shape[0]
+        if num > 0:
+            pii = &ii[0]
 
-    for ii in range(0, num):
-        iel = piels[ii]
-
-        pconn = pconn0 + iel * n_ep
-        vec_in_el = vec_in_el0 + ii * cell_size
-
-        for ir in range(0, n_ep):
-            irg = pconn[ir]
-            if irg < 0: continue
+    if num == 0: return
 
-            val[irg] += sign * vec_in_el[ir]
+    with nogil:
+        _assemble_vector(&vec[0], &vec_in_els[0, 0, 0, 0], &iels[0], pii,
+                         num, sign, &conn[0, 0], n_ep, cell_size)
 
 @cython.boundscheck(False)
 def assemble_vector_complex(np.ndarray[complex128, mode='c', ndim=1]
@@ -49,33 +187,27 @@ def assemble_vector_complex(np.ndarray[complex128, mode='c', ndim=1]
                             vec_in_els not None,
                             np.ndarray[int32, mode='c', ndim=1] iels not None,
                             complex128 sign,
-                            np.ndarray[int32, mode='c', ndim=2] conn not None):
-    cdef int32 ii, iel, ir, irg
+                            np.ndarray[int32, mode='c', ndim=2] conn not None,
+                            np.ndarray[int32, mode='c', ndim=1] ii=None):
     cdef int32 num = iels.shape[0]
     cdef int32 n_ep = conn.shape[1]
     # Allow both row or column vectors.
     cdef int32 cell_size = vec_in_els.shape[2] * vec_in_els.shape[3]
-    cdef (int32 *) pconn0, pconn
-    cdef int32 *piels = &iels[0]
-    cdef complex128 *val = &vec[0]
-    cdef (complex128 *) vec_in_el0, vec_in_el
+    cdef int32 *pii = NULL
 
     assert num == vec_in_els.shape[0]
 
-    pconn0 = &conn[0, 0]
-    vec_in_el0 = &vec_in_els[0, 0, 0, 0]
-
-    for ii in range(0, num):
-        iel = piels[ii]
+    if ii is not None:
+        num = ii.shape[0]
+        if num > 0:
+            pii = &ii[0]
 
-        pconn = pconn0 + iel * n_ep
-        vec_in_el = vec_in_el0 + ii * cell_size
-
-        for ir in range(0, n_ep):
-            irg = pconn[ir]
-            if irg < 0: continue
+    if num == 0: return
 
-            val[irg] += sign * vec_in_el[ir]
+    with nogil:
+        _assemble_vector_complex(&vec[0], &vec_in_els[0, 0, 0, 0],
+                                 &iels[0], pii, num, sign,
+                                 &conn[0, 0], n_ep, cell_size)
 
 @cython.boundscheck(False)
 def assemble_matrix(np.ndarray[float64, mode='c', ndim=1] mtx not None,
@@ -85,50 +217,34 @@ def assemble_matrix(np.ndarray[float64, mode='c', ndim=1] mtx not None,
                     np.ndarray[int32, mode='c', ndim=1] iels not None,
                     float64 sign,
                     np.ndarray[int32, mode='c', ndim=2] row_conn not None,
-                    np.ndarray[int32, mode='c', ndim=2] col_conn not None):
-    cdef int32 ii, iel, ir, ic, irg, icg, ik, iloc
+                    np.ndarray[int32, mode='c', ndim=2] col_conn not None,
+                    np.ndarray[int32, mode='c', ndim=1] ii=None):
+    cdef int32 ret, irg = 0, icg = 0
     cdef int32 num = iels.shape[0]
     cdef int32 n_epr = row_conn.shape[1]
     cdef int32 n_epc = col_conn.shape[1]
     cdef int32 cell_size = mtx_in_els.shape[2] * mtx_in_els.shape[3]
-    cdef (int32 *) prow_conn0, pcol_conn0, prow_conn, pcol_conn
-    cdef int32 *piels = &iels[0]
-    cdef int32 *_prows = &prows[0]
-    cdef int32 *_cols = &cols[0]
-    cdef float64 *val = &mtx[0]
-    cdef (float64 *) mtx_in_el0, mtx_in_el
+    cdef int32 *pii = NULL
 
     assert num == mtx_in_els.shape[0]
 
-    prow_conn0 = &row_conn[0, 0]
-    pcol_conn0 = &col_conn[0, 0]
-    mtx_in_el0 = &mtx_in_els[0, 0, 0, 0]
-
-    for ii in range(0, num):
-        iel = piels[ii]
-
-        prow_conn = prow_conn0 + iel * n_epr
-        pcol_conn = pcol_conn0 + iel * n_epc
-        mtx_in_el = mtx_in_el0 + ii * cell_size
+    if ii is not None:
+        num = ii.shape[0]
+        if num > 0:
+            pii = &ii[0]
 
-        for ir in range(0, n_epr):
-            irg = prow_conn[ir]
-            if irg < 0: continue
+    if num == 0: return
 
-            for ic in range(0, n_epc):
-                icg = pcol_conn[ic]
-                if icg < 0: continue
+    with nogil:
+        ret = _assemble_matrix(&mtx[0], &prows[0], &cols[0],
+                               &mtx_in_els[0, 0, 0, 0], &iels[0], pii, num,
+                               sign, &row_conn[0, 0], n_epr,
+                               &col_conn[0, 0], n_epc, cell_size,
+                               &irg, &icg)
 
-                iloc = n_epc * ir + ic
-
-                for ik in range(_prows[irg], _prows[irg + 1]):
-                    if _cols[ik] == icg:
-                        val[ik] += sign * mtx_in_el[iloc]
-                        break
-
-                else:
-                    msg = 'matrix item (%d, %d) does not exist!' % (irg, icg)
-                    raise IndexError(msg)
+    if ret:
+        msg = 'matrix item (%d, %d) does not exist!' % (irg, icg)
+        raise IndexError(msg)
 
 @cython.boundscheck(False)
 def assemble_matrix_complex(np.ndarray[complex128, mode='c', ndim=1]
@@ -142,47 +258,106 @@ def assemble_matrix_complex(np.ndarray[complex128, mode='c', ndim=1]
                             np.ndarray[int32, mode='c', ndim=2]
                             row_conn not None,
                             np.ndarray[int32, mode='c', ndim=2]
-                            col_conn not None):
-    cdef int32 ii, iel, ir, ic, irg, icg, ik, iloc
+                            col_conn not None,
+                            np.ndarray[int32, mode='c', ndim=1] ii=None):
+    cdef int32 ret, irg = 0, icg = 0
     cdef int32 num = iels.shape[0]
     cdef int32 n_epr = row_conn.shape[1]
     cdef int32 n_epc = col_conn.shape[1]
     cdef int32 cell_size = mtx_in_els.shape[2] * mtx_in_els.shape[3]
-    cdef (int32 *) prow_conn0, pcol_conn0, prow_conn, pcol_conn
-    cdef int32 *piels = &iels[0]
-    cdef int32 *_prows = &prows[0]
-    cdef int32 *_cols = &cols[0]
-    cdef complex128 *val = &mtx[0]
-    cdef (complex128 *) mtx_in_el0, mtx_in_el
+    cdef int32 *pii = NULL
 
     assert num == mtx_in_els.shape[0]
 
-    prow_conn0 = &row_conn[0, 0]
-    pcol_conn0 = &col_conn[0, 0]
-    mtx_in_el0 = &mtx_in_els[0, 0, 0, 0]
+    if ii is not None:
+        num = ii.shape[0]
+        if num > 0:
+            pii = &ii[0]
 
-    for ii in range(0, num):
-        iel = piels[ii]
+    if num == 0: return
 
-        prow_conn = prow_conn0 + iel * n_epr
-        pcol_conn = pcol_conn0 + iel * n_epc
-        mtx_in_el = mtx_in_el0 + ii * cell_size
+    with nogil:
+        ret = _assemble_matrix_complex(&mtx[0], &prows[0], &cols[0],
+                                       &mtx_in_els[0, 0, 0, 0], &iels[0],
+                                       pii, num, sign,
+                                       &row_conn[0, 0], n_epr,
+                                       &col_conn[0, 0], n_epc, cell_size,
+                                       &irg, &icg)
 
-        for ir in range(0, n_epr):
-            irg = prow_conn[ir]
+    if ret:
+        msg = 'matrix item (%d, %d) does not exist!' % (irg, icg)
+        raise IndexError(msg)
+
+@cython.boundscheck(False)
+def color_cells(np.ndarray[int32, mode='c', ndim=1] iels not None,
+                np.ndarray[int32, mode='c', ndim=2] conn not None,
+                int32 n_dof):
+    """
+    Greedy coloring of cells `iels` such that no two cells of the same color
+    share a DOF in the connectivity `conn`. Negative DOF numbers (e.g. DOFs
+    eliminated by EBCs) are ignored.
+
+    Parameters
+    ----------
+    iels : array of ints
+        The cells to color.
+    conn : array of ints
+        The cell-DOF connectivity, with rows indexed by `iels` items.
+    n_dof : int
+        The total number of DOFs.
+
+    Returns
+    -------
+    colors : array of ints or None
+        The color of each item of `iels`, numbered from zero. If more than 64
+        colors would be needed, None is returned.
+    n_color : int
+        The number of colors.
+    """
+    cdef int32 ii, iel, ir, irg, ic, n_color = 0
+    cdef int32 num = iels.shape[0]
+    cdef int32 n_ep = conn.shape[1]
+    cdef uint64 mask, bit
+    cdef (int32 *) pconn
+    cdef np.ndarray[uint64, mode='c', ndim=1] _used
+    cdef np.ndarray[int32, mode='c', ndim=1] _colors
+    cdef uint64 *used
+    cdef int32 *colors
+
+    _colors = np.empty(num, dtype=np.int32)
+    if num == 0:
+        return _colors, 0
+
+    _used = np.zeros(max(n_dof, 1), dtype=np.uint64)
+    used = &_used[0]
+    colors = &_colors[0]
+
+    for ii in range(0, num):
+        iel = iels[ii]
+        pconn = &conn[iel, 0]
+
+        mask = 0
+        for ir in range(0, n_ep):
+            irg = pconn[ir]
             if irg < 0: continue
+            mask |= used[irg]
 
-            for ic in range(0, n_epc):
-                icg = pcol_conn[ic]
-                if icg < 0: continue
+        if mask == <uint64> 0xffffffffffffffff:
+            return None, n_color
 
-                iloc = n_epc * ir + ic
+        ic = 0
+        bit = 1
+        while mask & bit:
+            ic += 1
+            bit <<= 1
 
-                for ik in range(_prows[irg], _prows[irg + 1]):
-                    if _cols[ik] == icg:
-                        val[ik] += sign * mtx_in_el[iloc]
-                        break
+        colors[ii] = ic
+        if ic >= n_color:
+            n_color = ic + 1
+
+        for ir in range(0, n_ep):
+            irg = pconn[ir]
+            if irg < 0: continue
+            used[irg] |= bit
 
-                else:
-                    msg = 'matrix item (%d, %d) does not exist!' % (irg, icg)
-                    raise IndexError(msg)
+    return _colors, n_color
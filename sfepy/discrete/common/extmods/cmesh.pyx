@@ -56,9 +56,15 @@ cdef _create_cconn(MeshConnectivity *pconn, num, n_incident, what):
 cdef class CMesh:
 
     @classmethod
-    def from_data(cls, coors, vertex_groups, conns, mat_ids, descs):
+    def from_data(cls, coors, vertex_groups, conns, mat_ids, descs,
+                  copy=True):
         """
         Fill CMesh data using Python data.
+
+        If `copy` is False and `coors` is a C-contiguous float64 array, it is
+        used directly instead of its copy. The connectivity data are always
+        copied into the memory managed by the C code, without any other
+        temporary copies.
         """
         cdef uint32 tdim
         cdef np.ndarray[float64, mode='c', ndim=2] _coors
@@ -81,7 +87,10 @@ cdef class CMesh:
         if (self.dim < 1) or (self.dim > 3):
             raise ValueError('CMesh geometry dimension must be 1, 2 or 3! (%d)'
                              % self.dim)
-        _coors = self.coors = coors.copy()
+        if copy:
+            coors = coors.copy()
+
+        _coors = self.coors = np.ascontiguousarray(coors, dtype=np.float64)
         mesh_set_coors(self.mesh, &_coors[0, 0], self.n_coor, self.dim, tdim)
 
         self.vertex_groups = vertex_groups
@@ -103,16 +112,17 @@ cdef class CMesh:
 
         self.cell_groups = mat_ids
 
-        indices = []
-        offsets = []
+        # Fill the connectivity in place, group by group.
         ict = 0
+        iin = 0
+        cconn.offsets[0] = 0
         for ig, conn in enumerate(conns):
             n_el, n_ep = conn.shape
 
-            off = np.empty(n_el, dtype=np.uint32)
-            off.fill(n_ep)
-            offsets.append(off)
-            indices.append(conn.ravel())
+            cconn.indices[iin:iin+n_el*n_ep] = conn.reshape(-1)
+            cconn.offsets[ict+1:ict+n_el+1] = (
+                iin + n_ep * np.arange(1, n_el + 1, dtype=np.uint32)
+            )
 
             if descs[ig] in self.key_to_index:
                 self.cell_types[ict:ict+n_el] = self.key_to_index[descs[ig]]
@@ -121,13 +131,7 @@ cdef class CMesh:
                 self.cell_types[ict:ict+n_el] = 5 # Higher order mesh.
 
             ict += n_el
-
-        indices = np.concatenate(indices)
-        offsets = np.concatenate(offsets)
-
-        cconn.indices[:] = indices
-        cconn.offsets[0] = 0
-        cconn.offsets[1:] = np.cumsum(offsets)
+            iin += n_el * n_ep
 
         self.conns = [None] * (self.mesh.topology.max_dim + 1)**2
         self.conns[ii] = cconn
@@ -60,6 +60,47 @@ cdef class CMapping:
         array2fmfield4(self._bfg, self.bfg)
         self.geo.bfGM = self._bfg
 
+    def get_slice(self, int32 start, int32 stop):
+        """
+        Return a new CMapping instance restricted to the cells
+        `start:stop`. The data arrays of the new instance are views of the
+        arrays of this instance.
+        """
+        cdef CMapping out
+        cdef int32 flag = self.bf.shape[0] > 1
+
+        out = CMapping(stop - start, self.n_qp, self.dim, self.n_ep,
+                       mode=self.mode, flag=flag)
+        if flag:
+            out.bf = self.bf[start:stop]
+            array2fmfield4(out._bf, out.bf)
+
+        else:
+            out.bf = self.bf
+            array2fmfield4(out._bf, out.bf)
+
+        out.det = self.det[start:stop]
+        array2fmfield4(out._det, out.det)
+
+        out.volume = self.volume[start:stop]
+        array2fmfield4(out._volume, out.volume)
+
+        if self.bfg is not None:
+            out.bfg = self.bfg[start:stop]
+            array2fmfield4(out._bfg, out.bfg)
+            out.geo.bfGM = out._bfg
+
+        if self.normal is not None:
+            out.normal = self.normal[start:stop]
+            array2fmfield4(out._normal, out.normal)
+
+        out.integral = self.integral
+        out.qp = self.qp
+        out.ps = self.ps
+        out.mtx_t = self.mtx_t
+
+        return out
+
     def __str__(self):
         return 'CMapping: mode: %s, n_el %d, n_qp %d, dim: %d, n_ep: %d' \
                % ((self.mode,) + self.shape)
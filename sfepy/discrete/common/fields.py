@@ -1,4 +1,5 @@
 from __future__ import absolute_import
+from collections import OrderedDict
 
 import numpy as nm
 
@@ -77,11 +78,60 @@ def fields_from_conf(conf, regions):
 
     return fields
 
+class InterpolationOperator(Struct):
+    """
+    The sparse operator interpolating the DOF values of a field into given
+    points, see :func:`Field.get_interpolation_operator()`.
+
+    Calling the operator with source DOF values returns the same values as
+    :func:`Field.evaluate_at()` in the points.
+    """
+
+    def __init__(self, mtx, cells, status, mode, dim):
+        Struct.__init__(self, name='interpolation_operator', mtx=mtx,
+                        cells=cells, status=status, mode=mode, dim=dim,
+                        n_point=len(status))
+
+    def __call__(self, source_vals, ret_status=False):
+        """
+        Interpolate the source values.
+
+        Parameters
+        ----------
+        source_vals : array, shape ``(n_nod, n_components)``
+            The source DOF values corresponding to the field.
+        ret_status : bool, optional
+            If False, the values where the status is greater than one are set
+            to ``numpy.nan``. Otherwise, they are zero.
+
+        Returns
+        -------
+        vals : array
+            The interpolated values with shape ``(n_point, n_components)`` or
+            gradients with shape ``(n_point, n_components, dim)`` according to
+            the operator mode.
+        """
+        vals = self.mtx * source_vals
+        if self.mode == 'grad':
+            vals = vals.reshape((self.n_point, self.dim, -1))
+            vals = vals.transpose(0, 2, 1)
+
+        if not ret_status:
+            ii = nm.where(self.status > 1)[0]
+            if len(ii):
+                vals = vals.astype(nm.result_type(vals, nm.float64))
+                vals[ii] = nm.nan
+
+        return vals
+
 class Field(Struct):
     """
     Base class for fields.
     """
     _all = None
+    # The maximum number of cached interpolation operators, see
+    # Field.get_interpolation_operator().
+    max_interp_operators = 8
 
     @staticmethod
     def from_args(name, dtype, shape, region, approx_order=1,
@@ -352,10 +402,13 @@ class Field(Struct):
         mode : {'val', 'grad'}, optional
             The evaluation mode: the field value (default) or the field value
             gradient.
-        strategy : {'general', 'convex'}, optional
+        strategy : {'general', 'convex', 'bbox'}, optional
             The strategy for finding the elements that contain the
             coordinates. For convex meshes, the 'convex' strategy might be
-            faster than the 'general' one.
+            faster than the 'general' one. The 'bbox' strategy uses a cached
+            spatial index of cell bounding boxes, which is faster for large
+            numbers of points or cells, see :func:`get_ref_coors()
+            <sfepy.discrete.common.global_interp.get_ref_coors()>`.
         close_limit : float, optional
             The maximum limit distance of a point from the closest
             element allowed for extrapolation.
@@ -470,3 +523,155 @@ class Field(Struct):
 
         else:
             return vals
+
+    def get_interpolation_operator(self, coors, mode='val',
+                                   strategy='general', close_limit=0.1,
+                                   get_cells_fun=None, cache=None,
+                                   verbose=False):
+        """
+        Get the sparse operator interpolating the field DOF values into the
+        given coordinates.
+
+        The point location and the basis evaluation are done only when the
+        operator is created. The operators are cached in the field using the
+        `coors` contents, `mode`, `strategy` and `close_limit` as the key, so
+        repeated calls with the same points return the same operator. At most
+        `max_interp_operators` (class attribute) recently used operators are
+        kept, zero disables the caching. Call
+        :func:`Field.clear_interpolation_operators()` when the field geometry
+        changes.
+
+        Parameters
+        ----------
+        coors : array, shape ``(n_point, dim)``
+            The coordinates the values should be interpolated into.
+        mode, strategy, close_limit, get_cells_fun, cache, verbose
+            See :func:`Field.evaluate_at()`.
+
+        Returns
+        -------
+        op : InterpolationOperator instance
+            The interpolation operator.
+        """
+        import hashlib
+        from sfepy.discrete.common.global_interp import get_ref_coors
+
+        coors = nm.ascontiguousarray(coors, dtype=nm.float64)
+        sha1 = hashlib.sha1(str((coors.shape, mode, strategy,
+                                 close_limit)).encode('utf-8'))
+        sha1.update(coors)
+        digest = sha1.hexdigest()
+
+        ops = self.get('interp_operators', None)
+        if ops is None:
+            ops = self.interp_operators = OrderedDict()
+
+        op = ops.get(digest)
+        if op is not None:
+            ops.move_to_end(digest)
+
+        else:
+            timer = Timer(start=True)
+            ref_coors, cells, status = get_ref_coors(
+                self, coors, strategy=strategy, close_limit=close_limit,
+                get_cells_fun=get_cells_fun, cache=cache, verbose=verbose
+            )
+            mtx = self.get_interpolation_matrix(ref_coors, cells, status,
+                                                mode=mode)
+            op = InterpolationOperator(mtx, cells, status, mode,
+                                       coors.shape[1])
+            if self.max_interp_operators > 0:
+                while len(ops) >= self.max_interp_operators:
+                    ops.popitem(last=False)
+
+                ops[digest] = op
+
+            output('interpolation operator of "%s" in %d points: %f s'
+                   % (self.name, coors.shape[0], timer.stop()),
+                   verbose=verbose)
+
+        return op
+
+    def get_cell_index(self):
+        """
+        Get the cell bounding box index used by the 'bbox' point location
+        strategy, see :func:`get_ref_coors()
+        <sfepy.discrete.common.global_interp.get_ref_coors()>`. The index is
+        cached in the field.
+        """
+        from sfepy.discrete.common.global_interp import CellBBoxIndex
+
+        index = self.get('cell_index', None)
+        if index is None:
+            index = self.cell_index = CellBBoxIndex()
+
+        return index
+
+    def clear_interpolation_operators(self):
+        """
+        Clear the cached interpolation operators and the cell bounding box
+        index.
+        """
+        self.interp_operators = OrderedDict()
+        self.cell_index = None
+
+    def get_interpolation_matrix(self, ref_coors, cells, status, mode='val'):
+        """
+        Get the sparse matrix interpolating the field DOF values into points
+        given by their reference element coordinates and cells, as returned
+        by :func:`Field.evaluate_at()` with `ret_ref_coors` set to True.
+
+        Parameters
+        ----------
+        ref_coors : array, shape ``(n_point, dim)``
+            The reference element coordinates of the points.
+        cells : array, shape ``(n_point,)``
+            The cell indices the points are in.
+        status : array, shape ``(n_point,)``
+            The point location status, see :func:`Field.evaluate_at()`.
+        mode : {'val', 'grad'}, optional
+            The interpolation mode: the field value (default) or the field
+            value gradient.
+
+        Returns
+        -------
+        mtx : csr_matrix
+            The interpolation matrix with the shape ``(n_point, n_nod)`` in
+            the 'val' mode, or ``(n_point * dim, n_nod)`` in the 'grad' mode,
+            where the gradient of the point `ip` corresponds to the rows
+            ``ip * dim : (ip + 1) * dim``. The rows of points with the status
+            greater than one are empty.
+        """
+        import scipy.sparse as sps
+        from sfepy.discrete.common.extmods.crefcoors import evaluate_in_rc
+
+        conn = self.get_econn('volume', self.region)
+        n_point, dim = ref_coors.shape
+        n_ep = conn.shape[1]
+
+        if mode == 'val':
+            bdim, cmode = 1, 0
+
+        elif mode == 'grad':
+            bdim, cmode = dim, 1
+
+        else:
+            raise ValueError('unknown interpolation mode! (%s)' % mode)
+
+        # Interpolating the unit vectors of element DOFs gives the values of
+        # the basis functions (gradients) in the points.
+        lconn = nm.tile(nm.arange(n_ep, dtype=nm.int32), (conn.shape[0], 1))
+        bfs = nm.empty((n_point, n_ep, bdim), dtype=nm.float64)
+        evaluate_in_rc(bfs, ref_coors, cells, status, nm.eye(n_ep), lconn,
+                       cmode, self.create_basis_context())
+
+        ii = nm.where(status <= 1)[0]
+        vals = bfs[ii]
+        rows = nm.broadcast_to(ii[:, None, None] * bdim + nm.arange(bdim),
+                               vals.shape)
+        cols = nm.broadcast_to(conn[cells[ii]][..., None], vals.shape)
+
+        mtx = sps.coo_matrix((vals.ravel(), (rows.ravel(), cols.ravel())),
+                             shape=(n_point * bdim, self.n_nod))
+
+        return mtx.tocsr()
@@ -3,7 +3,7 @@ Global interpolation functions.
 """
 import numpy as nm
 
-from sfepy.base.base import assert_, output, get_default_attr
+from sfepy.base.base import assert_, output, get_default_attr, Struct
 from sfepy.base.timing import Timer
 from sfepy.discrete.fem.geometry_element import create_geometry_elements
 import sfepy.discrete.common.extmods.crefcoors as crc
@@ -191,6 +191,196 @@ def get_potential_cells(coors, cmesh, centroids=None, extrapolate=True):
 
     return potential_cells, offsets
 
+class CellBBoxIndex(Struct):
+    """
+    Spatial index of cell bounding boxes for finding cells that potentially
+    contain given points.
+
+    The cells are sorted into levels by the half-sizes of their bounding
+    boxes along each axis - in a level, the half-sizes along an axis differ at
+    most by the factor of `level_ratio`. In each level, the coordinates are
+    scaled per axis by the largest half-sizes of the level, and a k-d tree of
+    the scaled bounding box centres is built. A query of a point is a search
+    for the scaled box centres within the unit distance (in the max-norm),
+    followed by the exact test of the point being in the cell bounding boxes
+    enlarged by `eps` times the cell size. Thanks to the levels and the
+    scaling, neither large cells nor long thin cells slow down the queries in
+    regions of small cells.
+
+    The points are processed in chunks of at most `chunk_size` points, that
+    are further split, so that at most about `max_candidates` candidate
+    point-cell pairs are held in memory at once.
+
+    The index is built on the first call, and can be used as `get_cells_fun`
+    argument of :func:`get_ref_coors()`. It is valid as long as the
+    coordinates of the cmesh vertices are not changed.
+    """
+
+    def __init__(self, cmesh=None, level_ratio=2.0, eps=1e-8,
+                 chunk_size=100000, max_candidates=2000000):
+        Struct.__init__(self, level_ratio=level_ratio, eps=eps,
+                        chunk_size=chunk_size,
+                        max_candidates=max_candidates, n_cell=None,
+                        levels=None, vertex_tree=None)
+        if cmesh is not None:
+            self.build(cmesh)
+
+    def build(self, cmesh, verbose=False):
+        """
+        Build the index of the cells of `cmesh`.
+        """
+        from scipy.spatial import cKDTree as KDTree
+
+        timer = Timer(start=True)
+
+        conn = cmesh.get_cell_conn()
+        cc = conn.indices.reshape(cmesh.n_el, -1)
+        cell_coors = cmesh.coors[cc]
+
+        bmin = cell_coors.min(axis=1)
+        bmax = cell_coors.max(axis=1)
+        centres = 0.5 * (bmin + bmax)
+        halfs = 0.5 * (bmax - bmin)
+
+        sizes = halfs.max(axis=1)
+        sizes = nm.maximum(sizes, 1e-300)
+        halfs += self.eps * sizes[:, None]
+
+        ilevels = nm.floor(nm.log(halfs / halfs.min(axis=0))
+                           / nm.log(self.level_ratio)).astype(nm.int32)
+        keys, inverse = nm.unique(ilevels, axis=0, return_inverse=True)
+
+        self.levels = []
+        for ik in range(len(keys)):
+            cells = nm.where(inverse.ravel() == ik)[0].astype(nm.int32)
+            scale = 1.0 / halfs[cells].max(axis=0)
+            level = Struct(cells=cells, scale=scale,
+                           tree=KDTree(centres[cells] * scale))
+            self.levels.append(level)
+
+        self.n_cell = cmesh.n_el
+        self.centres = centres
+        self.halfs = halfs
+        self.vertex_tree = None
+
+        output('cell bounding box index: %d cells in %d levels: %f s'
+               % (self.n_cell, len(self.levels), timer.stop()),
+               verbose=verbose)
+
+    def __call__(self, coors, cmesh, centroids=None, extrapolate=True,
+                 **kwargs):
+        """
+        Get cells that potentially contain points with the given physical
+        coordinates. The arguments and return values are the same as in
+        :func:`get_potential_cells()`.
+        """
+        if self.n_cell != cmesh.n_el:
+            self.build(cmesh)
+
+        chunk_size = self.chunk_size
+        n_point = coors.shape[0]
+
+        potential_cells = []
+        lens = nm.zeros(n_point + 1, dtype=nm.int32)
+        for ii in range(0, n_point, chunk_size):
+            ips, ics = self._query(coors[ii:ii + chunk_size])
+            potential_cells.append(ics)
+            lens[ii + 1:ii + 1 + chunk_size] = nm.bincount(
+                ips, minlength=min(chunk_size, n_point - ii)
+            )
+
+        potential_cells = (nm.concatenate(potential_cells).astype(nm.int32)
+                           if len(potential_cells)
+                           else nm.zeros(0, dtype=nm.int32))
+
+        if extrapolate:
+            # Deal with the points outside of the cell bounding boxes - use
+            # the cells incident to the closest mesh vertex.
+            iin = nm.where(lens[1:] == 0)[0]
+            if len(iin):
+                ics, vlens = self._get_vertex_cells(coors[iin], cmesh)
+
+                ips = nm.r_[nm.repeat(nm.arange(n_point), lens[1:]),
+                            nm.repeat(iin, vlens)]
+                ii = nm.argsort(ips, kind='stable')
+                potential_cells = nm.r_[potential_cells, ics][ii]
+                potential_cells = potential_cells.astype(nm.int32)
+                lens[iin + 1] = vlens
+
+        offsets = nm.cumsum(lens, dtype=nm.int32)
+
+        return potential_cells, offsets
+
+    def _query(self, coors):
+        """
+        Return the point-cell pairs of the cell bounding boxes containing the
+        points, sorted by the points.
+        """
+        ips, ics = [], []
+        for level in self.levels:
+            scoors = coors * level.scale
+            lens = level.tree.query_ball_point(scoors, 1.0, p=nm.inf,
+                                               return_length=True)
+            if not lens.sum():
+                continue
+
+            # Split the points, so that the candidate pairs of a part fit into
+            # max_candidates.
+            cumlens = nm.cumsum(lens)
+            bounds = nm.searchsorted(
+                cumlens,
+                nm.arange(self.max_candidates, cumlens[-1],
+                          self.max_candidates),
+                side='right',
+            )
+            bounds = nm.unique(nm.r_[0, bounds, len(coors)])
+
+            for i0, i1 in zip(bounds[:-1], bounds[1:]):
+                n_hit = cumlens[i1 - 1] - (cumlens[i0 - 1] if i0 else 0)
+                if not n_hit:
+                    continue
+
+                hits = level.tree.query_ball_point(scoors[i0:i1], 1.0,
+                                                   p=nm.inf)
+                lips = nm.repeat(nm.arange(i0, i1), lens[i0:i1])
+                lics = level.cells[nm.concatenate(hits).astype(nm.int64)]
+
+                dist = nm.abs(coors[lips] - self.centres[lics])
+                ii = nm.where((dist <= self.halfs[lics]).all(axis=1))[0]
+
+                ips.append(lips[ii])
+                ics.append(lics[ii])
+
+        if not len(ips):
+            return (nm.zeros(0, dtype=nm.int64), nm.zeros(0, dtype=nm.int32))
+
+        ips = nm.concatenate(ips)
+        ics = nm.concatenate(ics)
+        ii = nm.argsort(ips, kind='stable')
+
+        return ips[ii], ics[ii]
+
+    def _get_vertex_cells(self, coors, cmesh):
+        from scipy.spatial import cKDTree as KDTree
+
+        if self.vertex_tree is None:
+            self.vertex_tree = KDTree(cmesh.coors)
+
+        ivs = self.vertex_tree.query(coors)[1]
+
+        cmesh.setup_connectivity(0, cmesh.tdim)
+        conn = cmesh.get_conn(0, cmesh.tdim)
+        # The offsets are unsigned - mixing them with the signed cumsum
+        # results would promote to float64.
+        oo = conn.offsets.astype(nm.int64)
+
+        lens = oo[ivs + 1] - oo[ivs]
+        offsets = nm.cumsum(lens) - lens
+        ii = nm.repeat(oo[ivs] - offsets, lens) + nm.arange(lens.sum())
+        ics = conn.indices[ii]
+
+        return ics, lens
+
 def get_ref_coors_general(field, coors, close_limit=0.1, get_cells_fun=None,
                           cache=None, verbose=False):
     """
@@ -311,10 +501,14 @@ def get_ref_coors(field, coors, strategy='general', close_limit=0.1,
         The field defining the approximation.
     coors : array
         The physical coordinates.
-    strategy : {'general', 'convex'}, optional
+    strategy : {'general', 'convex', 'bbox'}, optional
         The strategy for finding the elements that contain the coordinates. For
         convex meshes, the 'convex' strategy might be faster than the 'general'
-        one.
+        one. The 'bbox' strategy is the 'general' strategy with the potential
+        cells found using :class:`CellBBoxIndex` cached in the field, see
+        :func:`Field.get_cell_index()
+        <sfepy.discrete.common.fields.Field.get_cell_index()>`. It is much
+        faster for large numbers of points or cells.
     close_limit : float, optional
         The maximum limit distance of a point from the closest
         element allowed for extrapolation.
@@ -355,5 +549,10 @@ def get_ref_coors(field, coors, strategy='general', close_limit=0.1,
         return get_ref_coors_convex(field, coors, close_limit=close_limit,
                                     cache=cache, verbose=verbose)
 
+    elif strategy == 'bbox':
+        return get_ref_coors_general(field, coors, close_limit=close_limit,
+                                     get_cells_fun=field.get_cell_index(),
+                                     cache=cache, verbose=verbose)
+
     else:
         raise ValueError('unsupported strategy! (%s)' % strategy)
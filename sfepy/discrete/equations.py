@@ -6,16 +6,194 @@ from copy import copy
 
 import numpy as nm
 import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator
 
 from sfepy.base.base import output, assert_, get_default, iter_dict_of_lists
 from sfepy.base.base import OneTypeList, Container, Struct
 from sfepy.base.timing import Timer
 from sfepy.discrete import Materials, Variables, create_adof_conns
 from sfepy.discrete.common.extmods.cmesh import create_mesh_graph
+from sfepy.linalg.sparse import stamp_matrix
 from sfepy.terms import Terms, Term
 from sfepy.terms.terms_multilinear import ETermBase
 import six
 
+def get_matrix_graph_key(shape, rdcs, cdcs):
+    """
+    Get a hash key of the matrix graph defined by the matrix `shape` and the
+    row and column DOF connectivities `rdcs`, `cdcs`.
+
+    The active DOF connectivities are determined by the mesh topology, the
+    fields approximation, the regions and the EBC/EPBC DOF sets, so the key
+    changes whenever any of those changes.
+    """
+    import hashlib
+
+    sha1 = hashlib.sha1()
+    sha1.update(('%d %d %d' % (shape[0], shape[1], len(rdcs))).encode())
+    for rdc, cdc in zip(rdcs, cdcs):
+        for dc in (rdc, cdc):
+            dc = nm.ascontiguousarray(dc, dtype=nm.int32)
+            sha1.update(str(dc.shape).encode())
+            sha1.update(dc.data)
+
+    return sha1.hexdigest()
+
+def load_matrix_graph(cache_dir, key):
+    """
+    Load the matrix graph CSR arrays stored under `key` in `cache_dir`.
+
+    Returns
+    -------
+    prow, icol : arrays or None
+        The CSR row pointers and column indices, or None, if the graph is not
+        in the cache.
+    """
+    import os.path as op
+
+    filename = op.join(cache_dir, 'graph-%s.npz' % key)
+    if not op.exists(filename):
+        return None, None
+
+    try:
+        with nm.load(filename) as data:
+            prow, icol = data['prow'], data['icol']
+
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+    return prow, icol
+
+def save_matrix_graph(cache_dir, key, prow, icol):
+    """
+    Save the matrix graph CSR arrays under `key` in `cache_dir`, see
+    :func:`write_file_atomic() <sfepy.base.ioutils.write_file_atomic()>`.
+    """
+    import os.path as op
+
+    from sfepy.base.ioutils import write_file_atomic
+
+    filename = op.join(cache_dir, 'graph-%s.npz' % key)
+    write_file_atomic(filename,
+                      lambda fd: nm.savez(fd, prow=prow, icol=icol))
+
+class ElementMatrixOperator(LinearOperator):
+    """
+    Linear operator applying cell (element) matrices without assembling the
+    global sparse matrix.
+
+    The matrices of the terms based on
+    :class:`ETermBase <sfepy.terms.terms_multilinear.ETermBase>` are not
+    stored: their einsum expressions are contracted with the cell vectors in
+    each application of the operator, see
+    :func:`ETermBase.get_matvec_function()
+    <sfepy.terms.terms_multilinear.ETermBase.get_matvec_function()>`. The
+    cell matrices of other terms are computed once and stored. The dense cell
+    matrices take more memory than the assembled CSR matrix, because the
+    contributions of neighbouring cells to shared DOFs are stored separately.
+    To limit the memory, the cell matrices of blocks with the same cells and
+    DOF connectivities (e.g. of several terms in one equation) are summed,
+    and the DOF indices of the cells are not stored, but taken from the
+    connectivities when applying the operator. The memory taken by the cell
+    matrices is available in the `nbytes` attribute.
+
+    Parameters
+    ----------
+    shape : tuple
+        The operator shape.
+    dtype : numpy.dtype
+        The operator data type.
+    blocks : list of tuples
+        The cell matrix blocks `(vals, iels, rdc, cdc, sign)`, where `vals`
+        is the `(n_el, 1, n_row, n_col)` array of cell matrices of cells
+        `iels`, or a function `vals(xe, adjoint=False)` applying them to the
+        `(n_el, n_col)` array `xe` of cell vectors, `rdc`, `cdc` are the row
+        and column DOF connectivities with negative values for inactive DOFs
+        and `sign` is the scaling factor.
+    extras : list of sparse matrices, optional
+        Additional sparse matrices, e.g. of terms with dynamic connectivity.
+    """
+
+    def __init__(self, shape, dtype, blocks, extras=None):
+        LinearOperator.__init__(self, dtype=dtype, shape=shape)
+
+        self.blocks = []
+        for vals, iels, rdc, cdc, sign in blocks:
+            if callable(vals):
+                self.blocks.append((vals, iels, rdc, cdc, sign))
+                continue
+
+            vals = vals[:, 0]
+            for ib, (bvals, biels, brdc, bcdc, _) in enumerate(self.blocks):
+                if callable(bvals): continue
+                if ((brdc is rdc) and (bcdc is cdc)
+                    and ((biels is iels) or nm.array_equal(biels, iels))):
+                    # The values may be cached by the term - do not modify
+                    # them in place.
+                    self.blocks[ib] = (bvals + sign * vals, biels, brdc, bcdc,
+                                       1.0)
+                    break
+
+            else:
+                if sign != 1.0:
+                    vals = sign * vals
+                self.blocks.append((vals, iels, rdc, cdc, 1.0))
+
+        self.nbytes = sum(block[0].nbytes for block in self.blocks
+                          if not callable(block[0]))
+
+        self.extras = extras if extras is not None else []
+
+    @staticmethod
+    def _scatter_add(out, indices, vals):
+        if nm.iscomplexobj(vals):
+            out += nm.bincount(indices, weights=vals.real,
+                               minlength=out.shape[0])
+            out += 1j * nm.bincount(indices, weights=vals.imag,
+                                    minlength=out.shape[0])
+
+        else:
+            out += nm.bincount(indices, weights=vals,
+                               minlength=out.shape[0])
+
+    def _apply(self, x, adjoint=False):
+        x = nm.asarray(x).ravel()
+        n_row = self.shape[1] if adjoint else self.shape[0]
+        out = nm.zeros(n_row, dtype=nm.result_type(self.dtype, x.dtype))
+
+        for vals, iels, rdc, cdc, sign in self.blocks:
+            rows = rdc[iels]
+            cols = cdc[iels]
+            if adjoint:
+                rows, cols = cols, rows
+
+            xe = nm.where(cols >= 0, x[cols], 0)
+            if callable(vals):
+                ye = vals(xe, adjoint=adjoint)
+                if sign != 1.0:
+                    ye = (nm.conj(sign) if adjoint else sign) * ye
+
+            elif adjoint:
+                vals = nm.conj(vals) if nm.iscomplexobj(vals) else vals
+                ye = nm.einsum('ijk,ij->ik', vals, xe)
+
+            else:
+                ye = nm.einsum('ijk,ik->ij', vals, xe)
+
+            mask = rows >= 0
+            self._scatter_add(out, rows[mask], ye[mask])
+
+        for extra in self.extras:
+            out += (extra.H if adjoint else extra) * x
+
+        return out
+
+    def _matvec(self, x):
+        return self._apply(x)
+
+    def _rmatvec(self, x):
+        return self._apply(x, adjoint=True)
+
 def parse_definition(equation_def):
     """
     Parse equation definition string to create term description list.
@@ -427,12 +605,17 @@ class Equations(Container):
         return rdcs, cdcs
 
     def create_matrix_graph(self, any_dof_conn=False, rdcs=None, cdcs=None,
-                            shape=None, active_only=True, verbose=True):
+                            shape=None, active_only=True, cache_dir=None,
+                            verbose=True):
         """
         Create tangent matrix graph, i.e. preallocate and initialize the
         sparse storage needed for the tangent matrix. Order of DOF
         connectivities is not important.
 
+        If `cache_dir` is given, the graph is looked up in the on-disk cache
+        using a key computed from the DOF connectivities by
+        :func:`get_matrix_graph_key()` and stored there if not found.
+
         Parameters
         ----------
         any_dof_conn : bool
@@ -449,6 +632,8 @@ class Equations(Container):
         active_only : bool
             If True, the matrix graph has reduced size and is created with the
             reduced (active DOFs only) numbering.
+        cache_dir : str, optional
+            The directory of the persistent matrix graph cache.
         verbose : bool
             If False, reduce verbosity.
 
@@ -478,18 +663,32 @@ class Equations(Container):
             output('no matrix (empty dof connectivities)!')
             return None
 
-        output('assembling matrix graph...', verbose=verbose)
-        timer = Timer(start=True)
+        prow = icol = None
+        if cache_dir is not None:
+            key = get_matrix_graph_key(shape, rdcs, cdcs)
+            prow, icol = load_matrix_graph(cache_dir, key)
+            if prow is not None:
+                output('matrix graph loaded from cache:', key,
+                       verbose=verbose)
+                nnz = len(icol)
+
+        if prow is None:
+            output('assembling matrix graph...', verbose=verbose)
+            timer = Timer(start=True)
 
-        nnz, prow, icol = create_mesh_graph(shape[0], shape[1],
-                                            len(rdcs), rdcs, cdcs)
+            nnz, prow, icol = create_mesh_graph(shape[0], shape[1],
+                                                len(rdcs), rdcs, cdcs)
 
-        output('...done in %.2f s' % timer.stop(), verbose=verbose)
+            output('...done in %.2f s' % timer.stop(), verbose=verbose)
+
+            if cache_dir is not None:
+                save_matrix_graph(cache_dir, key, prow, icol)
         output('matrix structural nonzeros: %d (%.2e%% fill)' \
                % (nnz, float(nnz) / size), verbose=verbose)
 
         data = nm.zeros((nnz,), dtype=self.variables.dtype)
         matrix = sp.csr_matrix((data, icol, prow), shape)
+        stamp_matrix(matrix, new_pattern=True)
 
         return matrix
 
@@ -763,6 +962,141 @@ class Equations(Container):
 
         return out
 
+    def eval_tangent_matrix_block(self, state, block_matrix, row_name,
+                                  col_name):
+        """
+        Evaluate (assemble) a block of the tangent matrix without assembling
+        the whole matrix.
+
+        Only the terms with the test variable `row_name` are differentiated
+        w.r.t. the unknown variable `col_name`, and the results are assembled
+        directly into `block_matrix`.
+
+        Parameters
+        ----------
+        state : array
+            The vector of DOF values. Note that it is needed only in
+            nonlinear terms.
+        block_matrix : csr_matrix
+            The preallocated CSR matrix with the sparsity pattern of the
+            block. Its shape corresponds to the DOFs of the two variables in
+            the state vector, i.e. to the reduced DOFs if the variables use
+            active DOFs only.
+        row_name : str
+            The name of the test variable, or of its primary unknown
+            variable.
+        col_name : str
+            The name of the unknown variable.
+
+        Returns
+        -------
+        out : csr_matrix
+            The assembled block matrix.
+        """
+        self.set_variables_from_state(state)
+
+        variables = self.variables
+        rvar = variables[row_name]
+        if rvar.is_state():
+            row_name = rvar.dual_var_name
+
+        get_indx = variables.get_indx
+        ir = get_indx(row_name, stripped=True, allow_dual=True)
+        ic = get_indx(col_name, stripped=True)
+        offsets = (int(ir.start), int(ic.start))
+
+        block_matrix.data[:] = 0.0
+        extras = []
+        for eq in self:
+            for term in eq.terms:
+                if term.get_virtual_name() != row_name: continue
+
+                svars = term.get_state_variables(unknown_only=True)
+                for svar in svars:
+                    if svar.name != col_name: continue
+
+                    for val, iels, status in term.iter_evaluate(
+                            mode='weak', diff_var=svar.name,
+                    ):
+                        extra = term.assemble_to(block_matrix, val, iels,
+                                                 mode='matrix',
+                                                 diff_var=svar,
+                                                 offsets=offsets)
+                        if extra is not None: extras.append(extra)
+
+        stamp_matrix(block_matrix)
+
+        out = block_matrix
+        for extra in extras:
+            out = out + extra
+
+        return out
+
+    def eval_tangent_operator(self, state, names=None):
+        """
+        Evaluate the tangent matrix in the matrix-free form.
+
+        The global sparse matrix is not assembled. The terms based on
+        :class:`ETermBase <sfepy.terms.terms_multilinear.ETermBase>` are
+        applied using their einsum expressions, only the cell matrices of
+        other terms are evaluated.
+
+        Parameters
+        ----------
+        state : array
+            The vector of DOF values. Note that it is needed only in
+            nonlinear terms.
+        names : list of str, optional
+            Optionally, select only equations with the given `names`.
+
+        Returns
+        -------
+        out : ElementMatrixOperator instance
+            The tangent matrix operator.
+        """
+        self.set_variables_from_state(state)
+
+        shape = self.variables.get_matrix_shape()
+        dtype = self.variables.dtype
+
+        eqs = self if names is None else [self[name] for name in names]
+        blocks = []
+        extras = []
+        for eq in eqs:
+            for term in eq.terms:
+                svars = term.get_state_variables(unknown_only=True)
+
+                for svar in svars:
+                    if isinstance(term, ETermBase):
+                        rdc, cdc = term.get_assembling_dof_conns(svar)
+                        sign = (term.sign
+                                * term.get_assembling_sign(svar))
+                        vvar = term.get_virtual_variable()
+                        iels = term.get_assembling_cells(
+                            term.get_data_shape(vvar)
+                        )
+                        matvec = term.get_matvec_function(svar.name)
+                        blocks.append((matvec, iels, rdc, cdc, sign))
+                        continue
+
+                    val, iels, status = term.evaluate(mode='weak',
+                                                      diff_var=svar.name,
+                                                      standalone=False,
+                                                      ret_status=True)
+                    if isinstance(val, tuple):
+                        # Dynamic connectivity - get the extra COO matrix.
+                        empty = sp.csr_matrix(shape, dtype=dtype)
+                        extra = term.assemble_to(empty, val, iels,
+                                                 mode='matrix', diff_var=svar)
+                        extras.append(extra.tocsr())
+
+                    else:
+                        rdc, cdc = term.get_assembling_dof_conns(svar)
+                        sign = term.get_assembling_sign(svar)
+                        blocks.append((val, iels, rdc, cdc, sign))
+
+        return ElementMatrixOperator(shape, dtype, blocks, extras=extras)
+
 class Equation(Struct):
 
     @staticmethod
@@ -856,11 +1190,10 @@ class Equation(Struct):
             if dw_mode == 'vector':
 
                 for term in self.terms:
-                    val, iels, status = term.evaluate(mode=mode,
-                                                      term_mode=term_mode,
-                                                      standalone=False,
-                                                      ret_status=True)
-                    term.assemble_to(asm_obj, val, iels, mode=dw_mode)
+                    for val, iels, status in term.iter_evaluate(
+                            mode=mode, term_mode=term_mode,
+                    ):
+                        term.assemble_to(asm_obj, val, iels, mode=dw_mode)
 
                 out = asm_obj
 
@@ -871,14 +1204,17 @@ class Equation(Struct):
                     svars = term.get_state_variables(unknown_only=True)
 
                     for svar in svars:
-                        val, iels, status = term.evaluate(mode=mode,
-                                                          term_mode=term_mode,
-                                                          diff_var=svar.name,
-                                                          standalone=False,
-                                                          ret_status=True)
-                        extra = term.assemble_to(asm_obj, val, iels,
-                                                 mode=dw_mode, diff_var=svar)
-                        if extra is not None: extras.append(extra)
+                        for val, iels, status in term.iter_evaluate(
+                                mode=mode, term_mode=term_mode,
+                                diff_var=svar.name,
+                        ):
+                            extra = term.assemble_to(asm_obj, val, iels,
+                                                     mode=dw_mode,
+                                                     diff_var=svar)
+                            if extra is not None: extras.append(extra)
+
+                # Let the linear solvers know that the data changed.
+                stamp_matrix(asm_obj)
 
                 out = (asm_obj, extras) if len(extras) else asm_obj
 
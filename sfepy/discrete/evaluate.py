@@ -86,6 +86,9 @@ class Evaluator(Struct):
         return vec_r
 
     def eval_tangent_matrix(self, vec, mtx=None, is_full=False):
+        if self.problem.conf.options.get('matrix_free', False):
+            return self.eval_tangent_operator(vec, is_full=is_full)
+
         if isinstance(vec, basestr) and vec == 'linear':
             return get_default(mtx, self.problem.mtx_a)
 
@@ -117,6 +120,43 @@ class Evaluator(Struct):
 
         return mtx
 
+    def eval_tangent_operator(self, vec, is_full=False):
+        """
+        Evaluate the tangent matrix in the matrix-free form of a
+        :class:`LinearOperator <scipy.sparse.linalg.LinearOperator>`, that
+        applies the cell matrices, see
+        :func:`Equations.eval_tangent_operator()
+        <sfepy.discrete.equations.Equations.eval_tangent_operator()>`.
+
+        Requires the problem with `active_only` set to True. The matrix
+        hooks are not applied.
+        """
+        from scipy.sparse.linalg import aslinearoperator
+
+        pb = self.problem
+        if not pb.active_only:
+            raise ValueError('matrix-free mode requires active_only=True!')
+
+        if isinstance(vec, basestr) and vec == 'linear':
+            op = getattr(self, 'linear_operator', None)
+            if op is not None:
+                return op
+
+            vec = pb.equations.create_stripped_state_vector()
+
+        if not is_full:
+            vec = self.make_full_vec(vec)
+
+        op = pb.equations.eval_tangent_operator(vec)
+
+        if pb.equations.variables.has_lcbc:
+            mtx_lcbc = aslinearoperator(pb.equations.get_lcbc_operator())
+            op = mtx_lcbc.T * op * mtx_lcbc
+
+        self.linear_operator = op
+
+        return op
+
     def make_full_vec(self, vec):
         return self.problem.equations.make_full_vec(vec)
 
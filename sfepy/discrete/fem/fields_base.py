@@ -43,6 +43,7 @@ def set_mesh_coors(domain, fields, coors, update_fields=False, actual=False,
         for field in six.itervalues(fields):
             field.set_coors(coors, extra_dofs=extra_dofs)
             field.clear_mappings(clear_all=clear_all)
+            field.clear_interpolation_operators()
 
 def eval_nodal_coors(coors, mesh_coors, region, poly_space, geom_poly_space,
                      econn, only_extra=True):
@@ -345,7 +345,7 @@ class Mesh(Struct):
         self.dims = [int(ii[0]) for ii in self.descs]
 
     def _set_io_data(self, coors, ngroups, conns, mat_ids, descs,
-                     nodal_bcs=None):
+                     nodal_bcs=None, copy=True):
         """
         Set mesh data.
 
@@ -364,6 +364,10 @@ class Mesh(Struct):
         nodal_bcs : dict of arrays, optional
             The nodes defining regions for boundary conditions referred
             to by the dict keys in problem description files.
+        copy : bool
+            If False, `coors` and the material ids of a single element group
+            are used by the mesh directly, if possible. This allows using
+            memory-mapped arrays without loading them.
         """
         ac = nm.ascontiguousarray
         coors = ac(coors, dtype=nm.float64)
@@ -375,10 +379,16 @@ class Mesh(Struct):
         self.nodal_bcs = get_default(nodal_bcs, {})
 
         from sfepy.discrete.common.extmods.cmesh import CMesh
+        if copy or (len(mat_ids) > 1):
+            mat_ids = nm.concatenate(mat_ids)
+
+        else:
+            mat_ids = mat_ids[0]
+
         self.cmesh = CMesh.from_data(coors, ac(ngroups),
                                      [ac(conn, dtype=nm.int32)
                                       for conn in conns],
-                                     ac(nm.concatenate(mat_ids)), descs)
+                                     ac(mat_ids), descs, copy=copy)
 
     def _get_io_data(self, cell_dim_only=None):
         """
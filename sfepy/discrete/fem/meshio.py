@@ -11,7 +11,7 @@ from sfepy.base.base import (complex_types, dict_from_keys_init,
                              insert_static_method, output, get_default,
                              get_default_attr, Struct, basestr)
 from sfepy.base.ioutils import (skip_read_line, look_ahead_line, read_token,
-                                read_array, pt, enc, dec,
+                                read_array, parse_array, pt, enc, dec,
                                 edit_filename,
                                 read_from_hdf5, write_to_hdf5,
                                 HDF5ContextManager, get_or_create_hdf5_group)
@@ -45,7 +45,11 @@ _supported_formats = {
     'ansys': ('ansys_cdb', '.cdb', 'r'),
     'hdf5': ('hdf5', '.h5', 'rwcv'),
     'hdf5-xdmf': ('hdf5-xdmf', '.h5x', 'rwcv'),
+    # The '*' keeps 'hdf5' as the reader of '.h5' files - it reads both
+    # layouts.
+    'hdf5-tm': ('hdf5-tm', '.h5', '*rw'),
     'xyz': ('xyz', '.xyz', 'rw'),
+    'mmap': ('mmap', '.smm', 'rwcv'),
     'comsol': ('comsol', '.txt', 'r'),
     'hmascii': ('hmascii', '.hmascii', 'r'),
     'gambit': ('gambit', '.neu', 'r'),
@@ -750,6 +754,93 @@ class HDF5MeshIO(MeshIO):
     else:
         _tr = string.maketrans(_rubbish, '_' * len(_rubbish))
 
+    # The write session, see open_session().
+    session = None
+
+    def open_session(self, flush_every=1):
+        """
+        Keep the results file open between calls of :func:`write()`, until
+        :func:`close_session()` is called. The file contents are flushed to
+        disk after each `flush_every` writes, so that the results saved so
+        far can be read by other processes. If `flush_every` is 0, the file
+        is flushed only when the session is closed.
+
+        The file cannot be read by the same process while the session is
+        open.
+        """
+        self.close_session()
+        self.session = Struct(filename=None, fd=None, nodes={},
+                              flush_every=flush_every, n_write=0)
+
+    def close_session(self):
+        """
+        Close the results file kept open by :func:`open_session()`.
+        """
+        if self.session is not None:
+            self._close_session_file()
+            self.session = None
+
+    @staticmethod
+    def _write_finished(fd):
+        from time import asctime
+
+        fd.remove_node(fd.root.tstat.finished)
+        fd.create_array(fd.root.tstat, 'finished', enc(asctime()),
+                        'file closing time')
+
+    def _close_session_file(self):
+        session = self.session
+        if session.fd is not None:
+            if session.fd.isopen:
+                self._write_finished(session.fd)
+                session.fd.close()
+
+            session.fd = session.filename = None
+            session.nodes = {}
+
+    def _open_file(self, filename):
+        """
+        Open an existing results file for appending, or return the file kept
+        open by the current session.
+        """
+        session = self.session
+        if session is None:
+            return pt.open_file(filename, mode='r+')
+
+        if (session.fd is not None) and (session.filename != filename):
+            self._close_session_file()
+
+        if session.fd is None:
+            session.fd = pt.open_file(filename, mode='r+')
+            session.filename = filename
+            session.nodes = {}
+
+        return session.fd
+
+    def _close_file(self, fd):
+        """
+        Close a file opened by :func:`_open_file()` or flush it according to
+        the current session settings.
+        """
+        session = self.session
+        if session is None:
+            self._write_finished(fd)
+            fd.close()
+            return
+
+        session.n_write += 1
+        if session.flush_every and not (session.n_write
+                                        % session.flush_every):
+            self._write_finished(fd)
+            fd.flush()
+
+    def _get_nodes(self):
+        """
+        Get the dict of node handles and attributes cached in the current
+        session.
+        """
+        return {} if self.session is None else self.session.nodes
+
     @staticmethod
     def read_mesh_from_hdf5(filename, group=None, mesh=None):
         """
@@ -1054,6 +1145,10 @@ class HDF5MeshIO(MeshIO):
         step = get_default_attr(ts, 'step', 0)
         if (step == 0) or not op.exists(filename):
             # A new file.
+            if ((self.session is not None)
+                and (self.session.filename == filename)):
+                self._close_session_file()
+
             with pt.open_file(filename, mode="w",
                               title="SfePy output file") as fd:
                 mesh_group = fd.create_group('/', 'mesh', 'mesh')
@@ -1084,7 +1179,7 @@ class HDF5MeshIO(MeshIO):
                 step, time, nt = ts.step, ts.time, ts.nt
 
             # Existing file.
-            fd = pt.open_file(filename, mode="r+")
+            fd = self._open_file(filename)
 
             step_group_name = 'step%d' % step
             if step_group_name in fd.root:
@@ -1141,10 +1236,7 @@ class HDF5MeshIO(MeshIO):
             step_group._v_attrs.name_dict = name_dict
             fd.root.last_step[0] = step
 
-            fd.remove_node(fd.root.tstat.finished)
-            fd.create_array(fd.root.tstat, 'finished', enc(asctime()),
-                            'file closing time')
-            fd.close()
+            self._close_file(fd)
 
         if xdmf:
             self.write_xdmf_file(filename, **kwargs)
@@ -1194,6 +1286,15 @@ class HDF5MeshIO(MeshIO):
         filename = get_default(filename, self.filename)
         fd = pt.open_file(filename, mode='r')
 
+        if self._is_time_major(fd):
+            steps_group = fd.root.steps
+            steps = steps_group.step.read().astype(nm.int32)
+            times = steps_group.t.read().astype(nm.float64)
+            nts = steps_group.nt.read().astype(nm.float64)
+            fd.close()
+
+            return steps, times, nts
+
         steps = []
         times = []
         nts = []
@@ -1211,6 +1312,69 @@ class HDF5MeshIO(MeshIO):
 
         return steps, times, nts
 
+    @staticmethod
+    def _is_time_major(fd):
+        """
+        Return True, if the data in the open file `fd` are stored in the
+        time-major layout, see :class:`HDF5TimeMajorMeshIO`.
+        """
+        return getattr(fd.root._v_attrs, 'layout', None) == 'time_major'
+
+    def _get_step_index(self, fd, step):
+        """
+        Get the index of `step` in the time-major layout data arrays. If `step`
+        is None, the first saved step is used.
+        """
+        if step is None:
+            return 0
+
+        ii = nm.where(fd.root.steps.step.read() == step)[0]
+        if not len(ii):
+            output('step %d data not found - premature end of file?' % step)
+            return None
+
+        return ii[0]
+
+    def _read_data_group(self, data_group, ii=None):
+        """
+        Read the data stored in `data_group`. If `ii` is given, the data are
+        in the time-major layout and the `ii`-th saved step is read.
+        """
+        mode = dec(data_group.mode.read())
+        name = dec(data_group.name.read())
+        data = data_group.data.read() if ii is None else data_group.data[ii]
+        dofs = tuple([dec(ic) for ic in data_group.dofs.read()])
+        try:
+            shape = tuple(int(ic) for ic in data_group.shape.read())
+
+        except pt.exceptions.NoSuchNodeError:
+            shape = data.shape
+
+        if mode == 'full':
+            field_name = dec(data_group.field_name.read())
+
+        else:
+            field_name = None
+
+        out = Struct(name=name, mode=mode, data=data,
+                     dofs=dofs, shape=shape, field_name=field_name)
+
+        if out.dofs == (-1,):
+            out.dofs = None
+
+        return out
+
+    def _read_time_major_data(self, fd, step):
+        ii = self._get_step_index(fd, step)
+        if ii is None: return None
+
+        out = {}
+        for data_group in fd.root.data:
+            key = dec(data_group.dname.read())
+            out[key] = self._read_data_group(data_group, ii)
+
+        return out
+
     def _get_step_group(self, step, filename=None):
         filename = get_default(filename, self.filename)
         fd = pt.open_file(filename, mode="r")
@@ -1229,6 +1393,11 @@ class HDF5MeshIO(MeshIO):
         return fd, step_group
 
     def read_data(self, step, filename=None, cache=None):
+        filename = get_default(filename, self.filename)
+        with pt.open_file(filename, mode='r') as fd:
+            if self._is_time_major(fd):
+                return self._read_time_major_data(fd, step)
+
         fd, step_group = self._get_step_group(step, filename=filename)
         if fd is None: return None
 
@@ -1245,32 +1414,22 @@ class HDF5MeshIO(MeshIO):
                out[key] = read_from_hdf5(fd, data_group.data, cache=cache)
                continue
 
-            name = dec(data_group.name.read())
-            data = data_group.data.read()
-            dofs = tuple([dec(ic) for ic in data_group.dofs.read()])
-            try:
-                shape = tuple(int(ii) for ii in data_group.shape.read())
-
-            except pt.exceptions.NoSuchNodeError:
-                shape = data.shape
-
-            if mode == 'full':
-                field_name = dec(data_group.field_name.read())
-
-            else:
-                field_name = None
-
-            out[key] = Struct(name=name, mode=mode, data=data,
-                              dofs=dofs, shape=shape, field_name=field_name)
-
-            if out[key].dofs == (-1,):
-                out[key].dofs = None
+            out[key] = self._read_data_group(data_group)
 
         fd.close()
 
         return out
 
     def read_data_header(self, dname, step=None, filename=None):
+        filename = get_default(filename, self.filename)
+        with pt.open_file(filename, mode='r') as fd:
+            if self._is_time_major(fd):
+                for name, data_group in six.iteritems(fd.root.data._v_groups):
+                    if dec(data_group.dname.read()) == dname:
+                        return dec(data_group.mode.read()), name
+
+                raise KeyError('non-existent data: %s' % dname)
+
         fd, step_group = self._get_step_group(step, filename=filename)
         if fd is None: return None
 
@@ -1295,12 +1454,19 @@ class HDF5MeshIO(MeshIO):
         fd = pt.open_file(filename, mode="r")
 
         th = dict_from_keys_init(indx, list)
-        for gr_name in self._get_step_group_names(fd):
-            step_group = fd.get_node(fd.root, gr_name)
-            data = step_group._f_get_child(node_name).data
-
+        if self._is_time_major(fd):
+            # A single slice per index.
+            data = fd.root.data._f_get_child(node_name).data
             for ii in indx:
-                th[ii].append(nm.array(data[ii]))
+                th[ii] = data[:, ii]
+
+        else:
+            for gr_name in self._get_step_group_names(fd):
+                step_group = fd.get_node(fd.root, gr_name)
+                data = step_group._f_get_child(node_name).data
+
+                for ii in indx:
+                    th[ii].append(nm.array(data[ii]))
 
         fd.close()
 
@@ -1320,6 +1486,16 @@ class HDF5MeshIO(MeshIO):
 
         ths = dict_from_keys_init(var_names, list)
 
+        if self._is_time_major(fd):
+            name_dict = fd.root.data._v_attrs.name_dict
+            for var_name in var_names:
+                data = fd.root.data._f_get_child(name_dict[var_name]).data
+                ths[var_name] = list(data.read())
+
+            fd.close()
+
+            return ths
+
         arr = nm.asarray
         for step in range(ts.n_step):
             gr_name = 'step%d' % step
@@ -1341,19 +1517,239 @@ class HDF5XdmfMeshIO(HDF5MeshIO):
         HDF5MeshIO.write(self, filename, mesh, out=out, ts=ts, cache=cache,
                          xdmf=True, **kwargs)
 
+    @staticmethod
+    def write_xdmf_index(filename, part_filenames):
+        """
+        Write the XDMF file `filename` that ties together the mesh parts
+        (e.g. partitions of a parallel run) saved in `part_filenames` by
+        :class:`HDF5XdmfMeshIO`: each time step is a spatial collection of
+        the part grids. Only the part XDMF files are read, the data stay in
+        the part HDF5 files.
+
+        The part files should be in the directory of `filename`, as their
+        data are referenced by relative paths.
+        """
+        import xml.etree.ElementTree as et
+        from xml.dom import minidom
+
+        parts = []
+        for part_filename in part_filenames:
+            xdmf_filename = op.splitext(part_filename)[0] + '.xdmf'
+            et_part = et.parse(xdmf_filename).getroot()
+            parts.append(et_part.find('Domain').find('Grid').findall('Grid'))
+
+        et_root = et.Element('Xdmf', attrib={'Version': '3.0'})
+        et_domain = et.SubElement(et_root, 'Domain')
+        et_ts = et.SubElement(et_domain, 'Grid',
+                              attrib={'Name': 'TimeSeries',
+                                      'GridType': 'Collection',
+                                      'CollectionType': 'Temporal'})
+
+        n_step = min(len(grids) for grids in parts) if len(parts) else 0
+        for ii in range(n_step):
+            et_time = parts[0][ii].find('Time')
+            et_step = et.SubElement(et_ts, 'Grid',
+                                    attrib={'Name': 'step%s'
+                                            % et_time.get('Value'),
+                                            'GridType': 'Collection',
+                                            'CollectionType': 'Spatial'})
+            et_step.append(et_time)
+
+            for ip, grids in enumerate(parts):
+                et_grid = et.SubElement(et_step, 'Grid',
+                                        attrib={'Name': 'part%d' % ip,
+                                                'GridType': 'Uniform'})
+                et_grid.extend(item for item in grids[ii]
+                               if item.tag != 'Time')
+
+        out = minidom.parseString(et.tostring(et_root)).toprettyxml(indent="  ")
+        with open(filename, 'w') as f:
+            f.write(out[(out.find('\n') + 1):])
+
+
+class HDF5TimeMajorMeshIO(HDF5MeshIO):
+    """
+    HDF5 results file with the time-major layout: the data of each output
+    item are stored in a single extendible, chunked and compressed array
+    indexed by the saved step index, so that a time history of a node or a
+    cell can be read by a single slice. The saved steps, times and
+    normalized times are stored in the `/steps` group.
+
+    The files are read by :class:`HDF5MeshIO`, which supports both layouts.
+    The 'custom' mode data are not supported.
+    """
+    format = 'hdf5-tm'
+
+    # The number of time steps in a data chunk.
+    step_chunk = 16
+    # The approximate size of a data chunk in bytes.
+    chunk_size = 2**20
+    complib = 'zlib'
+    complevel = 4
+
+    def _get_chunkshape(self, shape, dtype, step_chunk):
+        row_size = max(int(nm.prod(shape[1:])) * nm.dtype(dtype).itemsize, 1)
+        n_row = max(min(shape[0], self.chunk_size // (step_chunk * row_size)),
+                    1)
+        return (step_chunk, n_row) + tuple(shape[1:])
+
+    def _create_data_group(self, fd, key, val, step_chunk, filters):
+        data = val.data
+        group_name = '__' + key.translate(self._tr)
+        data_group = fd.create_group(fd.root.data, group_name, '%s data' % key)
+        fd.create_array(data_group, 'dname', enc(key), 'data name')
+        fd.create_array(data_group, 'mode', enc(val.mode), 'mode')
+        name = val.get('name', 'output_data')
+        fd.create_array(data_group, 'name', enc(name), 'object name')
+
+        shape = val.get('shape', data.shape)
+        dofs = val.get('dofs', None)
+        if dofs is None:
+            dofs = [''] * nm.squeeze(shape)[-1]
+        var_name = val.get('var_name', '')
+
+        fd.create_earray(data_group, 'data', pt.Atom.from_dtype(data.dtype),
+                         (0,) + data.shape, 'data', filters=filters,
+                         chunkshape=self._get_chunkshape(data.shape,
+                                                         data.dtype,
+                                                         step_chunk))
+        fd.create_array(data_group, 'dofs', [enc(ic) for ic in dofs], 'dofs')
+        fd.create_array(data_group, 'shape', shape, 'shape')
+        fd.create_array(data_group, 'var_name',
+                        enc(var_name), 'object parent name')
+        if val.mode == 'full':
+            fd.create_array(data_group, 'field_name',
+                            enc(val.field_name), 'field name')
+
+        return group_name
+
+    def write(self, filename, mesh, out=None, ts=None, cache=None,
+              step_chunk=None, complevel=None, **kwargs):
+        """
+        Write the mesh and the output data `out` of the time step given by
+        `ts` to the file `filename`. The file is created in the step 0.
+
+        Parameters
+        ----------
+        step_chunk : int, optional
+            The number of time steps in a data chunk. Used only when the
+            data arrays are created.
+        complevel : int, optional
+            The compression level (0-9). Used only when the data arrays are
+            created.
+        """
+        step_chunk = get_default(step_chunk, self.step_chunk)
+        complevel = get_default(complevel, self.complevel)
+
+        step = get_default_attr(ts, 'step', 0)
+        if (step == 0) or not op.exists(filename):
+            HDF5MeshIO.write(self, filename, mesh, out=None, ts=ts)
+            fd = self._open_file(filename)
+            fd.root._v_attrs.layout = 'time_major'
+
+            steps_group = fd.create_group('/', 'steps', 'saved steps')
+            fd.create_earray(steps_group, 'step', pt.Int32Atom(), (0,),
+                             'step')
+            fd.create_earray(steps_group, 't', pt.Float64Atom(), (0,),
+                             'time')
+            fd.create_earray(steps_group, 'nt', pt.Float64Atom(), (0,),
+                             'normalized time')
+
+            data_root = fd.create_group('/', 'data', 'time-major data')
+            data_root._v_attrs.name_dict = {}
+
+        else:
+            fd = self._open_file(filename)
+
+        try:
+            if out is not None:
+                self._append_step(fd, filename, out, ts, step_chunk,
+                                  complevel)
+
+        finally:
+            self._close_file(fd)
+
+    def _append_step(self, fd, filename, out, ts, step_chunk, complevel):
+        if ts is None:
+            step, time, nt  = 0, 0.0, 0.0
+        else:
+            step, time, nt = ts.step, ts.time, ts.nt
+
+        # The node handles and name_dict are reused within a session.
+        nodes = self._get_nodes()
+        if 'name_dict' not in nodes:
+            nodes['steps'] = fd.root.steps
+            nodes['data_root'] = fd.root.data
+            nodes['name_dict'] = nodes['data_root']._v_attrs.name_dict
+            nodes['data'] = {}
+
+        steps_group = nodes['steps']
+        data_root = nodes['data_root']
+        name_dict = nodes['name_dict']
+        datas = nodes['data']
+
+        n_saved = steps_group.step.nrows
+        if n_saved and (step <= steps_group.step[-1]):
+            raise ValueError('step %d is already saved in "%s" file!'
+                             ' Possible help: remove the old file or'
+                             ' start saving from the initial time.'
+                             % (step, filename))
+
+        if n_saved and (set(out.keys()) != set(name_dict.keys())):
+            raise ValueError('output data keys cannot change in the'
+                             ' time-major layout! (%s != %s)'
+                             % (sorted(out.keys()),
+                                sorted(name_dict.keys())))
+
+        filters = pt.Filters(complevel=complevel, complib=self.complib)
+        new_keys = False
+        for key, val in six.iteritems(out):
+            if val.mode == 'custom':
+                raise ValueError('custom data "%s" cannot be saved in the'
+                                 ' time-major layout!' % key)
+
+            if key not in name_dict:
+                name_dict[key] = self._create_data_group(fd, key, val,
+                                                         step_chunk,
+                                                         filters)
+                new_keys = True
+
+            data = datas.get(key)
+            if data is None:
+                data = data_root._f_get_child(name_dict[key]).data
+                datas[key] = data
+
+            if data.shape[1:] != val.data.shape:
+                raise ValueError('wrong shape of data "%s"! (%s != %s)'
+                                 % (key, val.data.shape, data.shape[1:]))
+
+            data.append(val.data[None, ...])
+
+        steps_group.step.append(nm.array([step], dtype=nm.int32))
+        steps_group.t.append(nm.array([time], dtype=nm.float64))
+        steps_group.nt.append(nm.array([nt], dtype=nm.float64))
+
+        if new_keys:
+            data_root._v_attrs.name_dict = name_dict
+
+        fd.root.last_step[0] = step
+
 
 class Mesh3DMeshIO(MeshIO):
     format = "mesh3d"
 
     def read(self, mesh, **kwargs):
-        f = open(self.filename)
+        with open(self.filename) as fd:
+            lines = self._read_lines(fd)
+
         # read the whole file:
-        vertices = self._read_section(f, integer=False)
-        tetras = self._read_section(f)
-        hexes = self._read_section(f)
-        prisms = self._read_section(f)
-        tris = self._read_section(f)
-        quads = self._read_section(f)
+        ii = 0
+        vertices, ii = self._read_section(lines, ii, integer=False)
+        tetras, ii = self._read_section(lines, ii)
+        hexes, ii = self._read_section(lines, ii)
+        prisms, ii = self._read_section(lines, ii)
+        tris, ii = self._read_section(lines, ii)
+        quads, ii = self._read_section(lines, ii)
 
         # substract 1 from all elements, because we count from 0:
         conns = []
@@ -1373,21 +1769,21 @@ class Mesh3DMeshIO(MeshIO):
     def read_dimension(self):
         return 3
 
-    def _read_line(self, f):
+    def _read_lines(self, fd):
         """
-        Reads one non empty line (if it's a comment, it skips it).
+        Reads all non empty lines (skipping comments).
         """
-        l = f.readline().strip()
-        while l == "" or l[0] == "#": # comment or an empty line
-            l = f.readline().strip()
-        return l
+        return [l for l in fd.read().splitlines()
+                if l.strip() and (l.lstrip()[0] != "#")]
 
-    def _read_section(self, f, integer=True):
+    def _read_section(self, lines, ii, integer=True):
         """
-        Reads one section from the mesh3d file.
+        Reads one section from the mesh3d file lines, starting at the line
+        `ii`. Returns the section array and the index of the line after the
+        section.
 
-        integer ... if True, all numbers are passed to int(), otherwise to
-            float(), before returning
+        integer ... if True, all numbers are converted to int, otherwise to
+            float, before returning
 
         Some examples how a section can look like:
 
@@ -1413,14 +1809,18 @@ class Mesh3DMeshIO(MeshIO):
             dtype=int
         else:
             dtype=float
-        l = self._read_line(f)
-        N = int(l)
-        rows = []
-        for i in range(N):
-            l = self._read_line(f)
-            row = nm.fromstring(l, sep=" ", dtype=dtype)
-            rows.append(row)
-        return nm.array(rows)
+        N = int(lines[ii])
+        rows = lines[ii + 1 : ii + 1 + N]
+        if N:
+            val = parse_array(rows, dtype=dtype)
+            if val.shape[0] != N:
+                raise ValueError('wrong mesh3d section size! (%d == %d)'
+                                 % (val.shape[0], N))
+
+        else:
+            val = nm.array([], dtype=dtype)
+
+        return val, ii + 1 + N
 
 def mesh_from_groups(mesh, ids, coors, ngroups,
                      tris, mat_tris, quads, mat_quads,
@@ -1455,55 +1855,69 @@ def mesh_from_groups(mesh, ids, coors, ngroups,
 class HypermeshAsciiMeshIO(MeshIO):
     format = 'hmascii'
 
+    @staticmethod
+    def _get_pattern(keyword, n_skip, n_field):
+        """
+        Get a regular expression matching the `keyword` lines and capturing
+        `n_field` comma-separated fields after the first `n_skip` ones.
+        """
+        import re
+
+        field = r'\s*([^,\s)]+)\s*'
+        pattern = (r'^\*%s\(' % keyword + r'[^,]*,' * n_skip
+                   + ','.join([field] * n_field))
+        return re.compile(pattern, re.M)
+
+    @staticmethod
+    def _convert(fields, n_field, dtype):
+        if not len(fields):
+            return nm.zeros((0, n_field), dtype=dtype)
+
+        return nm.array(fields).astype(dtype)
+
     def read(self, mesh, **kwargs):
-        fd = open(self.filename, 'r')
+        import re
 
-        ids = []
-        coors = []
-        tetras = []
-        mat_tetras = []
-        hexas = []
-        mat_hexas = []
-        quads = []
-        mat_quads = []
-        trias = []
-        mat_trias = []
+        with open(self.filename, 'r') as fd:
+            text = fd.read()
+
+        node_pattern = self._get_pattern('node', 0, 4)
+        el_patterns = {
+            'tetra4' : (self._get_pattern('tetra4', 2, 4), 4),
+            'hexa8' : (self._get_pattern('hexa8', 2, 8), 8),
+            'quad4' : (self._get_pattern('quad4', 2, 4), 4),
+            'tria3' : (self._get_pattern('tria3', 2, 3), 3),
+        }
+
+        # The text is split by the components, that define the cell groups.
+        chunks = re.split(r'^\*component\(', text, flags=re.M)
+
+        nodes = []
+        els = {key : [] for key in el_patterns.keys()}
+        mat_els = {key : [] for key in el_patterns.keys()}
         mat_id = 0
+        for ic, chunk in enumerate(chunks):
+            if ic > 0:
+                mat_id = int(re.split(r'[,)]', chunk, 1)[0])
 
-        for line in fd:
-            if line and (line[0] == '*'):
-                if line[1:10] == 'component':
-                    line = line.strip()[11:-1].split(',')
-                    mat_id = int(line[0])
-                if line[1:5] == 'node':
-                    line = line.strip()[6:-1].split(',')
-                    ids.append(int(line[0]))
-                    coors.append([float(coor) for coor in line[1:4]])
-
-                elif line[1:7] == 'tetra4':
-                    line = line.strip()[8:-1].split(',')
-                    mat_tetras.append(mat_id)
-                    tetras.append([int(ic) for ic in line[2:6]])
-
-                elif line[1:6] == 'hexa8':
-                    line = line.strip()[7:-1].split(',')
-                    mat_hexas.append(mat_id)
-                    hexas.append([int(ic) for ic in line[2:10]])
-
-                elif line[1:6] == 'quad4':
-                    line = line.strip()[7:-1].split(',')
-                    mat_quads.append(mat_id)
-                    quads.append([int(ic) for ic in line[2:6]])
-
-                elif line[1:6] == 'tria3':
-                    line = line.strip()[7:-1].split(',')
-                    mat_trias.append(mat_id)
-                    trias.append([int(ic) for ic in line[2:5]])
-        fd.close()
+            nodes.extend(node_pattern.findall(chunk))
+            for key, (pattern, n_field) in six.iteritems(el_patterns):
+                aux = pattern.findall(chunk)
+                els[key].extend(aux)
+                mat_els[key].extend([mat_id] * len(aux))
+
+        nodes = self._convert(nodes, 4, nm.float64)
+        ids = nodes[:, 0].astype(nm.int32)
+        coors = nodes[:, 1:]
+
+        conns = {key : self._convert(els[key], n_field, nm.int32)
+                 for key, (pattern, n_field) in six.iteritems(el_patterns)}
 
         mesh = mesh_from_groups(mesh, ids, coors, None,
-                                trias, mat_trias, quads, mat_quads,
-                                tetras, mat_tetras, hexas, mat_hexas)
+                                conns['tria3'], mat_els['tria3'],
+                                conns['quad4'], mat_els['quad4'],
+                                conns['tetra4'], mat_els['tetra4'],
+                                conns['hexa8'], mat_els['hexa8'])
 
         return mesh
 
@@ -1537,9 +1951,62 @@ class NEUMeshIO(MeshIO):
             fd.close()
             return dim
 
-    def read(self, mesh, **kwargs):
+    @staticmethod
+    def _next_line(text, pos):
+        """
+        Return the line starting at `pos` and the position of the next line.
+        """
+        eol = text.find('\n', pos)
+        if eol < 0:
+            eol = len(text)
+
+        return text[pos:eol], eol + 1
+
+    @staticmethod
+    def _read_section(text, pos):
+        """
+        Return the text from `pos` to the end of section and the position of
+        the line after the end of section.
+        """
+        end = text.find('ENDOFSECTION', pos)
+        if end < 0:
+            raise ValueError('missing ENDOFSECTION!')
+
+        eol = text.find('\n', end)
+        return text[pos:end], (len(text) if eol < 0 else eol + 1)
+
+    @staticmethod
+    def _split_element_records(stream):
+        """
+        Split the integer stream of element records (element id, type,
+        number of nodes, nodes) into blocks of records with the same type and
+        number of nodes. A record may span several lines.
+        """
+        ii = 0
+        while ii < len(stream):
+            if (len(stream) - ii) < 3:
+                raise ValueError('incomplete element record! (%s)'
+                                 % stream[ii:])
+
+            gtype, n_ep = stream[ii + 1], stream[ii + 2]
+            size = 3 + n_ep
+            n_rec = (len(stream) - ii) // size
+            if n_rec == 0:
+                raise ValueError('incomplete element record! (%s)'
+                                 % stream[ii:])
+
+            recs = stream[ii : ii + n_rec * size].reshape((n_rec, size))
 
+            # Records are aligned until the first type or size change.
+            same = (recs[:, 1] == gtype) & (recs[:, 2] == n_ep)
+            n_rec = n_rec if same.all() else same.argmin()
+
+            yield gtype, recs[:n_rec]
+            ii += n_rec * size
+
+    def read(self, mesh, **kwargs):
         el = {'3_8' : [], '3_4' : [], '2_4' : [], '2_3' : []}
+        gtypes = {6 : '3_4', 4 : '3_8', 3 : '2_3', 2 : '2_4'}
         nod = []
 
         conns_in = []
@@ -1550,57 +2017,43 @@ class NEUMeshIO(MeshIO):
         groups = []
         nodal_bcs = {}
 
-        fd = open(self.filename, 'r')
+        with open(self.filename, 'r') as fd:
+            text = fd.read()
 
-        row = fd.readline()
-        while 1:
-            if not row: break
+        pos = 0
+        while pos < len(text):
+            row, pos = self._next_line(text, pos)
             row = row.split()
 
             if len(row) == 0:
-                row = fd.readline()
                 continue
 
             if (row[0] == 'NUMNP'):
-                row = fd.readline().split()
+                row, pos = self._next_line(text, pos)
+                row = row.split()
                 n_nod, n_el, dim = int(row[0]), int(row[1]), int(row[4])
 
             elif (row[0] == 'NODAL'):
-                row = fd.readline().split()
-                while not(row[0] == 'ENDOFSECTION'):
-                    nod.append(row[1:])
-                    row = fd.readline().split()
+                block, pos = self._read_section(text, pos)
+                nod = parse_array(block, dtype=nm.float64)[:, 1:]
 
             elif (row[0] == 'ELEMENTS/CELLS'):
-                row = fd.readline().split()
-                while not(row[0] == 'ENDOFSECTION'):
-                    elid = [row[0]]
-                    gtype = int(row[1])
-                    if gtype == 6:
-                        el['3_4'].append(row[3:]+elid)
-                    elif gtype == 4:
-                        rr = row[3:]
-                        if (len(rr) < 8):
-                            rr.extend(fd.readline().split())
-                        el['3_8'].append(rr+elid)
-                    elif gtype == 3:
-                        el['2_3'].append(row[3:]+elid)
-                    elif gtype == 2:
-                        el['2_4'].append(row[3:]+elid)
-                    row = fd.readline().split()
+                block, pos = self._read_section(text, pos)
+                stream = nm.fromstring(block, dtype=nm.int64, sep=' ')
+                for gtype, recs in self._split_element_records(stream):
+                    if gtype in gtypes:
+                        el[gtypes[gtype]].append(nm.c_[recs[:, 3:],
+                                                       recs[:, :1]])
 
             elif (row[0] == 'GROUP:'):
-                group_ids.append(row[1])
+                group_ids.append(int(row[1]))
                 g_n_el = int(row[3])
                 group_n_els.append(g_n_el)
-                name = fd.readline().strip()
+                name, pos = self._next_line(text, pos)
+                _, pos = self._next_line(text, pos) # Solver flags.
 
-                els = []
-                row = fd.readline().split()
-                row = fd.readline().split()
-                while not(row[0] == 'ENDOFSECTION'):
-                    els.extend(row)
-                    row = fd.readline().split()
+                block, pos = self._read_section(text, pos)
+                els = nm.fromstring(block, dtype=nm.int64, sep=' ')
                 if g_n_el != len(els):
                     msg = 'wrong number of group elements! (%d == %d)'\
                           % (n_el, len(els))
@@ -1608,19 +2061,17 @@ class NEUMeshIO(MeshIO):
                 groups.append(els)
 
             elif (row[0] == 'BOUNDARY'):
-                row = fd.readline().split()
+                row, pos = self._next_line(text, pos)
+                row = row.split()
                 key = row[0]
                 num = int(row[2])
-                inod = read_array(fd, num, None, nm.int32) - 1
+                block, pos = self._read_section(text, pos)
+                inod = parse_array(block, dtype=nm.int32) - 1
+                if inod.shape[0] != num:
+                    raise ValueError('wrong number of boundary nodes!'
+                                     ' (%d == %d)' % (num, inod.shape[0]))
                 nodal_bcs[key] = inod.squeeze()
 
-                row = fd.readline().split()
-                assert_(row[0] == 'ENDOFSECTION')
-
-            row = fd.readline()
-
-        fd.close()
-
         if int(n_el) != sum(group_n_els):
             print('wrong total number of group elements! (%d == %d)'\
                   % (int(n_el), len(group_n_els)))
@@ -1632,7 +2083,7 @@ class NEUMeshIO(MeshIO):
 
         for elem in el.keys():
             if len(el[elem]) > 0:
-                els = nm.array(el[elem], dtype=nm.int32)
+                els = nm.concatenate(el[elem]).astype(nm.int32)
                 els[:, :-1] -= 1
                 els[:, -1] = mat_ids[els[:, -1]-1]
 
@@ -1701,6 +2152,29 @@ class ANSYSCDBMeshIO(MeshIO):
 
         return idx, dtype
 
+    @staticmethod
+    def parse_fixed(rows, idx, dtype):
+        """
+        Convert the fixed-width fields given by `idx` of `rows` to an array
+        of shape `(len(rows), len(idx))` of type `dtype`, column by column.
+        """
+        n_char = len(rows[0])
+        if any(len(row) != n_char for row in rows):
+            rows = [row.rstrip('\r\n') for row in rows]
+            n_char = max(len(row) for row in rows)
+            rows = [row.ljust(n_char) for row in rows]
+
+        chars = nm.frombuffer(''.join(rows).encode('latin-1'), dtype='S1')
+        chars = chars.reshape((len(rows), n_char))
+
+        out = nm.empty((len(rows), len(idx)), dtype=dtype)
+        for ii, (i0, i1) in enumerate(idx):
+            col = nm.ascontiguousarray(chars[:, i0:i1]).view('S%d' % (i1 - i0))
+            # Parse via floats to allow the integers with surrounding spaces.
+            out[:, ii] = col[:, 0].astype(nm.float64)
+
+        return out
+
     def write(self, filename, mesh, out=None, **kwargs):
         raise NotImplementedError
 
@@ -1737,17 +2211,20 @@ class ANSYSCDBMeshIO(MeshIO):
                 row = look_ahead_line(fd)
                 nchar = len(row)
                 idx, dtype = self.make_format(fmt, nchar)
-                ii0, ii1 = idx[0]
+                rows = []
                 while True:
                     row = fd.readline()
                     if ((row[0] == '!') or (row[:2] == '-1')
                         or len(row) != nchar):
                         break
 
-                    line = [float(row[i0:i1]) for i0, i1 in idx[ic:]]
+                    rows.append(row)
 
-                    ids.append(int(row[ii0:ii1]))
-                    coors.append(line)
+                if len(rows):
+                    vals = self.parse_fixed(rows, [idx[0]] + idx[ic:],
+                                            nm.float64)
+                    ids.append(vals[:, 0].astype(nm.int32))
+                    coors.append(vals[:, 1:])
 
             elif (kw == 'eblock'):
                 if (len(row) <= 2) or row[2].strip().lower() != 'solid':
@@ -1759,42 +2236,43 @@ class ANSYSCDBMeshIO(MeshIO):
                 nchar = len(row)
                 idx, dtype = self.make_format(fmt, nchar)
 
-                imi0, imi1 = idx[0] # Material id.
                 inn0, inn1 = idx[8] # Number of nodes in line.
-                ien0, ien1 = idx[10] # Element number.
                 ic0 = 11
+
+                # Only the numbers of nodes are parsed line by line, to
+                # find the continuation lines.
+                rows = {4 : [], 8 : [], 10 : [], 20 : []}
+                crows = {10 : [], 20 : []}
                 while True:
                     row = fd.readline()
                     if ((row[0] == '!') or (row[:2] == '-1')
                         or (len(row) != nchar)):
                         break
 
-                    line = [int(row[imi0:imi1])]
                     n_nod = int(row[inn0:inn1])
+                    if n_nod not in rows:
+                        raise ValueError('unsupported element type! (%d nodes)'
+                                         % n_nod)
 
-                    line.extend(int(row[i0:i1])
-                                for i0, i1 in idx[ic0 : ic0 + n_nod])
-                    if n_nod == 4:
-                        tetras.append(line)
-
-                    elif n_nod == 8:
-                        hexas.append(line)
+                    rows[n_nod].append(row)
+                    if n_nod in crows:
+                        crows[n_nod].append(fd.readline())
 
-                    elif n_nod == 10:
-                        row = fd.readline()
-                        line.extend(int(row[i0:i1])
-                                    for i0, i1 in idx[:2])
-                        qtetras.append(line)
+                # Material id and nodes.
+                for n_nod, els in [(4, tetras), (8, hexas),
+                                   (10, qtetras), (20, qhexas)]:
+                    if not len(rows[n_nod]): continue
 
-                    elif n_nod == 20:
-                        row = fd.readline()
-                        line.extend(int(row[i0:i1])
-                                    for i0, i1 in idx[:12])
-                        qhexas.append(line)
+                    vals = self.parse_fixed(rows[n_nod],
+                                            [idx[0]] + idx[ic0 : ic0 + n_nod],
+                                            nm.int32)
+                    if n_nod in crows:
+                        n_cnod = 2 if n_nod == 10 else 12
+                        cvals = self.parse_fixed(crows[n_nod], idx[:n_cnod],
+                                                 nm.int32)
+                        vals = nm.c_[vals, cvals]
 
-                    else:
-                        raise ValueError('unsupported element type! (%d nodes)'
-                                         % n_nod)
+                    els.append(vals)
 
             elif kw == 'cmblock':
                 if row[2].lower() != 'node': # Only node sets support.
@@ -1808,9 +2286,19 @@ class ANSYSCDBMeshIO(MeshIO):
 
         fd.close()
 
-        coors = nm.array(coors, dtype=nm.float64)
+        def _stack(blocks, n_col, dtype):
+            if len(blocks):
+                return nm.concatenate(blocks).astype(dtype)
+
+            else:
+                return nm.zeros((0, n_col), dtype=dtype)
+
+        ids = _stack(ids, 0, nm.int32).ravel()
+        coors = _stack(coors, 3, nm.float64)
+        qtetras = _stack(qtetras, 11, nm.int32)
+        qhexas = _stack(qhexas, 21, nm.int32)
 
-        tetras = nm.array(tetras, dtype=nm.int32)
+        tetras = _stack(tetras, 5, nm.int32)
         if len(tetras):
             mat_ids_tetras = tetras[:, 0]
             tetras = tetras[:, 1:]
@@ -1819,7 +2307,7 @@ class ANSYSCDBMeshIO(MeshIO):
             tetras.shape = (0, 4)
             mat_ids_tetras = nm.array([])
 
-        hexas = nm.array(hexas, dtype=nm.int32)
+        hexas = _stack(hexas, 9, nm.int32)
         if len(hexas):
             mat_ids_hexas = hexas[:, 0]
             hexas = hexas[:, 1:]
@@ -2255,7 +2743,8 @@ class XYZMeshIO(MeshIO):
     format = 'xyz'
 
     def _read_coors(self):
-        coors = nm.loadtxt(self.filename, ndmin=2)
+        with open(self.filename, 'r') as fd:
+            coors = parse_array(fd.read(), dtype=nm.float64, comments='#')
         if (coors[:, -1] == 0).all():
             coors = coors[:, :-1].copy()
 
@@ -2294,8 +2783,8 @@ class XYZMeshIO(MeshIO):
         n_nod, dim = coors.shape
 
         conn_ext = '.IEN' if op.splitext(self.filename)[1].isupper() else '.ien'
-        conn = nm.loadtxt(edit_filename(self.filename, new_ext=conn_ext),
-                          dtype=nm.int32, ndmin=2) - 1
+        with open(edit_filename(self.filename, new_ext=conn_ext), 'r') as fd:
+            conn = parse_array(fd.read(), dtype=nm.int32, comments='#') - 1
         desc = '%d_%d' % (dim, conn.shape[1])
 
         mesh._set_io_data(coors, nm.zeros(n_nod, dtype=nm.int32),
@@ -2318,6 +2807,144 @@ class XYZMeshIO(MeshIO):
             raise NotImplementedError
 
 
+class MemmapMeshIO(MeshIO):
+    """
+    Native binary mesh format for large meshes. The mesh arrays are stored
+    in the raw form after a JSON header describing their dtypes, shapes and
+    offsets, so that they are memory-mapped by :class:`numpy.memmap` instead
+    of being parsed.
+
+    The arrays are mapped in the copy-on-write mode: the coordinates are
+    used by the mesh directly and loaded only as needed, and changing the
+    mesh never changes the file. The connectivities are copied once into
+    the memory of :class:`CMesh <sfepy.discrete.common.extmods.cmesh.CMesh>`.
+    """
+    format = 'mmap'
+
+    magic = b'SFEPYMM1'
+    # The alignment of the array offsets in bytes.
+    align = 64
+
+    def _get_data_offset(self, n_header):
+        n_bytes = len(self.magic) + 8 + n_header
+        return ((n_bytes + self.align - 1) // self.align) * self.align
+
+    def _read_header(self, filename=None):
+        import json
+
+        filename = get_default(filename, self.filename)
+        with open(filename, 'rb') as fd:
+            if fd.read(len(self.magic)) != self.magic:
+                raise ValueError('"%s" is not a %s mesh file!'
+                                 % (filename, self.format))
+
+            n_header = int(nm.frombuffer(fd.read(8), dtype='<u8')[0])
+            header = json.loads(fd.read(n_header).decode('utf-8'))
+
+        header['data_offset'] = self._get_data_offset(n_header)
+        return header
+
+    def _map_array(self, header, name, filename=None):
+        filename = get_default(filename, self.filename)
+        info = header['arrays'][name]
+        dtype = nm.dtype(str(info['dtype']))
+        shape = tuple(info['shape'])
+        if not nm.prod(shape):
+            # Empty arrays cannot be mapped.
+            return nm.zeros(shape, dtype=dtype)
+
+        return nm.memmap(filename, dtype=dtype, mode='c', shape=shape,
+                         offset=header['data_offset'] + info['offset'])
+
+    def read_dimension(self, ret_fd=False):
+        header = self._read_header()
+        dim = header['arrays']['coors']['shape'][1]
+
+        if ret_fd:
+            fd = open(self.filename, 'rb')
+            return dim, fd
+
+        else:
+            return dim
+
+    def read_bounding_box(self, ret_fd=False, ret_dim=False):
+        header = self._read_header()
+        bbox = nm.array(header['bbox'], dtype=nm.float64)
+
+        if ret_fd: fd = open(self.filename, 'rb')
+        if ret_dim:
+            dim = bbox.shape[1]
+            if ret_fd:
+                return bbox, dim, fd
+            else:
+                return bbox, dim
+        else:
+            if ret_fd:
+                return bbox, fd
+            else:
+                return bbox
+
+    def read(self, mesh, omit_facets=False, **kwargs):
+        header = self._read_header()
+
+        coors = self._map_array(header, 'coors')
+        ngroups = self._map_array(header, 'ngroups')
+        dim = coors.shape[1]
+
+        conns, mat_ids, descs = [], [], []
+        for ig, desc in enumerate(header['descs']):
+            if omit_facets and (int(desc[0]) < dim): continue
+
+            conns.append(self._map_array(header, 'conn%d' % ig))
+            mat_ids.append(self._map_array(header, 'mat_id%d' % ig))
+            descs.append(str(desc))
+
+        mesh._set_io_data(coors, ngroups, conns, mat_ids, descs, copy=False)
+
+        return mesh
+
+    def write(self, filename, mesh, out=None, **kwargs):
+        import json
+
+        if out is not None:
+            raise NotImplementedError
+
+        coors, ngroups, conns, mat_ids, descs = mesh._get_io_data()
+
+        ac = nm.ascontiguousarray
+        arrays = [('coors', ac(coors, dtype=nm.float64)),
+                  ('ngroups', ac(ngroups, dtype=nm.int32))]
+        for ig, conn in enumerate(conns):
+            arrays.append(('conn%d' % ig, ac(conn, dtype=nm.int32)))
+            arrays.append(('mat_id%d' % ig, ac(mat_ids[ig], dtype=nm.int32)))
+
+        infos = {}
+        offset = 0
+        for name, arr in arrays:
+            infos[name] = {'dtype' : arr.dtype.str, 'shape' : arr.shape,
+                           'offset' : offset}
+            offset += arr.nbytes
+            offset = ((offset + self.align - 1) // self.align) * self.align
+
+        bbox = nm.vstack((nm.amin(coors, 0), nm.amax(coors, 0)))
+        header = {'version' : 1, 'descs' : list(descs),
+                  'bbox' : bbox.tolist(), 'arrays' : infos}
+        header = json.dumps(header).encode('utf-8')
+
+        data_offset = self._get_data_offset(len(header))
+        with open(filename, 'wb') as fd:
+            fd.write(self.magic)
+            fd.write(nm.array([len(header)], dtype='<u8').tobytes())
+            fd.write(header)
+
+            for name, arr in arrays:
+                fd.seek(data_offset + infos[name]['offset'])
+                arr.tofile(fd)
+
+            # Pad the last array.
+            fd.truncate(data_offset + offset)
+
+
 var_dict = list(vars().items())
 io_table = {}
 
@@ -176,3 +176,122 @@ class ConstantFunctionByRegion(Function):
 
         Function.__init__(self, name=name, function=get_constants,
                           is_constant=True)
+
+class BatchedMaterialFunction(Function):
+    """
+    Material function evaluated on whole arrays of quadrature point data.
+
+    Instead of computing the quadrature point data by itself, the user
+    function declares its inputs and outputs and is called once per
+    material data key (term region and integral) as::
+
+        function(ts, coors, inputs, outputs, history, **kwargs)
+
+    where:
+
+    - `coors` is the `(n_cell, n_qp, dim)` array of physical quadrature point
+      coordinates,
+    - `inputs` is a dict of `(n_cell, n_qp, n_row, n_col)` arrays of the
+      declared variable values evaluated by
+      :func:`FieldVariable.evaluate()
+      <sfepy.discrete.variables.FieldVariable.evaluate()>`,
+    - `outputs` is a dict of preallocated `(n_cell, n_qp, n_row, n_col)`
+      buffers, that the function has to fill in place,
+    - `history` is a dict persistent between calls for the given data key,
+      that can hold history variables,
+    - `kwargs` contain `mode`, `equations`, `term`, `problem` and the extra
+      arguments.
+
+    The buffers are reused in subsequent calls with the same key.
+
+    Parameters
+    ----------
+    name : str
+        The function name.
+    function : callable
+        The user function.
+    inputs : dict, optional
+        The inputs as `{input_name : (variable_name, mode)}` or `{input_name
+        : (variable_name, mode, step)}`, where `mode` is one of the
+        :func:`FieldVariable.evaluate()
+        <sfepy.discrete.variables.FieldVariable.evaluate()>` modes.
+    outputs : dict
+        The outputs as `{parameter_name : (n_row, n_col)}`.
+    dtype : numpy.dtype
+        The data type of the output buffers.
+    extra_args : dict, optional
+        The extra arguments passed to `function`.
+    """
+
+    def __init__(self, name, function, inputs=None, outputs=None,
+                 dtype=nm.float64, extra_args=None):
+        Function.__init__(self, name=name, function=function,
+                          is_constant=False, extra_args=extra_args)
+        self.inputs = inputs if inputs is not None else {}
+        self.outputs = outputs if outputs is not None else {}
+        self.dtype = dtype
+
+        self.buffers = {}
+        self.histories = {}
+
+    def get_buffers(self, key, n_cell, n_qp):
+        """
+        Get the output buffers for the data `key`, (re)allocating them if
+        needed.
+        """
+        buffers = self.buffers.setdefault(key, {})
+        for name, shape in six.iteritems(self.outputs):
+            bshape = (n_cell, n_qp) + tuple(shape)
+            buf = buffers.get(name)
+            if (buf is None) or (buf.shape != bshape):
+                buffers[name] = nm.empty(bshape, dtype=self.dtype)
+
+        return buffers
+
+    def evaluate_inputs(self, term, equations=None, problem=None):
+        """
+        Evaluate the declared inputs in the quadrature points of `term`.
+        """
+        if equations is not None:
+            variables = equations.variables
+
+        else:
+            variables = problem.get_variables()
+
+        inputs = {}
+        for name, spec in six.iteritems(self.inputs):
+            var_name, mode = spec[:2]
+            step = spec[2] if len(spec) > 2 else 0
+
+            var = variables[var_name]
+            inputs[name] = var.evaluate(mode=mode, region=term.region,
+                                        integral=term.integral,
+                                        integration=term.integration,
+                                        step=step)
+
+        return inputs
+
+    def __call__(self, ts, coors, mode=None, equations=None, term=None,
+                 problem=None, **kwargs):
+        if mode != 'qp':
+            return None
+
+        qps = term.get_physical_qps()
+        assert_(qps.num == coors.shape[0])
+        n_cell, n_qp = qps.shape[:2]
+
+        key = term.get_qp_key()
+        outputs = self.get_buffers(key, n_cell, n_qp)
+        inputs = self.evaluate_inputs(term, equations=equations,
+                                      problem=problem)
+        history = self.histories.setdefault(key, {})
+
+        _kwargs = dict(kwargs)
+        _kwargs.update(self.extra_args)
+        self.function(ts, coors.reshape((n_cell, n_qp, -1)), inputs, outputs,
+                      history, mode=mode, equations=equations, term=term,
+                      problem=problem, **_kwargs)
+
+        out = {name : buf.reshape((-1,) + buf.shape[2:])
+               for name, buf in six.iteritems(outputs)}
+        return out
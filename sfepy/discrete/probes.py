@@ -13,20 +13,29 @@ def write_results(filename, probe, results):
     """
     Write probing results into a file.
 
+    The results are written incrementally: each result is written (and
+    flushed) as soon as it is available, so that `results` can be a generator
+    producing, for example, the probed values in a series of time steps, see
+    :func:`Probe.probe_series()`.
+
     Parameters
     ----------
     filename : str or file object
         The output file name.
     probe : Probe subclass instance
         The probe used to obtain the results.
-    results : dict
-        The dictionary of probing results. Keys are data names, values are
-        the probed values.
+    results : dict or iterable
+        The dictionary of probing results, or an iterable of the (key, value)
+        pairs of probing results. Keys are data names, values are the
+        (parametrization, probed values) tuples.
     """
     fd = open(filename, 'w') if isinstance(filename, basestr) else filename
 
+    if isinstance(results, dict):
+        results = six.iteritems(results)
+
     fd.write('\n'.join(probe.report()) + '\n')
-    for key, result in six.iteritems(results):
+    for key, result in results:
         pars, vals = result
         fd.write('\n# %s %d\n' % (key, vals.shape[-1]))
 
@@ -37,6 +46,7 @@ def write_results(filename, probe, results):
             aux = nm.hstack((pars[:,None], vals))
 
         nm.savetxt(fd, aux)
+        fd.flush()
 
     if isinstance(filename, basestr):
         fd.close()
@@ -294,9 +304,19 @@ class Probe(Struct):
         vals : array
             The probed values.
         """
+        source_vals = variable().reshape((variable.n_nod,
+                                          variable.n_components))
+        pars, points, vals = self._probe(variable, source_vals, mode)
+
+        if ret_points:
+            return pars, points, vals
+
+        else:
+            return pars, vals
+
+    def _probe(self, variable, source_vals, mode):
         refine_flag = None
 
-        ev = variable.evaluate_at
         field = variable.field
 
         cache = field.get_evaluate_cache(cache=self.get_evaluate_cache(),
@@ -310,8 +330,8 @@ class Probe(Struct):
 
             acache = self.get_actual_cache(pars, cache)
 
-            vals, ref_coors, cells, status = ev(
-                points, mode=mode, strategy='general',
+            vals, ref_coors, cells, status = field.evaluate_at(
+                points, source_vals, mode=mode, strategy='general',
                 close_limit=self.options.close_limit, cache=acache,
                 ret_ref_coors=True, ret_status=True, ret_cells=True)
 
@@ -329,11 +349,99 @@ class Probe(Struct):
 
         self.is_refined = True
 
+        return pars, points, vals
+
+    def get_interpolation_matrix(self, variable, mode='val'):
+        """
+        Get the sparse matrix interpolating the DOF values of the given
+        variable into the probe points. The probe points are located (and the
+        probe refined, if adaptive) without using the variable data. The
+        matrix is taken from the interpolation operator cached in the
+        variable field, see :func:`Field.get_interpolation_operator()
+        <sfepy.discrete.common.fields.Field.get_interpolation_operator()>`.
+
+        Parameters
+        ----------
+        variable : Variable instance
+            The variable to be sampled along the probe.
+        mode : {'val', 'grad'}, optional
+            The evaluation mode: the variable value (default) or the
+            variable value gradient.
+
+        Returns
+        -------
+        pars : array
+            The parametrization of the probe points.
+        points : array
+            The coordinates of points corresponding to `pars`.
+        mtx : csr_matrix
+            The interpolation matrix, see
+            :func:`Field.get_interpolation_matrix()
+            <sfepy.discrete.common.fields.Field.get_interpolation_matrix()>`.
+        """
+        field = variable.field
+        pars, points, _ = self._probe(variable, nm.zeros((field.n_nod, 1)),
+                                      'val')
+
+        # The points located by _probe() are reused via the cache.
+        op = field.get_interpolation_operator(
+            points, mode=mode, strategy='general',
+            close_limit=self.options.close_limit, cache=self.acache,
+        )
+
+        return pars, points, op.mtx
+
+    def probe_series(self, variable, series, mode='val', ret_points=False):
+        """
+        Probe the given variable in a series of its DOF values, for example
+        in all time steps of stored results.
+
+        The probe points are located only once, so that probing a series item
+        is just a sparse matrix multiplication. The items are probed as the
+        series is iterated, so that the series need not be kept in memory.
+
+        Parameters
+        ----------
+        variable : Variable instance
+            The variable to be sampled along the probe. Its data are not used.
+        series : iterable
+            The series of the variable DOF values, each with the shape
+            ``(n_dof,)`` or ``(n_nod, n_components)``.
+        mode : {'val', 'grad'}, optional
+            The evaluation mode: the variable value (default) or the
+            variable value gradient.
+        ret_points : bool
+            If True, return also the probe points.
+
+        Returns
+        -------
+        pars : array
+            The parametrization of the probe points.
+        points : array, optional
+            If `ret_points` is True, the coordinates of points corresponding to
+            `pars`.
+        vals : generator
+            The generator of probed values, one array for each item of
+            `series`, with the shapes as returned by :func:`Probe.probe()`.
+        """
+        pars, points, mtx = self.get_interpolation_matrix(variable, mode=mode)
+
+        n_point = len(pars)
+        n_nod, n_c = variable.n_nod, variable.n_components
+
+        def _gen_vals():
+            for dofs in series:
+                vals = mtx * nm.reshape(dofs, (n_nod, n_c))
+                if mode == 'grad':
+                    vals = vals.reshape((n_point, -1, n_c)).transpose(0, 2, 1)
+
+                yield vals
+
         if ret_points:
-            return pars, points, vals
+            return pars, points, _gen_vals()
 
         else:
-            return pars, vals
+            return pars, _gen_vals()
 
     def reset_refinement(self):
         """
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 import os
 import os.path as op
 from copy import copy
+from collections import OrderedDict
 
 import numpy as nm
 
@@ -14,7 +15,7 @@ from sfepy.base.conf import transform_variables, transform_materials
 from sfepy.base.timing import Timer
 from .functions import Functions
 from sfepy.discrete.fem.mesh import Mesh
-from sfepy.discrete.fem.meshio import check_format_suffix
+from sfepy.discrete.fem.meshio import MeshIO, check_format_suffix
 from sfepy.discrete.fem.fields_base import set_mesh_coors
 from sfepy.discrete.common.fields import fields_from_conf
 from .variables import Variables, Variable
@@ -290,6 +291,7 @@ class Problem(Struct):
         self.clear_equations()
 
         self._restart_filenames = []
+        self._checkpoints = None
 
     def setup_hooks(self, options=None):
         """
@@ -341,7 +343,10 @@ class Problem(Struct):
                          output_format=self.output_format,
                          file_format=self.file_format,
                          file_per_var=self.file_per_var,
-                         linearization=self.linearization)
+                         linearization=self.linearization,
+                         save_queue_size=self.save_queue_size,
+                         keep_output_open=self.keep_output_open,
+                         output_flush_every=self.output_flush_every)
 
         return obj
 
@@ -399,6 +404,11 @@ class Problem(Struct):
         default_file_per_var = conf.options.get('file_per_var', None)
         default_float_format = conf.options.get('float_format', None)
         default_linearization = Struct(kind='strip')
+        default_save_queue_size = conf.options.get('save_queue_size', None)
+        default_keep_output_open = conf.options.get('keep_output_open', None)
+        default_output_flush_every = conf.options.get('output_flush_every',
+                                                      None)
+        default_max_output_open = conf.options.get('max_output_open', None)
 
         self.setup_output(output_filename_trunk=default_trunk,
                           output_dir=default_output_dir,
@@ -406,14 +416,31 @@ class Problem(Struct):
                           file_format=default_file_format,
                           float_format=default_float_format,
                           file_per_var=default_file_per_var,
-                          linearization=default_linearization)
+                          linearization=default_linearization,
+                          save_queue_size=default_save_queue_size,
+                          keep_output_open=default_keep_output_open,
+                          output_flush_every=default_output_flush_every,
+                          max_output_open=default_max_output_open)
 
     def setup_output(self, output_filename_trunk=None, output_dir=None,
                      output_format=None, file_format=None, float_format=None,
-                     file_per_var=None, linearization=None):
+                     file_per_var=None, linearization=None,
+                     save_queue_size=None, keep_output_open=None,
+                     output_flush_every=None, max_output_open=None):
         """
         Sets output options to given values, or uses the defaults for
         each argument that is None.
+
+        If `save_queue_size` is greater than zero, the results are written
+        in a background thread by :func:`Problem.save_state()`, with at
+        most `save_queue_size` results waiting for writing.
+
+        If `keep_output_open` is True, the results files supporting write
+        sessions (HDF5) are kept open during :func:`Problem.solve()` and
+        flushed after each `output_flush_every` saved steps, see
+        :func:`Problem.open_output_session()`. At most `max_output_open`
+        files are kept open - the least recently written file is closed when
+        another one is opened.
         """
         self.output_modes = {'vtk' : 'sequence', 'h5' : 'single',
                              'msh' : 'sequence'}
@@ -436,6 +463,142 @@ class Problem(Struct):
             (self.linearization.kind == 'adaptive')):
             self.linearization.kind = None
 
+        self.close_output()
+        self.save_queue_size = get_default(save_queue_size, 0)
+        self.keep_output_open = get_default(keep_output_open, False)
+        self.output_flush_every = get_default(output_flush_every, 1)
+        self.max_output_open = get_default(max_output_open, 8)
+        self.output_writer = None
+        self.output_ios = None
+
+    def open_output_session(self):
+        """
+        Start an output session: the results files written by
+        :func:`Problem.save_state()` are kept open by their MeshIO instances
+        until :func:`Problem.close_output()` is called, so that the file
+        handles and data nodes are not recreated in each time step.
+
+        Does nothing if the `keep_output_open` output option is False.
+        """
+        self.close_output()
+        if self.keep_output_open:
+            self.output_ios = OrderedDict()
+
+    def _get_output_io(self, filename, file_format=None):
+        """
+        Get the MeshIO instance for writing `filename` in the current output
+        session, or 'auto' outside of a session.
+        """
+        if self.output_ios is None:
+            return 'auto'
+
+        ios = self.output_ios
+        mio = ios.get(filename)
+        if mio is not None:
+            ios.move_to_end(filename)
+
+        else:
+            while len(ios) >= max(self.max_output_open, 1):
+                old = ios.popitem(last=False)[1]
+                if hasattr(old, 'close_session'):
+                    # After the pending writes that may use the file.
+                    self.call_output(old.close_session)
+
+            mio = MeshIO.any_from_filename(filename, file_format=file_format,
+                                           mode='w')
+            if hasattr(mio, 'open_session'):
+                mio.open_session(flush_every=self.output_flush_every)
+
+            self.output_ios[filename] = mio
+
+        return mio
+
+    def get_output_writer(self):
+        """
+        Get the background output writer, see :func:`Problem.setup_output()`.
+        Returns None, if the results are written synchronously.
+        """
+        if not self.save_queue_size:
+            return None
+
+        if (self.output_writer is None) or not self.output_writer.is_running():
+            self.output_writer = io.BackgroundWriter(
+                queue_size=self.save_queue_size,
+                name='%s output writer' % self.name,
+            )
+
+        return self.output_writer
+
+    def call_output(self, fun, *args, **kwargs):
+        """
+        Call `fun(*args, **kwargs)` that accesses HDF5 files and return its
+        result. If the background output writer is running, the call is done
+        in its thread, as PyTables is not thread-safe.
+        """
+        writer = getattr(self, 'output_writer', None)
+        if (writer is not None) and writer.is_running():
+            return writer.call(fun, *args, **kwargs)
+
+        else:
+            return fun(*args, **kwargs)
+
+    def flush_output(self, raise_error=True):
+        """
+        Wait for the pending background writes of results to finish.
+        """
+        writer = getattr(self, 'output_writer', None)
+        if writer is not None:
+            writer.flush(raise_error=raise_error)
+
+    def close_output(self, raise_error=True):
+        """
+        Flush the pending background writes of results, stop the
+        background writer and close the results files of the current output
+        session.
+        """
+        writer = getattr(self, 'output_writer', None)
+        if writer is not None:
+            try:
+                writer.close(raise_error=raise_error)
+
+            finally:
+                self.output_writer = None
+                self._close_output_ios()
+
+        else:
+            self._close_output_ios()
+
+    def _close_output_ios(self):
+        ios = getattr(self, 'output_ios', None)
+        if ios is not None:
+            for mio in six.itervalues(ios):
+                if hasattr(mio, 'close_session'):
+                    mio.close_session()
+
+            self.output_ios = None
+
+    def _write_mesh(self, mesh, filename, out, **kwargs):
+        mio = self._get_output_io(filename, kwargs.get('file_format'))
+        writer = self.get_output_writer()
+        if writer is None:
+            mesh.write(filename, io=mio, out=out,
+                       float_format=self.float_format, **kwargs)
+
+        else:
+            # The solver continues with the next time step, so the written
+            # data and the time stepper must not be shared.
+            aux = {}
+            for key, val in six.iteritems(out):
+                val = copy(val)
+                if isinstance(getattr(val, 'data', None), nm.ndarray):
+                    val.data = val.data.copy()
+                aux[key] = val
+
+            kwargs = {key : copy(val) if isinstance(val, TimeStepper) else val
+                      for key, val in six.iteritems(kwargs)}
+            writer.submit(mesh.write, filename, io=mio, out=aux,
+                          float_format=self.float_format, **kwargs)
+
     def set_output_dir(self, output_dir=None):
         """
         Set the directory for output files.
@@ -534,6 +697,13 @@ class Problem(Struct):
                                         user=user,
                                         eterm_options=eterm_options)
 
+        cache_terms = self.conf.options.get('matrix_cache_terms')
+        if cache_terms:
+            for eq in equations:
+                for term in eq.terms:
+                    if term.name in cache_terms:
+                        term.set_matrix_caching()
+
         self.equations = equations
 
         if not keep_solvers:
@@ -637,10 +807,15 @@ class Problem(Struct):
                                        verbose=self.conf.get('verbose', True))
         self.graph_changed = graph_changed
 
+        # No global matrix in the matrix-free mode.
+        is_matrix = is_matrix and not self.conf.options.get('matrix_free',
+                                                             False)
         if (is_matrix
             and ((self.active_only and graph_changed)
                  or (self.mtx_a is None) or create_matrix)):
-            self.mtx_a = self.equations.create_matrix_graph(active_only=ac)
+            cache_dir = self.conf.options.get('matrix_graph_cache_dir')
+            self.mtx_a = self.equations.create_matrix_graph(active_only=ac,
+                                                            cache_dir=cache_dir)
             ## import sfepy.base.plotutils as plu
             ## plu.spy(self.mtx_a)
             ## plu.plt.show()
@@ -792,6 +967,7 @@ class Problem(Struct):
         self.equations.init_time(ts)
 
         self._restart_filenames = []
+        self._checkpoints = None
 
     def advance(self, ts=None):
         self.update_time_stepper(ts)
@@ -831,8 +1007,7 @@ class Problem(Struct):
             for key, val in six.iteritems(out):
                 mesh = val.get('mesh', self.domain.mesh)
                 aux = io.edit_filename(filename, suffix='_' + val.var_name)
-                mesh.write(aux, io='auto', out={key : val},
-                           float_format=self.float_format, **kwargs)
+                self._write_mesh(mesh, aux, {key : val}, **kwargs)
                 if hasattr(val, 'levels'):
                     output('max. refinement per group:', val.levels)
 
@@ -870,12 +1045,10 @@ class Problem(Struct):
                         raise ValueError(msg)
 
                 aux = io.edit_filename(filename, suffix='_' + var.name)
-                mesh.write(aux, io='auto', out=vout,
-                           float_format=self.float_format, **kwargs)
+                self._write_mesh(mesh, aux, vout, **kwargs)
         else:
             mesh = out.pop('__mesh__', self.domain.mesh)
-            mesh.write(filename, io='auto', out=out,
-                       float_format=self.float_format, **kwargs)
+            self._write_mesh(mesh, filename, out, **kwargs)
 
     def save_ebc(self, filename, ebcs=None, epbcs=None,
                  force=True, default=0.0):
@@ -1241,7 +1414,8 @@ class Problem(Struct):
 
             restart_filename = self.conf.options.get('load_restart', None)
             if restart_filename is not None:
-                self.load_restart(restart_filename, state=state0, ts=ts)
+                self.call_output(self.load_restart, restart_filename,
+                                 state=state0, ts=ts)
                 self.advance(ts)
                 ts.advance()
                 state = self.create_state()
@@ -1267,7 +1441,8 @@ class Problem(Struct):
 
             restart_filename = self.get_restart_filename(ts=ts)
             if restart_filename is not None:
-                self.save_restart(restart_filename, state, ts=ts)
+                self.call_output(self.save_restart, restart_filename, state,
+                                 ts=ts)
 
             if save_results and is_save(ts):
                 if not isinstance(self.get_solver(), StationarySolver):
@@ -1406,38 +1581,47 @@ class Problem(Struct):
             if isinstance(state0, nm.ndarray):
                 state0 = State(self.equations.variables, vec=state0)
 
-        if self.conf.options.get('block_solve', False):
-            state = self.block_solve(state0, status=status,
-                                     save_results=save_results,
-                                     step_hook=step_hook,
-                                     post_process_hook=post_process_hook,
-                                     verbose=verbose)
+        self.open_output_session()
+        try:
+            if self.conf.options.get('block_solve', False):
+                state = self.block_solve(state0, status=status,
+                                         save_results=save_results,
+                                         step_hook=step_hook,
+                                         post_process_hook=post_process_hook,
+                                         verbose=verbose)
 
-        else:
-            self.time_update(tss.ts)
+            else:
+                self.time_update(tss.ts)
 
-            state0.apply_ebc(force_values=force_values)
+                state0.apply_ebc(force_values=force_values)
 
-            if self.is_linear():
-                mtx = prepare_matrix(self, state0) # Updates materials.
-                self.try_presolve(mtx)
+                if self.is_linear():
+                    mtx = prepare_matrix(self, state0) # Updates materials.
+                    self.try_presolve(mtx)
 
-            init_fun, prestep_fun, poststep_fun = self.get_tss_functions(
-                state0,
-                update_bcs=update_bcs, update_materials=update_materials,
-                save_results=save_results,
-                step_hook=step_hook, post_process_hook=post_process_hook)
+                init_fun, prestep_fun, poststep_fun = self.get_tss_functions(
+                    state0,
+                    update_bcs=update_bcs, update_materials=update_materials,
+                    save_results=save_results,
+                    step_hook=step_hook, post_process_hook=post_process_hook)
 
-            vec = tss(state0.get_vec(self.active_only),
-                      init_fun=init_fun,
-                      prestep_fun=prestep_fun,
-                      poststep_fun=poststep_fun,
-                      status=status)
-            output('solved in %d steps in %.2f seconds'
-                   % (status['n_step'], status['time']), verbose=verbose)
+                vec = tss(state0.get_vec(self.active_only),
+                          init_fun=init_fun,
+                          prestep_fun=prestep_fun,
+                          poststep_fun=poststep_fun,
+                          status=status)
+                output('solved in %d steps in %.2f seconds'
+                       % (status['n_step'], status['time']), verbose=verbose)
 
-            state = state0.copy()
-            state.set_vec(vec, self.active_only)
+                state = state0.copy()
+                state.set_vec(vec, self.active_only)
+
+        except:
+            # Save what was computed, but report the original error.
+            self.close_output(raise_error=False)
+            raise
+
+        self.close_output()
 
         if post_process_hook_final is not None: # User postprocessing.
             post_process_hook_final(self, state)
@@ -1903,6 +2087,9 @@ class Problem(Struct):
         """
         Save the current state and time step to a restart file.
 
+        If the 'save_restart' option is a positive integer n, the restart data
+        are saved as checkpoints, see :func:`Problem.save_checkpoint()`.
+
         Parameters
         ----------
         filename : str
@@ -1925,6 +2112,11 @@ class Problem(Struct):
         if ts is None:
             ts = self.get_default_ts()
 
+        mode = self.conf.options.get('save_restart', None)
+        if (mode is not None) and (mode > 0):
+            self.save_checkpoint(filename, state=state, ts=ts, n_chain=mode)
+            return
+
         fd = pt.open_file(filename, mode='w', title='SfePy restart file')
 
         tgroup = fd.create_group('/', 'ts', 'ts')
@@ -1947,8 +2139,6 @@ class Problem(Struct):
 
         fd.close()
 
-        mode = self.conf.options.get('save_restart', None)
-
         if (mode == -1) and len(self._restart_filenames):
             last_filename = self._restart_filenames.pop()
 
@@ -1960,6 +2150,78 @@ class Problem(Struct):
 
         self._restart_filenames.append(filename)
 
+    def save_checkpoint(self, filename, state=None, ts=None, n_chain=1):
+        """
+        Save the current state and time step as a checkpoint.
+
+        The checkpoints are stored in chains of `n_chain` snapshots in a
+        single file: a new chain file called `filename` is started when the
+        current chain is full. Only the arrays that changed since the previous
+        snapshots of the chain (e.g. not the previous time step data of
+        variables with history) are written. The 'restart_keep' option
+        (default: 2) gives the number of the most recent chain files that are
+        kept, the older ones are removed. The 'restart_complevel' option
+        (default: 4) is the compression level of the stored arrays.
+
+        Parameters
+        ----------
+        filename : str
+            The file name used if a new chain is started.
+        state : State instance, optional
+            The state instance. If not given, a new state is created using the
+            variables in problem equations.
+        ts : TimeStepper instance, optional
+            The time stepper. If not given, a default one is created.
+        n_chain : int
+            The maximum number of snapshots in a chain.
+
+        Notes
+        -----
+        Does not support terms with internal state. The material parameters
+        are not stored, as they are evaluated again after restarting.
+        """
+        if state is None:
+            state = self.create_state()
+
+        if ts is None:
+            ts = self.get_default_ts()
+
+        options = self.conf.options
+
+        chk = self._checkpoints
+        if (chk is None) or (chk.n_snapshot >= n_chain):
+            chk = io.HDF5Checkpoints(
+                filename, mode='w',
+                complevel=options.get('restart_complevel', 4)
+            )
+            self._checkpoints = chk
+
+            self._restart_filenames.append(filename)
+            keep = max(options.get('restart_keep', 2), 1)
+            while len(self._restart_filenames) > keep:
+                last_filename = self._restart_filenames.pop(0)
+                try:
+                    os.remove(last_filename)
+
+                except OSError:
+                    pass
+
+        arrays = {}
+        for key, val in six.iteritems(ts.get_state()):
+            arrays['ts/' + key] = nm.asarray(val)
+
+        if state.r_vec is not None:
+            arrays['r_vec'] = state.r_vec
+
+        for var in state.variables.iter_state():
+            for ii in range(len(var.data)):
+                arrays['%s/data_%d' % (var.name, ii)] = var(step=-ii)
+
+        n_new = chk.save(ts.step, arrays)
+        output('checkpoint %d of step %d: %d of %d arrays written to "%s"'
+               % (chk.n_snapshot - 1, ts.step, n_new, len(arrays),
+                  chk.filename))
+
     def load_restart(self, filename, state=None, ts=None):
         """
         Load the current state and time step from a restart file.
@@ -2024,6 +2286,30 @@ class Problem(Struct):
 
             fd.close()
 
+        elif fd.title == io.HDF5Checkpoints.title:
+            fd.close()
+
+            step, arrays, info = io.HDF5Checkpoints(filename).load()
+
+            ts_state = {}
+            for key, val in six.iteritems(arrays):
+                if key.startswith('ts/'):
+                    ts_state[key[3:]] = val.tolist()
+
+            ts.set_state(**ts_state)
+
+            for var in variables.iter_state():
+                ii = 0
+                while ('%s/data_%d' % (var.name, ii)) in arrays:
+                    var.set_data(arrays['%s/data_%d' % (var.name, ii)],
+                                 step=-ii)
+                    ii += 1
+
+            new_state = State.from_variables(variables)
+
+            if 'r_vec' in arrays:
+                state.r_vec = arrays['r_vec']
+
         elif fd.title == 'SfePy output file':
             from sfepy.discrete.fem.meshio import MeshIO
 
@@ -2031,9 +2317,9 @@ class Problem(Struct):
                    ' file discards higher order DOFs! Use with caution!')
 
             fd.close()
-            io = MeshIO.any_from_filename(filename)
+            mio = MeshIO.any_from_filename(filename)
 
-            out = io.read_data(step=ts.step)
+            out = mio.read_data(step=ts.step)
 
             for var in variables.iter_state():
                 val = out[var.name]
@@ -2042,9 +2328,10 @@ class Problem(Struct):
             new_state = State.from_variables(variables)
 
         else:
-            raise IOError('unknown file type! ("%s" in ("%s", "%s"))'
+            raise IOError('unknown file type! ("%s" in ("%s", "%s", "%s"))'
                           % (fd.title,
-                             'SfePy restart file', 'SfePy output file'))
+                             'SfePy restart file', io.HDF5Checkpoints.title,
+                             'SfePy output file'))
 
         output('...done')
 
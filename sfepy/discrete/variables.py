@@ -1500,7 +1500,7 @@ class FieldVariable(Variable):
     def evaluate(self, mode='val',
                  region=None, integral=None, integration=None,
                  step=0, time_derivative=None, is_trace=False,
-                 trace_region=None, dt=None, bf=None):
+                 trace_region=None, dt=None, bf=None, cells=None):
         """
         Evaluate various quantities related to the variable according to
         `mode` in quadrature points defined by `integral`.
@@ -1535,6 +1535,9 @@ class FieldVariable(Variable):
             the `dt` attribute of the variable is used.
         bf : Base function, optional
             The base function to be used in 'val' mode.
+        cells : slice, optional
+            If given, evaluate only in the region cells (or facets) given by
+            the slice of their local indices. The result is not cached.
 
         Returns
         -------
@@ -1569,8 +1572,11 @@ class FieldVariable(Variable):
         geo, _, key = field.get_mapping(region, integral, integration,
                                         return_key=True)
         key += (time_derivative, is_trace)
+        if cells is not None:
+            geo = geo.get_slice(cells.start, cells.stop)
+            key = None
 
-        if key in cache:
+        if (key is not None) and (key in cache):
             out = cache[key]
 
         else:
@@ -1581,6 +1587,11 @@ class FieldVariable(Variable):
             conn = field.get_econn(ct, region, is_trace, integration)
 
             shape = self.get_data_shape(integral, integration, region.name)
+            if cells is not None:
+                conn = conn[cells]
+                shape = (conn.shape[0],) + tuple(shape[1:])
+                if (bf is not None) and (bf.shape[0] > 1):
+                    bf = bf[cells]
 
             if self.dtype == nm.float64:
                 out = eval_real(vec, conn, geo, mode, shape, bf)
@@ -1588,7 +1599,8 @@ class FieldVariable(Variable):
             else:
                 out = eval_complex(vec, conn, geo, mode, shape, bf)
 
-            cache[key] = out
+            if key is not None:
+                cache[key] = out
 
         return out
 
@@ -1880,6 +1892,50 @@ class FieldVariable(Variable):
 
         return out
 
+    def get_interpolation_operator(self, coors, mode='val',
+                                   strategy='general', close_limit=0.1,
+                                   get_cells_fun=None, cache=None,
+                                   verbose=False):
+        """
+        Get the reusable sparse operator interpolating the variable DOF
+        values into the given physical coordinates. Convenience wrapper
+        around :func:`Field.get_interpolation_operator()
+        <sfepy.discrete.common.fields.Field.get_interpolation_operator()>`,
+        see its docstring for more details.
+
+        The values in the coordinates are then obtained by
+        ``op(var().reshape((var.n_nod, var.n_components)))``, or
+        by :func:`FieldVariable.evaluate_with()`.
+        """
+        op = self.field.get_interpolation_operator(coors, mode=mode,
+                                                   strategy=strategy,
+                                                   close_limit=close_limit,
+                                                   get_cells_fun=get_cells_fun,
+                                                   cache=cache,
+                                                   verbose=verbose)
+        return op
+
+    def evaluate_with(self, op, ret_status=False):
+        """
+        Evaluate the variable using the given interpolation operator.
+
+        Parameters
+        ----------
+        op : InterpolationOperator instance
+            The operator returned by
+            :func:`FieldVariable.get_interpolation_operator()`.
+        ret_status : bool, optional
+            If False, the values in points with the status greater than one
+            are set to ``numpy.nan``.
+
+        Returns
+        -------
+        vals : array
+            The interpolated values, see :func:`FieldVariable.evaluate_at()`.
+        """
+        source_vals = self().reshape((self.n_nod, self.n_components))
+        return op(source_vals, ret_status=ret_status)
+
     def set_from_other(self, other, strategy='projection', close_limit=0.1):
         """
         Set the variable using another variable. Undefined values (e.g. outside
@@ -1895,7 +1951,9 @@ class FieldVariable(Variable):
         Notes
         -----
         If the other variable uses the same field mesh, the coefficients are
-        set directly.
+        set directly. Otherwise, the interpolation operator from the other
+        variable field is cached, so that repeated calls with the same pair
+        of fields are cheap.
         """
         flag_same_mesh = self.has_same_mesh(other)
 
@@ -1914,8 +1972,9 @@ class FieldVariable(Variable):
         else:
             raise ValueError('unknown interpolation strategy! (%s)' % strategy)
 
-        vals = other.evaluate_at(coors, strategy='general',
-                                 close_limit=close_limit)
+        op = other.get_interpolation_operator(coors, strategy='general',
+                                              close_limit=close_limit)
+        vals = other.evaluate_with(op)
 
         if strategy == 'interpolation':
             self.set_data(vals)
@@ -1,11 +1,50 @@
 """Some sparse matrix utilities missing in scipy."""
 from __future__ import absolute_import
+import itertools
+
 import numpy as nm
 import scipy.sparse as sp
 
 from sfepy.base.base import assert_
 from six.moves import range
 
+_pattern_ids = itertools.count(1)
+
+def stamp_matrix(mtx, new_pattern=False):
+    """
+    Update the version stamp of a sparse matrix `mtx`.
+
+    The stamp is a tuple `(pattern_id, generation)`. A new unique pattern ID
+    is assigned if `new_pattern` is True or the matrix has no stamp yet,
+    otherwise the generation counter is incremented. It has to be called
+    whenever the matrix data (`new_pattern` = False) or structure
+    (`new_pattern` = True) are modified in place, so that the linear solvers
+    can detect matrix changes without inspecting the data, see
+    :func:`get_matrix_stamp()`.
+
+    Returns
+    -------
+    stamp : tuple
+        The new stamp.
+    """
+    stamp = getattr(mtx, '_sfepy_stamp', None)
+    if new_pattern or (stamp is None):
+        stamp = (next(_pattern_ids), 0)
+
+    else:
+        stamp = (stamp[0], stamp[1] + 1)
+
+    mtx._sfepy_stamp = stamp
+
+    return stamp
+
+def get_matrix_stamp(mtx):
+    """
+    Get the version stamp `(pattern_id, generation)` of a sparse matrix
+    `mtx`, or None if the matrix was not stamped by :func:`stamp_matrix()`.
+    """
+    return getattr(mtx, '_sfepy_stamp', None)
+
 def save_sparse_txt(filename, mtx, fmt='%d %d %f\n'):
     """Save a CSR/CSC sparse matrix into a text file"""
     fd = open(filename, 'w')
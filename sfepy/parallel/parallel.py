@@ -23,6 +23,7 @@ from petsc4py import PETSc
 from mpi4py import MPI
 
 from sfepy.base.base import assert_, output, ordered_iteritems, Struct
+from sfepy.base.ioutils import edit_filename
 from sfepy.base.timing import Timer
 from sfepy.discrete.common.region import Region
 from sfepy.discrete.fem.fe_surface import FESurface
@@ -686,6 +687,63 @@ def create_gather_to_zero(pvec):
 
     return gather_to_zero
 
+def get_partition_filename(filename, rank):
+    """
+    Return the name of the output file of the task `rank` corresponding to
+    the partitioned output file name `filename`.
+    """
+    return edit_filename(filename, suffix='_%05d' % rank)
+
+def save_partitioned(filename, mesh, out=None, ts=None, comm=None, **kwargs):
+    """
+    Save the task-local `mesh` and output data `out` of all tasks in
+    parallel, without gathering the data to the task of rank zero.
+
+    Each task writes its own HDF5 file with an XDMF description, see
+    :func:`get_partition_filename()`. The task of rank zero then writes the
+    XDMF index file named after `filename` with the '.xdmf' suffix, that ties
+    the task files together. This function has to be called by all tasks.
+
+    Parameters
+    ----------
+    filename : str
+        The base name of the output files.
+    mesh : Mesh instance
+        The task-local mesh, e.g. obtained by ``Mesh.from_region(omega_gi,
+        mesh, localize=True)``.
+    out : dict, optional
+        The output data of the task-local mesh.
+    ts : TimeStepper instance, optional
+        The time stepper, for saving time-dependent results.
+    comm : PETSc.Comm or mpi4py.MPI.Comm instance, optional
+        The MPI communicator.
+    **kwargs : dict, optional
+        Additional arguments passed to :func:`Mesh.write()
+        <sfepy.discrete.fem.mesh.Mesh.write()>`.
+
+    Returns
+    -------
+    index_filename : str
+        The name of the XDMF index file.
+    """
+    from sfepy.discrete.fem.meshio import HDF5XdmfMeshIO
+
+    if comm is None:
+        comm = PETSc.COMM_WORLD
+
+    part_filename = get_partition_filename(filename, comm.rank)
+    mesh.write(part_filename, io=HDF5XdmfMeshIO(part_filename), out=out,
+               ts=ts, **kwargs)
+
+    index_filename = os.path.splitext(filename)[0] + '.xdmf'
+    comm.barrier()
+    if comm.rank == 0:
+        part_filenames = [get_partition_filename(filename, rank)
+                          for rank in range(comm.size)]
+        HDF5XdmfMeshIO.write_xdmf_index(index_filename, part_filenames)
+
+    return index_filename
+
 def create_prealloc_data(mtx, pdofs, drange, verbose=False):
     """
     Create CSR preallocation data for a PETSc matrix based on the owned PETSc
@@ -5,13 +5,16 @@ import numpy as nm
 import warnings
 
 import scipy.sparse as sps
+from scipy.sparse.linalg import LinearOperator
 import six
 from six.moves import range
 
 warnings.simplefilter('ignore', sps.SparseEfficiencyWarning)
 
-from sfepy.base.base import output, get_default, assert_, try_imports
+from sfepy.base.base import (output, get_default, assert_, try_imports,
+                             Struct)
 from sfepy.base.timing import Timer
+from sfepy.linalg.sparse import get_matrix_stamp
 from sfepy.solvers.solvers import LinearSolver
 
 def solve(mtx, rhs, solver_class=None, solver_conf=None):
@@ -47,20 +50,150 @@ def _get_cs_matrix_hash(mtx, chunk_size=100000):
     digest = sha1.hexdigest()
     return digest
 
-def _is_new_matrix(mtx, mtx_digest, force_reuse=False):
+def _get_matrix_change(mtx, mtx_digest, force_reuse=False):
+    """
+    Determine how `mtx` differs from the matrix described by `mtx_digest`.
+
+    For matrices with a version stamp (see
+    :func:`sfepy.linalg.sparse.stamp_matrix()`), the decision is made
+    without reading the matrix arrays. Otherwise the matrix arrays are
+    hashed.
+
+    Returns
+    -------
+    change : 'none', 'numeric' or 'full'
+        No change, the same sparsity pattern with changed values, or a new
+        matrix.
+    mtx_digest : tuple
+        The digest of `mtx`.
+    """
     if not isinstance(mtx, sps.csr_matrix):
-        return True, mtx_digest
+        return 'full', mtx_digest
 
     if force_reuse:
-        return False, mtx_digest
+        return 'none', mtx_digest
 
     id0, digest0 = mtx_digest
     id1 = id(mtx)
+
+    stamp = get_matrix_stamp(mtx)
+    if stamp is not None:
+        digest1 = stamp + (mtx.shape, mtx.nnz)
+        if (isinstance(digest0, tuple) and (id1 == id0)
+            and (digest1[0] == digest0[0]) and (digest1[2:] == digest0[2:])):
+            change = 'none' if digest1[1] == digest0[1] else 'numeric'
+
+        else:
+            change = 'full'
+
+        return change, (id1, digest1)
+
     digest1 = _get_cs_matrix_hash(mtx)
     if (id1 == id0) and (digest1 == digest0):
-        return False, (id1, digest1)
+        return 'none', (id1, digest1)
+
+    return 'full', (id1, digest1)
+
+def _is_new_matrix(mtx, mtx_digest, force_reuse=False):
+    change, mtx_digest = _get_matrix_change(mtx, mtx_digest,
+                                            force_reuse=force_reuse)
+    return change != 'none', mtx_digest
+
+class _PrecondReuse(Struct):
+    """
+    The preconditioner lifetime policy of iterative linear solvers.
+
+    Decides whether the preconditioner set up for a previous matrix is reused
+    for a new matrix according to the solver configuration parameters
+    `pc_max_reuse`, `pc_iter_growth` and `pc_numeric_update`. The policy
+    state persists between the solver calls, i.e., across nonlinear solver
+    iterations and time steps.
+    """
+
+    def __init__(self):
+        Struct.__init__(self, name='pc_reuse', shape=None, digest=(0, ''),
+                        n_reused=0, n_iter0=-1, n_iter=-1)
+
+    def get_action(self, conf, mtx, change, is_set, has_numeric=False):
+        """
+        Get the preconditioner action for the matrix `mtx`.
+
+        Parameters
+        ----------
+        conf : Struct
+            The linear solver configuration.
+        mtx : sparse matrix or LinearOperator
+            The new matrix.
+        change : 'none', 'numeric' or 'full'
+            The change of `mtx` with respect to the previous matrix, see
+            :func:`_get_matrix_change()`.
+        is_set : bool
+            True, if a preconditioner has been set up.
+        has_numeric : bool
+            True, if the solver supports updating only the numeric part of
+            the preconditioner.
+
+        Returns
+        -------
+        action : 'keep', 'reuse', 'numeric' or 'rebuild'
+            Keep the preconditioner for the unchanged matrix, reuse the stale
+            preconditioner for a changed matrix, update the numeric part of
+            the preconditioner or set up a new preconditioner.
+        """
+        if not is_set:
+            return 'rebuild'
+
+        if change == 'none':
+            return 'keep'
+
+        shape = getattr(mtx, 'shape', None)
+        growth = conf.get('pc_iter_growth', None)
+        if (shape is None) or (shape != self.shape):
+            action, msg = 'rebuild', 'new matrix shape'
+
+        elif ((growth is not None) and (self.n_iter0 >= 0)
+              and (self.n_iter > (1.0 + growth) * max(self.n_iter0, 1))):
+            action, msg = 'rebuild', ('iterations grew from %d to %d'
+                                      % (self.n_iter0, self.n_iter))
 
-    return True, (id1, digest1)
+        elif self.n_reused < conf.get('pc_max_reuse', 0):
+            action, msg = 'reuse', ('reuse %d/%d'
+                                    % (self.n_reused + 1, conf.pc_max_reuse))
+
+        elif (has_numeric and conf.get('pc_numeric_update', False)
+              and (_get_matrix_change(mtx, self.digest)[0] == 'numeric')):
+            action, msg = 'numeric', 'same sparsity pattern'
+
+        else:
+            action, msg = 'rebuild', 'new matrix'
+
+        output('%s: preconditioner: %s (%s)' % (conf.name, action, msg),
+               verbose=conf.verbose)
+
+        return action
+
+    def update(self, action, mtx, mtx_digest):
+        """
+        Update the policy state after applying `action` to the matrix `mtx`
+        with the digest `mtx_digest`.
+        """
+        if action in ('rebuild', 'numeric'):
+            self.shape = getattr(mtx, 'shape', None)
+            self.digest = mtx_digest
+            self.n_reused = 0
+            self.n_iter0 = -1
+
+        elif action == 'reuse':
+            self.n_reused += 1
+
+    def set_n_iter(self, n_iter):
+        """
+        Set the number of iterations of the last solve.
+        """
+        if self.n_iter0 < 0:
+            self.n_iter0 = n_iter
+
+        self.n_iter = n_iter
 
 def standard_call(call):
     """
@@ -145,10 +278,17 @@ class ScipyDirect(LinearSolver):
          'The actual solver to use.'),
         ('use_presolve', 'bool', False, False,
          'If True, pre-factorize the matrix.'),
+        ('reuse_symbolic', 'bool', False, False,
+         """If True, pre-factorize the matrix and, for matrices with the same
+            sparsity pattern as the previous one, repeat only the numeric
+            factorization, reusing the ordering and symbolic analysis. Only
+            supported by UMFPACK from scikit-umfpack, otherwise the full
+            factorization is done."""),
     ]
 
     def __init__(self, conf, method=None, **kwargs):
-        LinearSolver.__init__(self, conf, solve=None, **kwargs)
+        LinearSolver.__init__(self, conf, solve=None, um=None,
+                              umfpack_ctx=None, **kwargs)
         um = self.sls = None
         if method is None:
             method = self.conf.method
@@ -181,6 +321,9 @@ class ScipyDirect(LinearSolver):
         if is_umfpack:
             self.sls.use_solver(useUmfpack=True,
                                 assumeSortedIndices=True)
+            if hasattr(aux['um'], 'UmfpackContext'):
+                self.um = aux['um']
+
         else:
             self.sls.use_solver(useUmfpack=False)
 
@@ -188,7 +331,7 @@ class ScipyDirect(LinearSolver):
     def __call__(self, rhs, x0=None, conf=None, eps_a=None, eps_r=None,
                  i_max=None, mtx=None, status=None, **kwargs):
 
-        if conf.use_presolve:
+        if conf.use_presolve or conf.get('reuse_symbolic', False):
             self.presolve(mtx)
 
         if self.solve is not None:
@@ -198,10 +341,45 @@ class ScipyDirect(LinearSolver):
             return self.sls.spsolve(mtx, rhs)
 
     def presolve(self, mtx):
-        is_new, mtx_digest = _is_new_matrix(mtx, self.mtx_digest)
-        if is_new:
+        change, mtx_digest = _get_matrix_change(mtx, self.mtx_digest)
+        if change == 'none':
+            return
+
+        if (self.conf.get('reuse_symbolic', False) and (self.um is not None)
+            and isinstance(mtx, sps.csr_matrix)):
+            self.solve = self._factorize_umfpack(mtx, change)
+
+        else:
             self.solve = self.sls.factorized(mtx)
-            self.mtx_digest = mtx_digest
+
+        self.mtx_digest = mtx_digest
+
+    def _factorize_umfpack(self, mtx, change):
+        """
+        Factorize `mtx` using an UMFPACK context. The symbolic factorization
+        is kept if only numeric values of the matrix changed.
+        """
+        um = self.um
+        ctx = self.umfpack_ctx
+        if (ctx is None) or (change == 'full'):
+            family = 'z' if nm.iscomplexobj(mtx.data) else 'd'
+            family += 'l' if mtx.indices.dtype == nm.int64 else 'i'
+            ctx = self.umfpack_ctx = um.UmfpackContext(family)
+
+            if not mtx.has_sorted_indices:
+                mtx.sort_indices()
+
+            ctx.symbolic(mtx)
+
+        else:
+            output('reusing symbolic factorization', verbose=self.conf.verbose)
+
+        ctx.numeric(mtx)
+
+        def solve(rhs):
+            return ctx.solve(um.UMFPACK_A, mtx, rhs, autoTranspose=True)
+
+        return solve
 
 
 class ScipySuperLU(ScipyDirect):
@@ -228,6 +406,10 @@ class ScipyUmfpack(ScipyDirect):
     _parameters = [
         ('use_presolve', 'bool', False, False,
          'If True, pre-factorize the matrix.'),
+        ('reuse_symbolic', 'bool', False, False,
+         """If True, pre-factorize the matrix and, for matrices with the same
+            sparsity pattern as the previous one, repeat only the numeric
+            factorization."""),
     ]
 
     def __init__(self, conf, **kwargs):
@@ -374,6 +556,21 @@ class PyAMGSolver(LinearSolver):
         ('force_reuse', 'bool', False, False,
          """If True, skip the check whether the MG solver object corresponds
             to the `mtx` argument: it is always reused."""),
+        ('pc_max_reuse', 'int', 0, False,
+         """If > 0, the MG solver object set up for a previous matrix is
+            reused in at most `pc_max_reuse` subsequent solves with changed
+            matrices, also across nonlinear solver iterations and time
+            steps. Only the finest level matrix is replaced."""),
+        ('pc_iter_growth', 'float or None', None, False,
+         """If given, the reused MG solver object is set up again, when the
+            number of iterations grows by more than the `pc_iter_growth`
+            fraction (e.g. 0.5 for 50%) with respect to the first solve with
+            it."""),
+        ('pc_numeric_update', 'bool', False, False,
+         """If True, for matrices with the sparsity pattern of the matrix the
+            MG solver object was set up for, update only its numeric part:
+            the prolongators are kept and the coarse level matrices, the
+            smoothers and the coarse solver are updated."""),
         ('*', '*', None, False,
          """Additional parameters supported by the method. Use the 'method:'
             prefix for arguments of the method construction function
@@ -385,6 +582,12 @@ class PyAMGSolver(LinearSolver):
     # a callback except those below, that take a residual vector norm.
     _callbacks_res = ['gmres']
 
+    # The default smoothers of the pyamg methods.
+    _smoothers = {
+        'ruge_stuben_solver' : ('gauss_seidel', {'sweep' : 'symmetric'}),
+        None : ('block_gauss_seidel', {'sweep' : 'symmetric'}),
+    }
+
     def __init__(self, conf, **kwargs):
         try:
             import pyamg
@@ -392,7 +595,8 @@ class PyAMGSolver(LinearSolver):
             msg =  'cannot import pyamg!'
             raise ImportError(msg)
 
-        LinearSolver.__init__(self, conf, mg=None, **kwargs)
+        LinearSolver.__init__(self, conf, mg=None, pc_reuse=_PrecondReuse(),
+                              **kwargs)
 
         try:
             solver = getattr(pyamg, self.conf.method)
@@ -431,14 +635,25 @@ class PyAMGSolver(LinearSolver):
             # Call an optional user-defined callback.
             callback(sol)
 
-        is_new, mtx_digest = _is_new_matrix(mtx, self.mtx_digest,
-                                            force_reuse=conf.force_reuse)
-        if is_new or (self.mg is None):
-            _kwargs = {key[7:] : val
-                       for key, val in six.iteritems(solver_kwargs)
-                       if key.startswith('method:')}
+        change, mtx_digest = _get_matrix_change(mtx, self.mtx_digest,
+                                                force_reuse=conf.force_reuse)
+        action = self.pc_reuse.get_action(conf, mtx, change,
+                                          self.mg is not None,
+                                          has_numeric=True)
+        _kwargs = {key[7:] : val
+                   for key, val in six.iteritems(solver_kwargs)
+                   if key.startswith('method:')}
+        if action == 'rebuild':
             self.mg = self.solver(mtx, **_kwargs)
-            self.mtx_digest = mtx_digest
+
+        elif action == 'numeric':
+            self._update_mg_numeric(mtx, _kwargs)
+
+        elif action == 'reuse':
+            self.mg.levels[0].A = mtx
+
+        self.pc_reuse.update(action, mtx, mtx_digest)
+        self.mtx_digest = mtx_digest
 
         _kwargs = {key[6:] : val
                    for key, val in six.iteritems(solver_kwargs)
@@ -446,9 +661,36 @@ class PyAMGSolver(LinearSolver):
         sol = self.mg.solve(rhs, x0=x0, accel=conf.accel, tol=eps_r,
                             maxiter=i_max, callback=iter_callback,
                             **_kwargs)
+        self.pc_reuse.set_n_iter(self.iter)
+        if status is not None:
+            status['precond'] = action
 
         return sol, self.iter
 
+    def _update_mg_numeric(self, mtx, method_kwargs):
+        """
+        Update the numeric part of the MG solver object for `mtx` with the
+        sparsity pattern of the matrix it was set up for: keep the
+        prolongators and restrictions, recompute the Galerkin coarse level
+        matrices and set up the smoothers and the coarse solver again.
+        """
+        from pyamg.multilevel import coarse_grid_solver
+        from pyamg.relaxation.smoothing import change_smoothers
+
+        smoother = self._smoothers.get(self.conf.method,
+                                       self._smoothers[None])
+        levels = self.mg.levels
+        levels[0].A = mtx
+        for lev0, lev1 in zip(levels[:-1], levels[1:]):
+            lev1.A = (lev0.R * lev0.A * lev0.P).tocsr()
+
+        change_smoothers(self.mg,
+                         method_kwargs.get('presmoother', smoother),
+                         method_kwargs.get('postsmoother', smoother))
+        self.mg.coarse_solver = coarse_grid_solver(
+            method_kwargs.get('coarse_solver', 'pinv')
+        )
+
 class PyAMGKrylovSolver(LinearSolver):
     """
     Interface to PyAMG Krylov solvers.
@@ -473,6 +715,16 @@ class PyAMGKrylovSolver(LinearSolver):
          'The maximum number of iterations.'),
         ('eps_r', 'float', 1e-8, False,
          'The relative tolerance for the residual.'),
+        ('pc_max_reuse', 'int', 0, False,
+         """If > 0, the preconditioner returned by `setup_precond` for a
+            previous matrix is reused in at most `pc_max_reuse` subsequent
+            solves with changed matrices, also across nonlinear solver
+            iterations and time steps."""),
+        ('pc_iter_growth', 'float or None', None, False,
+         """If given, the reused preconditioner is set up again, when the
+            number of iterations grows by more than the `pc_iter_growth`
+            fraction (e.g. 0.5 for 50%) with respect to the first solve with
+            it."""),
         ('*', '*', None, False,
          'Additional parameters supported by the method.'),
     ]
@@ -488,7 +740,8 @@ class PyAMGKrylovSolver(LinearSolver):
             msg =  'cannot import pyamg.krylov!'
             raise ImportError(msg)
 
-        LinearSolver.__init__(self, conf, mg=None,
+        LinearSolver.__init__(self, conf, mg=None, precond=None,
+                              pc_reuse=_PrecondReuse(),
                               context=context, **kwargs)
 
         try:
@@ -535,19 +788,44 @@ class PyAMGKrylovSolver(LinearSolver):
             # Call an optional user-defined callback.
             callback(sol)
 
-        precond = setup_precond(mtx, context)
+        change, mtx_digest = _get_matrix_change(mtx, self.mtx_digest)
+        is_set = ((self.mtx_digest[0] != 0)
+                  and (kwargs.get('setup_precond', None) is None))
+        action = self.pc_reuse.get_action(conf, mtx, change, is_set)
+        if action == 'rebuild':
+            self.precond = setup_precond(mtx, context)
+
+        self.pc_reuse.update(action, mtx, mtx_digest)
+        self.mtx_digest = mtx_digest
 
         sol, info = self.solver(mtx, rhs, x0=x0, tol=eps_r, maxiter=i_max,
-                                M=precond, callback=iter_callback,
+                                M=self.precond, callback=iter_callback,
                                 **solver_kwargs)
 
         output('%s: %s convergence: %s (%s, %d iterations)'
                % (self.conf.name, self.conf.method,
                   info, self.converged_reasons[nm.sign(info)], self.iter),
                verbose=conf.verbose)
+        self.pc_reuse.set_n_iter(self.iter)
+        if status is not None:
+            status['precond'] = action
 
         return sol, self.iter
 
+class _PETScShellContext(object):
+    """
+    Context of PETSc shell matrices wrapping a SciPy linear operator.
+    """
+
+    def __init__(self, op):
+        self.op = op
+
+    def mult(self, mat, x, y):
+        y.array[:] = self.op.matvec(x.array)
+
+    def multTranspose(self, mat, x, y):
+        y.array[:] = self.op.rmatvec(x.array)
+
 class PETScKrylovSolver(LinearSolver):
     """
     PETSc Krylov subspace solver.
@@ -596,6 +874,23 @@ class PETScKrylovSolver(LinearSolver):
         ('force_reuse', 'bool', False, False,
          """If True, skip the check whether the KSP solver object corresponds
             to the `mtx` argument: it is always reused."""),
+        ('pc_max_reuse', 'int', 0, False,
+         """If > 0, the preconditioner set up for a previous matrix is reused
+            in at most `pc_max_reuse` subsequent solves with changed
+            matrices, also across nonlinear solver iterations and time
+            steps. The KSP solver uses the new matrix as the operator and
+            the previous matrix as the preconditioning matrix."""),
+        ('pc_iter_growth', 'float or None', None, False,
+         """If given, the reused preconditioner is set up again, when the
+            number of iterations grows by more than the `pc_iter_growth`
+            fraction (e.g. 0.5 for 50%) with respect to the first solve with
+            it."""),
+        ('pc_numeric_update', 'bool', False, False,
+         """If True, for matrices with the sparsity pattern of the matrix the
+            preconditioner was set up for, update the values of the PETSc
+            matrix in place and keep the KSP solver object, so that PETSc
+            can repeat only the numeric part of the preconditioner setup
+            (e.g. of the incomplete factorizations)."""),
         ('*', '*', None, False,
          """Additional parameters supported by the method. Can be used to pass
             all PETSc options supported by :func:`petsc.Options()`."""),
@@ -616,7 +911,8 @@ class PETScKrylovSolver(LinearSolver):
 
         LinearSolver.__init__(self, conf, petsc=petsc, comm=comm,
                               converged_reasons=converged_reasons,
-                              fields=None, ksp=None, pmtx=None,
+                              fields=None, ksp=None, pmtx=None, ppmtx=None,
+                              pc_reuse=_PrecondReuse(),
                               context=context, **kwargs)
 
     def set_field_split(self, field_ranges, comm=None):
@@ -676,6 +972,14 @@ class PETScKrylovSolver(LinearSolver):
         if isinstance(mtx, self.petsc.Mat):
             pmtx = mtx
 
+        elif isinstance(mtx, LinearOperator):
+            # Matrix-free operator -> PETSc shell matrix. Use with
+            # preconditioners that do not need the matrix entries.
+            pmtx = self.petsc.Mat()
+            pmtx.createPython(mtx.shape, context=_PETScShellContext(mtx),
+                              comm=comm)
+            pmtx.setUp()
+
         else:
             mtx = sps.csr_matrix(mtx)
 
@@ -696,12 +1000,31 @@ class PETScKrylovSolver(LinearSolver):
         i_max = get_default(i_max, self.conf.i_max)
         eps_d = self.conf.eps_d
 
-        is_new, mtx_digest = _is_new_matrix(mtx, self.mtx_digest,
-                                            force_reuse=conf.force_reuse)
-        if (not is_new) and self.ksp is not None:
+        change, mtx_digest = _get_matrix_change(mtx, self.mtx_digest,
+                                                force_reuse=conf.force_reuse)
+        action = self.pc_reuse.get_action(conf, mtx, change,
+                                          self.ksp is not None,
+                                          has_numeric=True)
+        if action == 'keep':
             ksp = self.ksp
             pmtx = self.pmtx
 
+        elif action == 'reuse':
+            # The preconditioning matrix is not changed -> the preconditioner
+            # is not set up again.
+            pmtx = self.create_petsc_matrix(mtx, comm=comm)
+            ksp = self.ksp
+            ksp.setOperators(pmtx, self.ppmtx)
+            self.pmtx = pmtx
+
+        elif action == 'numeric':
+            pmtx = self.ppmtx
+            pmtx.setValuesCSR(mtx.indptr, mtx.indices, mtx.data)
+            pmtx.assemble()
+            ksp = self.ksp
+            ksp.setOperators(pmtx)
+            self.pmtx = pmtx
+
         else:
             pmtx = self.create_petsc_matrix(mtx, comm=comm)
 
@@ -715,9 +1038,11 @@ class PETScKrylovSolver(LinearSolver):
                 ksp.pc.setPythonContext(setup_precond(mtx, context))
 
             ksp.setFromOptions()
-            self.mtx_digest = mtx_digest
             self.ksp = ksp
-            self.pmtx = pmtx
+            self.pmtx = self.ppmtx = pmtx
+
+        self.pc_reuse.update(action, mtx, mtx_digest)
+        self.mtx_digest = mtx_digest
 
         if isinstance(rhs, self.petsc.Vec):
             prhs = rhs
@@ -747,6 +1072,9 @@ class PETScKrylovSolver(LinearSolver):
                   ksp.reason, self.converged_reasons[ksp.reason],
                   ksp.getIterationNumber()),
                verbose=conf.verbose)
+        self.pc_reuse.set_n_iter(ksp.getIterationNumber())
+        if status is not None:
+            status['precond'] = action
 
         if isinstance(rhs, self.petsc.Vec):
             sol = psol
@@ -768,6 +1096,10 @@ class MUMPSSolver(LinearSolver):
          'If True, pre-factorize the matrix.'),
         ('memory_relaxation', 'int', 20, False,
          'The percentage increase in the estimated working space.'),
+        ('reuse_symbolic', 'bool', False, False,
+         """If True, for matrices with the same sparsity pattern as the
+            previous one, repeat only the numeric factorization (MUMPS job 2),
+            reusing the ordering and symbolic analysis (MUMPS job 1)."""),
     ]
 
     def __init__(self, conf, **kwargs):
@@ -795,7 +1127,7 @@ class MUMPSSolver(LinearSolver):
         return out
 
     def presolve(self, mtx, presolve_flag=False):
-        is_new, mtx_digest = _is_new_matrix(mtx, self.mtx_digest)
+        change, mtx_digest = _get_matrix_change(mtx, self.mtx_digest)
         if not isinstance(mtx, sps.coo_matrix):
             mtx = mtx.tocoo()
         if self.mumps_ls is None:
@@ -807,12 +1139,17 @@ class MUMPSSolver(LinearSolver):
                                                    is_sym=is_sym,
                                                    mem_relax=mem_relax)
 
-        if is_new:
+        if change != 'none':
             if self.conf.verbose:
                 self.mumps_ls.set_verbose()
 
             self.mumps_ls.set_mtx_centralized(mtx)
-            self.mumps_ls(4)  # analyze + factorize
+            if (change == 'numeric') and self.conf.reuse_symbolic:
+                self.mumps_ls(2)  # factorize
+
+            else:
+                self.mumps_ls(4)  # analyze + factorize
+
             if presolve_flag:
                 self.mumps_presolved = True
             self.mtx_digest = mtx_digest
@@ -111,6 +111,13 @@ class Newton(NonlinearSolver):
     Solves a nonlinear system :math:`f(x) = 0` using the Newton method.
 
     The solver uses a backtracking line-search on divergence.
+
+    With iterative linear solvers, the inexact Newton method can be used, see
+    the `forcing` parameter: the relative tolerance :math:`\eta_i` of the
+    linear solver is set in each iteration using the forcing terms of [1].
+
+    [1] S. C. Eisenstat, H. F. Walker: Choosing the forcing terms in an
+    inexact Newton method. SIAM J. Sci. Comput. 17 (1996), 16-32.
     """
     name = 'nls.newton'
 
@@ -134,6 +141,27 @@ class Newton(NonlinearSolver):
          """If not None, the linear system solution tolerances are set in each
             nonlinear iteration relative to the current residual norm by the
             `lin_precision` factor. Ignored for direct linear solvers."""),
+        ('forcing', "None, 'ew1' or 'ew2'", None, False,
+         """If not None, use the inexact Newton method with the
+            Eisenstat-Walker forcing terms (choice 1 or 2 of [1]) as the
+            relative tolerances of the linear solver. The configured `eps_r`
+            of the linear solver is the lower bound of the forcing terms. Has
+            precedence over `lin_precision`. Ignored for direct linear
+            solvers."""),
+        ('eta0', '0.0 < float < 1.0', 0.5, False,
+         'The forcing term in the first iteration.'),
+        ('eta_max', '0.0 < float < 1.0', 0.9, False,
+         'The maximum forcing term.'),
+        ('ew_gamma', '0.0 < float <= 1.0', 0.9, False,
+         r"""The :math:`\gamma` parameter of the Eisenstat-Walker choice 2:
+            :math:`\eta_i = \gamma (||f(x^i)|| / ||f(x^{i-1})||)^\alpha`."""),
+        ('ew_alpha', '1.0 < float <= 2.0', 2.0, False,
+         r"""The :math:`\alpha` parameter of the Eisenstat-Walker choice
+            2."""),
+        ('reuse_x0', 'bool', False, False,
+         """If True, the linear solution (the Newton step) of the previous
+            iteration is used as the initial guess of the iterative linear
+            solver."""),
         ('ls_on', 'float', 0.99999, False,
          """Start the backtracking line-search by reducing the step, if
             :math:`||f(x^i)|| / ||f(x^{i-1})||` is larger than `ls_on`."""),
@@ -160,10 +188,22 @@ class Newton(NonlinearSolver):
             Each of the dict items can be None."""),
         ('is_linear', 'bool', False, False,
          'If True, the problem is considered to be linear.'),
+        ('mtx_lag', 'int', 0, False,
+         """If > 0, the last computed tangent matrix is reused (lagged) in at
+            most `mtx_lag` subsequent iterations, also across solver calls
+            (e.g. time steps), as long as the convergence is fast enough, see
+            `mtx_lag_red`. Use with a linear solver that keeps the matrix
+            factorization, e.g. `'use_presolve' : True` for direct
+            solvers."""),
+        ('mtx_lag_red', '0.0 < float < 1.0', 0.5, False,
+         """The lagged tangent matrix is reused only if
+            :math:`||f(x^i)|| / ||f(x^{i-1})||` is less than
+            `mtx_lag_red`."""),
     ]
 
     def __init__(self, conf, **kwargs):
-        NonlinearSolver.__init__(self, conf, **kwargs)
+        NonlinearSolver.__init__(self, conf, mtx_lagged=None, n_lagged=0,
+                                 **kwargs)
 
         conf = self.conf
 
@@ -236,11 +276,17 @@ class Newton(NonlinearSolver):
         vec_x_last = vec_x0.copy()
         vec_dx = None
 
+        is_inexact = (conf.forcing is not None) and (ls_eps_r is not None)
+        eta = lerr = -1.0
+        etas = []
+        n_fun = n_fun_grad = ls_n_solve = 0
+        ls_time = 0.0
+
         if self.log is not None:
             self.log.plot_vlines(color='r', linewidth=1.0)
 
         err = err0 = -1.0
-        err_last = -1.0
+        err_last = err_prev = -1.0
         it = 0
         ls_status = {}
         ls_n_iter = 0
@@ -254,6 +300,7 @@ class Newton(NonlinearSolver):
                 timer.start()
 
                 try:
+                    n_fun += 1
                     vec_r = fun(vec_x)
 
                 except ValueError:
@@ -308,6 +355,7 @@ class Newton(NonlinearSolver):
             if self.log is not None:
                 self.log.plot_vlines([1], color='g', linewidth=0.5)
 
+            err_prev = err_last
             err_last = err;
             vec_x_last = vec_x.copy()
 
@@ -320,11 +368,21 @@ class Newton(NonlinearSolver):
                 break
 
             timer.start()
-            if not conf.is_linear:
-                mtx_a = fun_grad(vec_x)
+            if conf.is_linear:
+                mtx_a = fun_grad('linear')
+
+            elif self._can_lag_matrix(conf, vec_x, err, err_prev):
+                mtx_a = self.mtx_lagged
+                self.n_lagged += 1
+                output('reusing lagged tangent matrix (%d/%d)'
+                       % (self.n_lagged, conf.mtx_lag))
 
             else:
-                mtx_a = fun_grad('linear')
+                mtx_a = fun_grad(vec_x)
+                n_fun_grad += 1
+                self.n_lagged = 0
+                if conf.mtx_lag > 0:
+                    self.mtx_lagged = mtx_a
 
             time_stats['matrix'] = timer.stop()
 
@@ -333,7 +391,15 @@ class Newton(NonlinearSolver):
                 wt = check_tangent_matrix(conf, vec_x, fun, fun_grad)
                 time_stats['check'] = timer.stop() - wt
 
-            if conf.lin_precision is not None:
+            if is_inexact:
+                eta = self._get_forcing_term(conf, it, err, err_prev, lerr,
+                                             eta, ls_eps_r)
+                etas.append(eta)
+                eps_r = eta
+                lin_red = max(eps_a, err * eps_r)
+                output('forcing term: %e' % eta, verbose=conf.verbose)
+
+            elif conf.lin_precision is not None:
                 if ls_eps_a is not None:
                     eps_a = max(err * conf.lin_precision, ls_eps_a)
 
@@ -345,12 +411,20 @@ class Newton(NonlinearSolver):
             if conf.verbose:
                 output('solving linear system...')
 
+            if conf.reuse_x0:
+                x0 = vec_dx0
+
+            else:
+                x0 = vec_x
+
             timer.start()
-            vec_dx = lin_solver(vec_r, x0=vec_x,
+            vec_dx = lin_solver(vec_r, x0=x0,
                                 eps_a=eps_a, eps_r=eps_r, mtx=mtx_a,
                                 status=ls_status)
             ls_n_iter += ls_status['n_iter']
+            ls_n_solve += 1
             time_stats['solve'] = timer.stop()
+            ls_time += time_stats['solve']
 
             if conf.verbose:
                 output('...done')
@@ -375,6 +449,11 @@ class Newton(NonlinearSolver):
             status['n_iter'] = it
             status['ls_n_iter'] = ls_n_iter if ls_n_iter >= 0 else -1
             status['condition'] = condition
+            status['n_fun'] = n_fun
+            status['n_fun_grad'] = n_fun_grad
+            status['ls_n_solve'] = ls_n_solve
+            status['ls_time'] = ls_time
+            status['etas'] = etas
 
         if conf.log.plot is not None:
             if self.log is not None:
@@ -382,6 +461,340 @@ class Newton(NonlinearSolver):
 
         return vec_x
 
+    @staticmethod
+    def _get_forcing_term(conf, it, err, err_prev, lerr, eta_prev, eta_min):
+        """
+        Return the Eisenstat-Walker forcing term for the iteration `it`, given
+        the current and previous residual norms `err` and `err_prev`, the
+        previous linear residual norm `lerr` and the previous forcing term
+        `eta_prev`. The safeguards of [1] are applied, and the forcing term is
+        kept in [`eta_min`, `eta_max`], but not smaller than needed for
+        reaching `eps_a`.
+        """
+        if (it == 0) or (err_prev <= 0.0):
+            return min(max(conf.eta0, eta_min), conf.eta_max)
+
+        if conf.forcing == 'ew1':
+            eta = abs(err - lerr) / err_prev
+            alpha = 0.5 * (1.0 + nm.sqrt(5.0))
+            safe = eta_prev**alpha
+
+        elif conf.forcing == 'ew2':
+            eta = conf.ew_gamma * (err / err_prev)**conf.ew_alpha
+            safe = conf.ew_gamma * eta_prev**conf.ew_alpha
+
+        else:
+            raise ValueError('unknown forcing term kind! (%s)' % conf.forcing)
+
+        if safe > 0.1:
+            eta = max(eta, safe)
+
+        eta = max(eta, 0.5 * conf.eps_a / err, eta_min)
+        return min(eta, conf.eta_max)
+
+    def _can_lag_matrix(self, conf, vec_x, err, err_prev):
+        """
+        Check whether the lagged tangent matrix can be reused, given the
+        current and previous residual norms `err` and `err_prev`. The
+        previous residual norm is negative in the first iteration.
+        """
+        mtx = self.mtx_lagged
+        if ((conf.mtx_lag <= 0) or (mtx is None)
+            or (self.n_lagged >= conf.mtx_lag)
+            or (mtx.shape[0] != vec_x.shape[0])):
+            return False
+
+        if (err_prev > 0.0) and (err >= (conf.mtx_lag_red * err_prev)):
+            return False
+
+        return True
+
+class JFNK(NonlinearSolver):
+    r"""
+    Solves a nonlinear system :math:`f(x) = 0` using the Jacobian-free
+    Newton-Krylov method.
+
+    The linear systems :math:`J(x^i) \Delta x^i = f(x^i)` are solved by a
+    Krylov solver from ``scipy.sparse.linalg`` that requires only the products
+    of the tangent matrix with vectors. Those are approximated by the finite
+    differences of the residual, :math:`J(x) v \approx (f(x + h v) - f(x)) /
+    h`, so that the tangent matrix need not be assembled in each iteration.
+
+    Optionally, the Krylov solver is preconditioned by the linear solver with
+    a stale tangent matrix, that is reassembled only after `pc_lag`
+    iterations, also across solver calls (e.g. time steps), or when the
+    Krylov solver does not converge. Use a direct linear solver that keeps
+    the matrix factorization, e.g. `'use_presolve' : True`.
+
+    The relative tolerance of the Krylov solver is given by the forcing terms
+    as in :class:`Newton`. The solver uses a backtracking line-search on
+    divergence. Requires the problem with `active_only` set to True.
+    """
+    name = 'nls.jfnk'
+
+    _parameters = [
+        ('i_max', 'int', 10, False,
+         'The maximum number of iterations.'),
+        ('eps_a', 'float', 1e-10, False,
+         'The absolute tolerance for the residual, i.e. :math:`||f(x^i)||`.'),
+        ('eps_r', 'float', 1.0, False,
+         """The relative tolerance for the residual, i.e. :math:`||f(x^i)|| /
+            ||f(x^0)||`."""),
+        ('eps_mode', "'and' or 'or'", 'and', False,
+         """The logical operator to use for combining the absolute and relative
+            tolerances."""),
+        ('macheps', 'float', nm.finfo(nm.float64).eps, False,
+         'The float considered to be machine "zero".'),
+        ('method', "{'gmres', 'lgmres', 'bicgstab'}", 'gmres', False,
+         'The Krylov solver in ``scipy.sparse.linalg``.'),
+        ('lin_i_max', 'int', 100, False,
+         'The maximum number of the Krylov solver iterations.'),
+        ('forcing', "None, 'ew1' or 'ew2'", 'ew2', False,
+         """The forcing terms, see :class:`Newton`. If None, the constant
+            forcing term `eta0` is used."""),
+        ('eta0', '0.0 < float < 1.0', 0.1, False,
+         'The forcing term in the first iteration.'),
+        ('eta_max', '0.0 < float < 1.0', 0.9, False,
+         'The maximum forcing term.'),
+        ('ew_gamma', '0.0 < float <= 1.0', 0.9, False,
+         'The :math:`\\gamma` parameter of the Eisenstat-Walker choice 2.'),
+        ('ew_alpha', '1.0 < float <= 2.0', 2.0, False,
+         'The :math:`\\alpha` parameter of the Eisenstat-Walker choice 2.'),
+        ('fd_eps', 'float', nm.sqrt(nm.finfo(nm.float64).eps), False,
+         r"""The relative finite difference step: :math:`h = \epsilon (1 +
+            ||x||) / ||v||`."""),
+        ('precond', 'bool', True, False,
+         """If True, precondition the Krylov solver by the linear solver with
+            the assembled tangent matrix."""),
+        ('pc_lag', 'int', 10, False,
+         """The maximum number of iterations in which the preconditioning
+            tangent matrix is reused."""),
+        ('ls_on', 'float', 0.99999, False,
+         """Start the backtracking line-search by reducing the step, if
+            :math:`||f(x^i)|| / ||f(x^{i-1})||` is larger than `ls_on`."""),
+        ('ls_red', '0.0 < float < 1.0', 0.1, False,
+         'The step reduction factor.'),
+        ('ls_min', '0.0 < float < 1.0', 1e-5, False,
+         'The minimum step reduction factor.'),
+    ]
+
+    def __init__(self, conf, **kwargs):
+        NonlinearSolver.__init__(self, conf, mtx_pc=None, n_pc_used=0,
+                                 **kwargs)
+
+    def __call__(self, vec_x0, conf=None, fun=None, fun_grad=None,
+                 lin_solver=None, iter_hook=None, status=None):
+        """
+        Nonlinear system solver call.
+
+        Solves a nonlinear system :math:`f(x) = 0` using the Jacobian-free
+        Newton-Krylov method with backtracking line-search, starting with an
+        initial guess :math:`x^0`.
+
+        Parameters
+        ----------
+        vec_x0 : array
+            The initial guess vector :math:`x_0`.
+        conf : Struct instance, optional
+            The solver configuration parameters,
+        fun : function, optional
+            The function :math:`f(x)` whose zero is sought - the residual.
+        fun_grad : function, optional
+            The gradient of :math:`f(x)` - the tangent matrix. Used only for
+            the preconditioning.
+        lin_solver : LinearSolver instance, optional
+            The linear solver used for the preconditioning.
+        iter_hook : function, optional
+            User-supplied function to call before each iteration.
+        status : dict-like, optional
+            The user-supplied object to hold convergence statistics.
+        """
+        import inspect
+        import scipy.sparse.linalg as sla
+
+        conf = get_default(conf, self.conf)
+        fun = get_default(fun, self.fun)
+        fun_grad = get_default(fun_grad, self.fun_grad)
+        lin_solver = get_default(lin_solver, self.lin_solver)
+        iter_hook = get_default(iter_hook, self.iter_hook)
+        status = get_default(status, self.status)
+
+        if not getattr(self.context, 'active_only', True):
+            raise ValueError('nls.jfnk requires active_only=True!')
+
+        solver = getattr(sla, conf.method)
+        # The relative tolerance keyword is 'rtol' in recent SciPy versions,
+        # 'tol' in older ones, and the oldest ones have no 'atol'.
+        pars = inspect.signature(solver).parameters
+        rtol_key = 'rtol' if 'rtol' in pars else 'tol'
+        tol_kwargs = {'atol' : 0.0} if 'atol' in pars else {}
+
+        timer = Timer()
+        time_stats_keys = ['residual', 'matrix', 'solve']
+        time_stats = {key : 0.0 for key in time_stats_keys}
+
+        n_dof = vec_x0.shape[0]
+        counts = {'fun' : 0}
+        def _fun(vec):
+            counts['fun'] += 1
+            return fun(vec)
+
+        def get_jacobian_operator(vec_x, vec_r):
+            nx = nla.norm(vec_x)
+            def matvec(vec_v):
+                vec_v = vec_v.ravel()
+                nv = nla.norm(vec_v)
+                if nv == 0.0:
+                    return nm.zeros_like(vec_v)
+
+                h = conf.fd_eps * (1.0 + nx) / nv
+                out = (_fun(vec_x + h * vec_v) - vec_r) / h
+                return out
+
+            return sla.LinearOperator((n_dof, n_dof), matvec=matvec,
+                                      dtype=vec_x.dtype)
+
+        vec_x = vec_x0.copy()
+        vec_x_last = vec_x0.copy()
+        vec_dx = None
+
+        err = err0 = -1.0
+        err_last = err_prev = -1.0
+        eta = lerr = -1.0
+        etas = []
+        it = 0
+        n_fun_grad = ls_n_iter = 0
+        ls_time = 0.0
+        while 1:
+            if iter_hook is not None:
+                iter_hook(self.context, self, vec_x, it, err, err0)
+
+            ls = 1.0
+            vec_dx0 = vec_dx
+            while 1:
+                timer.start()
+
+                try:
+                    vec_r = _fun(vec_x)
+
+                except ValueError:
+                    if (it == 0) or (ls < conf.ls_min):
+                        output('giving up!')
+                        raise
+
+                    else:
+                        ok = False
+
+                else:
+                    ok = True
+
+                time_stats['residual'] = timer.stop()
+                if ok:
+                    err = nla.norm(vec_r)
+                    if it == 0:
+                        err0 = err;
+                        break
+                    if err < (err_last * conf.ls_on): break
+                    output('linesearch: iter %d, (%.5e < %.5e) (new ls: %e)'
+                           % (it, err, err_last * conf.ls_on,
+                              conf.ls_red * ls))
+
+                else:
+                    output('residual computation failed for iter %d'
+                           ' (new ls: %e)!' % (it, conf.ls_red * ls))
+
+                if ls < conf.ls_min:
+                    output('linesearch failed, continuing anyway')
+                    break
+
+                ls *= conf.ls_red;
+
+                vec_dx = ls * vec_dx0;
+                vec_x = vec_x_last.copy() - vec_dx
+            # End residual loop.
+
+            err_prev = err_last
+            err_last = err;
+            vec_x_last = vec_x.copy()
+
+            condition = conv_test(conf, it, err, err0)
+            if condition >= 0:
+                break
+
+            timer.start()
+            precond = None
+            if conf.precond:
+                mtx = self.mtx_pc
+                if ((mtx is None) or (self.n_pc_used >= conf.pc_lag)
+                    or (mtx.shape[0] != n_dof)):
+                    # The residual has been evaluated in vec_x.
+                    self.mtx_pc = mtx = fun_grad(vec_x)
+                    self.n_pc_used = 0
+                    n_fun_grad += 1
+
+                self.n_pc_used += 1
+                precond = sla.LinearOperator(
+                    (n_dof, n_dof), dtype=vec_x.dtype,
+                    matvec=lambda vec: lin_solver(vec.ravel(), mtx=mtx),
+                )
+
+            time_stats['matrix'] = timer.stop()
+
+            if conf.forcing is None:
+                eta = conf.eta0
+
+            else:
+                eta = Newton._get_forcing_term(conf, it, err, err_prev, lerr,
+                                               eta, 0.0)
+            etas.append(eta)
+
+            timer.start()
+            mtx_j = get_jacobian_operator(vec_x, vec_r)
+
+            n_iter = [0]
+            def callback(arg):
+                n_iter[0] += 1
+
+            tol_kwargs[rtol_key] = eta
+            vec_dx, info = solver(mtx_j, vec_r, x0=None,
+                                  maxiter=conf.lin_i_max, M=precond,
+                                  callback=callback, **tol_kwargs)
+
+            ls_n_iter += n_iter[0]
+            time_stats['solve'] = timer.stop()
+            ls_time += time_stats['solve']
+
+            output('nls: %s: forcing term: %e, convergence: %d'
+                   ' (%d iterations)' % (conf.method, eta, info, n_iter[0]),
+                   verbose=conf.verbose)
+            if info != 0:
+                # Force the preconditioner update in the next iteration.
+                self.n_pc_used = conf.pc_lag
+
+            for key in time_stats_keys:
+                output('%10s: %7.2f [s]' % (key, time_stats[key]))
+
+            if conf.forcing == 'ew1':
+                lerr = nla.norm(mtx_j.matvec(vec_dx) - vec_r)
+
+            vec_x -= vec_dx
+            it += 1
+
+        if status is not None:
+            status['time_stats'] = time_stats
+            status['err0'] = err0
+            status['err'] = err
+            status['n_iter'] = it
+            status['ls_n_iter'] = ls_n_iter
+            status['condition'] = condition
+            status['n_fun'] = counts['fun']
+            status['n_fun_grad'] = n_fun_grad
+            status['ls_n_solve'] = len(etas)
+            status['ls_time'] = ls_time
+            status['etas'] = etas
+
+        return vec_x
+
 class ScipyBroyden(NonlinearSolver):
     """
     Interface to Broyden and Anderson solvers from ``scipy.optimize``.
@@ -356,6 +356,13 @@ class ElastodynamicsBaseTS(TimeSteppingSolver):
     Base class for elastodynamics solvers.
 
     Assumes block-diagonal matrix in `u`, `v`, `a`.
+
+    The stiffness, damping and mass matrices correspond to the diagonal
+    blocks of the problem matrix. When the blocks have the same sparsity
+    pattern (e.g. all the variables use the same field), the matrices are
+    assembled separately on that single pattern, and the effective matrices
+    are formed directly from their data. Otherwise, the blocks are sliced
+    from the matrix assembled by the nonlinear solver.
     """
     def __init__(self, conf, nls=None, context=None, **kwargs):
         TimeSteppingSolver.__init__(self, conf, nls=nls, context=context,
@@ -370,30 +377,189 @@ class ElastodynamicsBaseTS(TimeSteppingSolver):
         self.verbose = self.conf.verbose
         self.constant_matrices = None
         self.matrix = None
+        self.pattern = None
+        self.block_matrices = None
+
+    def get_block_pattern(self, mtx, i3):
+        """
+        Return the sparsity pattern `(indptr, indices)` shared by the three
+        diagonal blocks of the CSR matrix `mtx`, or False if the blocks do not
+        share the pattern or `mtx` is not block-diagonal. The result is
+        cached, as the matrix graph does not change during time stepping.
+        """
+        import scipy.sparse as sps
+
+        if self.pattern is not None:
+            return self.pattern
+
+        self.pattern = False
+        if not (sps.isspmatrix_csr(mtx) and mtx.has_sorted_indices):
+            return self.pattern
+
+        ip = mtx.indptr
+        indptr = ip[:i3+1]
+        indices = mtx.indices[:ip[i3]]
+        if len(indices) and (indices.max() >= i3):
+            return self.pattern
+
+        for ib in range(1, 3):
+            ir = ib * i3
+            ii = slice(ip[ir], ip[ir+i3])
+            if not (nm.array_equal(ip[ir:ir+i3+1] - ip[ir], indptr)
+                    and nm.array_equal(mtx.indices[ii] - ir, indices)):
+                break
+
+        else:
+            self.pattern = (indptr.copy(), indices.copy())
+
+        return self.pattern
+
+    def get_block_matrices(self, vec, i3):
+        """
+        Assemble the stiffness, damping and mass matrices separately, each
+        directly into its own CSR matrix with the sparsity pattern shared by
+        the diagonal blocks of the problem matrix graph, see
+        :func:`Equations.eval_tangent_matrix_block()
+        <sfepy.discrete.equations.Equations.eval_tangent_matrix_block()>`.
+        The matrix of the stacked `[u, v, a]` vector is not assembled.
+
+        Both the reduced (`active_only` is True) and full (`active_only` is
+        False) DOF vectors are supported. In the latter case, the EBCs are
+        applied to each block as in the stacked matrix.
+
+        Returns None, if the context is not a problem with three unknown
+        variables, if a matrix hook, linear combination boundary conditions,
+        periodic boundary conditions with `active_only` False or the
+        matrix-free mode are used, or if the blocks do not share the sparsity
+        pattern.
+        """
+        import scipy.sparse as sps
+        from sfepy.discrete.evaluate import apply_ebc_to_matrix
+
+        pb = self.context
+        equations = getattr(pb, 'equations', None)
+        if ((equations is None)
+            or (pb.matrix_hook is not None)
+            or equations.variables.has_lcbc
+            or pb.conf.options.get('matrix_free', False)):
+            return None
+
+        variables = equations.variables
+        names = [var.name for var in variables.iter_state()]
+        if len(names) != 3:
+            return None
+
+        if not pb.active_only:
+            ebc_rows, epbc_rows = pb.get_ebc_indices()
+            if len(epbc_rows[0]):
+                # The EPBCs change the sparsity pattern.
+                return None
+
+        pattern = self.get_block_pattern(pb.mtx_a, i3)
+        if not pattern:
+            return None
+
+        if self.block_matrices is None:
+            self.block_matrices = [
+                sps.csr_matrix((nm.zeros(len(pattern[1]), dtype=nm.float64),
+                                pattern[1], pattern[0]), shape=(i3, i3))
+                for ii in range(3)
+            ]
+
+        indx = {name : variables.get_indx(name, stripped=True)
+                for name in names}
+        names = sorted(names, key=lambda x: indx[x].start)
+        if pb.active_only:
+            vec = equations.make_full_vec(vec)
+
+        out = []
+        for mtx, name in zip(self.block_matrices, names):
+            mtx = equations.eval_tangent_matrix_block(vec, mtx, name, name)
+            if not pb.active_only:
+                ii = indx[name]
+                rows = ebc_rows[(ebc_rows >= ii.start) & (ebc_rows < ii.stop)]
+                apply_ebc_to_matrix(mtx, rows - ii.start)
+
+            out.append(mtx)
+
+        if any(mtx is not bmtx
+               for mtx, bmtx in zip(out, self.block_matrices)):
+            # Terms with a dynamic connectivity changed the pattern.
+            self.pattern = False
+
+        K, C, M = out
+
+        return M, C, K
 
     def get_matrices(self, nls, vec):
+        """
+        Return the mass, damping and stiffness matrices as separate
+        operators. For linear problems, they are computed only once.
+        """
         if self.conf.is_linear and self.constant_matrices is not None:
             out = self.constant_matrices
 
         else:
-            aux = nls.fun_grad(vec)
-
             assert_((len(vec) % 3) == 0)
             i3 = len(vec) // 3
 
+            out = self.get_block_matrices(vec, i3)
+            if out is None:
+                out = self.get_stacked_matrices(nls, vec, i3)
+
+            if self.conf.is_linear:
+                self.constant_matrices = out
+
+        return out
+
+    def get_stacked_matrices(self, nls, vec, i3):
+        """
+        Return the mass, damping and stiffness matrices sliced from the matrix
+        assembled by the nonlinear solver for the stacked `[u, v, a]` vector.
+        """
+        import scipy.sparse as sps
+
+        aux = nls.fun_grad(vec)
+
+        pattern = self.get_block_pattern(aux, i3)
+        if pattern:
+            ip = aux.indptr
+            copy = self.conf.is_linear
+            K, C, M = [
+                sps.csr_matrix((aux.data[ip[ir]:ip[ir+i3]], pattern[1],
+                                pattern[0]), shape=(i3, i3), copy=copy)
+                for ir in range(0, 3 * i3, i3)
+            ]
+
+        else:
             K = aux[:i3, :i3]
             C = aux[i3:2*i3, i3:2*i3]
             M = aux[2*i3:, 2*i3:]
 
-            out = (M, C, K)
-
             if self.conf.is_linear:
                 M.eliminate_zeros()
                 C.eliminate_zeros()
                 K.eliminate_zeros()
-                self.constant_matrices = (M, C, K)
 
-        return out
+        return M, C, K
+
+    def get_effective_matrix(self, M, C, K, cm, cc, ck):
+        """
+        Return the effective matrix `cm * M + cc * C + ck * K`.
+        """
+        import scipy.sparse as sps
+
+        if self.pattern:
+            data = cm * M.data
+            data += cc * C.data
+            data += ck * K.data
+            Kt = sps.csr_matrix((data, self.pattern[1], self.pattern[0]),
+                                shape=M.shape)
+
+        else:
+            Kt = cm * M + cc * C + ck * K
+
+        return Kt
 
     def get_a0(self, nls, u0, v0):
         vec = nm.r_[u0, v0, nm.zeros_like(u0)]
@@ -408,6 +574,9 @@ class ElastodynamicsBaseTS(TimeSteppingSolver):
         return a0
 
     def get_initial_vec(self, nls, vec0, init_fun, prestep_fun, poststep_fun):
+        self.pattern = None
+        self.block_matrices = None
+
         ts = self.ts
         vec0 = init_fun(ts, vec0)
 
@@ -449,7 +618,7 @@ class ElastodynamicsBaseTS(TimeSteppingSolver):
             vec = None if self.conf.is_linear else nm.r_[ufun(at), vfun(at), at]
             M, C, K = self.get_matrices(nls, vec)
 
-            Kt = M + cc * C + ck * K
+            Kt = self.get_effective_matrix(M, C, K, 1.0, cc, ck)
             return Kt
 
         nlst.fun = fun
@@ -484,7 +653,7 @@ class ElastodynamicsBaseTS(TimeSteppingSolver):
 
             M, C, K = self.get_matrices(nls, vec)
 
-            Kt = cm * M + cc * C + K
+            Kt = self.get_effective_matrix(M, C, K, cm, cc, 1.0)
             return Kt
 
         nlst.fun = fun
@@ -583,6 +752,238 @@ class VelocityVerletTS(ElastodynamicsBaseTS):
 
         return vec
 
+class CentralDifferenceTS(ElastodynamicsBaseTS):
+    r"""
+    Solve elastodynamics problems by the explicit central difference method
+    with a lumped mass matrix.
+
+    The mass matrix (the block corresponding to the accelerations) is
+    assembled and lumped only once, using either the row-sum or the HRZ
+    lumping [1]. In the time steps, only the residual is evaluated, so that no
+    matrix is assembled or solved: the accelerations are :math:`\ul{a} = -
+    M_L^{-1} \ul{r}(\ul{u}, \ul{v}, \ul{0})`, where :math:`M_L` is the
+    lumped mass. The method is implemented in the velocity-Verlet form, with
+    the damping forces evaluated using the mid-step velocities.
+
+    The method is stable for :math:`\Delta t \leq 2 / \omega_{max}`. If
+    `dt_safety` is given, the time step is set to `dt_safety` times the
+    critical time step estimate. The estimate is :math:`h_{min} / (c
+    \sqrt{d})`, where :math:`h_{min}` is the minimum edge length and
+    :math:`d` the space dimension, if the wave speed :math:`c` is given.
+    Otherwise, the largest eigenfrequency :math:`\omega_{max}` is estimated
+    by the power iteration using residual evaluations. As the power iteration
+    approaches :math:`\omega_{max}` from below, `dt_safety` should be
+    sufficiently smaller than one.
+
+    [1] E. Hinton, T. Rock, O. C. Zienkiewicz: A note on mass lumping and
+    related processes in the finite element method. Earthquake Engineering &
+    Structural Dynamics 4 (1976), 245-249.
+    """
+    name = 'ts.central_difference'
+
+    _parameters = [
+        ('t0', 'float', 0.0, False,
+         'The initial time.'),
+        ('t1', 'float', 1.0, False,
+         'The final time.'),
+        ('dt', 'float', None, False,
+         'The time step. Used if `n_step` is not given.'),
+        ('n_step', 'int', 10, False,
+         'The number of time steps. Has precedence over `dt`.'),
+        ('is_linear', 'bool', False, False,
+         'If True, the problem is considered to be linear.'),
+        ('mass_lumping', "{'row_sum', 'hrz'}", 'row_sum', False,
+         'The mass matrix lumping method.'),
+        ('dt_safety', 'float', None, False,
+         """If given, the time step is set to `dt_safety` times the critical
+            time step estimate. Has precedence over `dt` and `n_step`."""),
+        ('wave_speed', 'float', None, False,
+         """The largest wave speed. If given, the critical time step is
+            estimated using the minimum edge length."""),
+        ('n_iter_eig', 'int', 20, False,
+         """The number of power iterations for estimating the largest
+            eigenfrequency, when `wave_speed` is not given."""),
+    ]
+
+    def __init__(self, conf, nls=None, context=None, **kwargs):
+        ElastodynamicsBaseTS.__init__(self, conf, nls=nls, context=context,
+                                      **kwargs)
+        self.mass = None
+
+    @staticmethod
+    def lump_mass(M, mode='row_sum'):
+        """
+        Return the lumped (diagonal) mass of the mass matrix `M`.
+
+        Rows without off-diagonal entries (e.g. the rows of DOFs with EBCs,
+        when all DOFs are active) are not modified by the HRZ lumping.
+        """
+        rsum = nm.asarray(M.sum(axis=1)).ravel()
+        if mode == 'row_sum':
+            mass = rsum
+
+        elif mode == 'hrz':
+            diag = M.diagonal()
+            mass = diag.copy()
+
+            off = nm.asarray(abs(M).sum(axis=1)).ravel() - nm.abs(diag)
+            ii = off > 0.0
+            mass[ii] *= rsum[ii].sum() / diag[ii].sum()
+
+        else:
+            raise ValueError('unknown mass lumping! (%s)' % mode)
+
+        if not (mass > 0.0).all():
+            raise ValueError('non-positive lumped mass!')
+
+        return mass
+
+    def get_mass(self, nls, vec):
+        """
+        Return the lumped mass, computed on the first call.
+        """
+        if self.mass is None:
+            M = self.get_matrices(nls, vec)[0]
+            self.mass = self.lump_mass(M, self.conf.mass_lumping)
+            output_array_stats(self.mass, 'lumped mass',
+                               verbose=self.verbose)
+
+        return self.mass
+
+    def get_acceleration(self, nls, ut, vt):
+        """
+        Return the accelerations corresponding to the given displacements and
+        velocities. Only the residual is evaluated.
+        """
+        vec = nm.r_[ut, vt, nm.zeros_like(ut)]
+        mass = self.get_mass(nls, vec)
+
+        aux = nls.fun(vec)
+        i3 = len(ut)
+        rt = aux[:i3] + aux[i3:2*i3] + aux[2*i3:]
+
+        return - rt / mass
+
+    def get_a0(self, nls, u0, v0):
+        a0 = self.get_acceleration(nls, u0, v0)
+        output_array_stats(a0, 'initial acceleration', verbose=self.verbose)
+        return a0
+
+    def estimate_max_frequency(self, nls, u0):
+        """
+        Estimate the largest eigenfrequency of the lumped mass system
+        linearized at `u0` by the power iteration. The stiffness matrix
+        action is approximated by residual differences.
+        """
+        zero = nm.zeros_like(u0)
+        mass = self.get_mass(nls, nm.r_[u0, zero, zero])
+
+        def get_residual(ut):
+            aux = nls.fun(nm.r_[ut, zero, zero])
+            i3 = len(ut)
+            return aux[:i3] + aux[i3:2*i3] + aux[2*i3:]
+
+        r0 = get_residual(u0)
+        eps = 1e-6 * max(1.0, nm.abs(u0).max())
+
+        x = nm.random.RandomState(0).rand(len(u0)) - 0.5
+        lam = 0.0
+        for ii in range(self.conf.n_iter_eig):
+            x /= nm.sqrt(nm.dot(x, mass * x))
+            kx = (get_residual(u0 + eps * x) - r0) / eps
+            lam = nm.dot(x, kx)
+            x = kx / mass
+
+        return nm.sqrt(max(lam, 0.0))
+
+    def set_stable_time_step(self, nls, vec):
+        """
+        Set the time step to `dt_safety` times the critical time step
+        estimate.
+        """
+        conf = self.conf
+        ts = self.ts
+
+        if conf.wave_speed is not None:
+            var = next(self.context.get_variables().iter_state())
+            domain = var.field.domain
+            conn, gel = domain.get_conn(ret_gel=True)
+            coors = domain.get_mesh_coors()
+
+            # The minimum edge length of the cells in the field region.
+            cconn = conn[var.field.region.get_cells()]
+            edges = gel.edges
+            evecs = coors[cconn[:, edges[:, 1]]] - coors[cconn[:, edges[:, 0]]]
+            hmin = nm.sqrt((evecs**2).sum(axis=2).min())
+
+            dt_crit = hmin / (conf.wave_speed * nm.sqrt(domain.shape.dim))
+
+        else:
+            omega = self.estimate_max_frequency(nls, vec[:len(vec) // 3])
+            dt_crit = 2.0 / omega
+
+        dt = conf.dt_safety * dt_crit
+        n_step = int(nm.ceil((ts.t1 - ts.t0) / dt)) + 1
+        ts.set_from_data(ts.t0, ts.t1, n_step=n_step, step=ts.step)
+
+        nd = ts.n_digit
+        self.format = '====== time %%e (step %%%dd of %%%dd) =====' % (nd, nd)
+
+        output('critical time step estimate: %e, time step: %e, %d steps'
+               % (dt_crit, ts.dt, ts.n_step), verbose=self.verbose)
+
+    def get_initial_vec(self, nls, vec0, init_fun, prestep_fun, poststep_fun):
+        self.mass = None
+        if self.conf.dt_safety is not None:
+            def _init_fun(ts, vec0):
+                vec0 = init_fun(ts, vec0)
+                if self.conf.wave_speed is None:
+                    # The residual evaluations need the materials.
+                    prestep_fun(ts, vec0)
+
+                self.set_stable_time_step(nls, vec0)
+                return vec0
+
+        else:
+            _init_fun = init_fun
+
+        return ElastodynamicsBaseTS.get_initial_vec(
+            self, nls, vec0, _init_fun, prestep_fun, poststep_fun
+        )
+
+    @standard_ts_call
+    def __call__(self, vec0=None, nls=None, init_fun=None, prestep_fun=None,
+                 poststep_fun=None, status=None, **kwargs):
+        """
+        Solve elastodynamics problems by the explicit central difference
+        method.
+        """
+        nls = get_default(nls, self.nls)
+
+        vec, unpack, pack = self.get_initial_vec(
+            nls, vec0, init_fun, prestep_fun, poststep_fun)
+
+        ts = self.ts
+        for step, time in ts.iter_from(ts.step):
+            output(self.format % (time, step + 1, ts.n_step),
+                   verbose=self.verbose)
+            dt = ts.dt
+
+            prestep_fun(ts, vec)
+            ut, vt, at = unpack(vec)
+
+            vm = vt + 0.5 * dt * at
+            utp = ut + dt * vm
+            atp = self.get_acceleration(nls, utp, vm)
+            vtp = vm + 0.5 * dt * atp
+
+            vect = pack(utp, vtp, atp)
+            poststep_fun(ts, vect)
+
+            vec = vect
+
+        return vec
+
 class NewmarkTS(ElastodynamicsBaseTS):
     """
     Solve elastodynamics problems by the Newmark method.
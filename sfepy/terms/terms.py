@@ -23,6 +23,56 @@ _match_material_opt = re.compile('^opt_material(_[_a-zA-Z0-9]+)?$').match
 _match_material_root = re.compile('(.+)\.(.*)').match
 _match_ts = re.compile('^ts$').match
 
+_assembling_pools = {}
+
+def get_assembling_n_threads():
+    """
+    Get the number of threads for assembling according to the
+    `'assemble_n_threads'` global option, where 0 means all available cores.
+    """
+    import os
+
+    n_thread = goptions['assemble_n_threads']
+    if n_thread == 0:
+        n_thread = os.cpu_count() or 1
+
+    return n_thread
+
+def _get_assembling_pool(n_thread):
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = _assembling_pools.get(n_thread)
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=n_thread)
+        _assembling_pools[n_thread] = pool
+
+    return pool
+
+def _equal_fingerprints(items0, items1):
+    """
+    Compare two lists of items returned by
+    :func:`Term.get_matrix_fingerprint()`. Arrays are compared by value,
+    other items by identity.
+    """
+    if len(items0) != len(items1):
+        return False
+
+    for item0, item1 in zip(items0, items1):
+        if isinstance(item0, nm.ndarray):
+            if not (isinstance(item1, nm.ndarray)
+                    and (item0.shape == item1.shape)
+                    and nm.array_equal(item0, item1)):
+                return False
+
+        elif isinstance(item0, int):
+            if item0 != item1:
+                return False
+
+        elif item0 is not item1:
+            return False
+
+    return True
+
 def get_arg_kinds(arg_types):
     """
     Translate `arg_types` of a Term to a canonical form.
@@ -323,6 +373,15 @@ class Term(Struct):
     arg_shapes = {}
     integration = 'volume'
     geometries = ['1_2', '2_3', '2_4', '3_4', '3_8']
+    # If True, get_fargs() obtains all the per-cell data only using
+    # Term.get_args(), Term.get_mapping() and Term.get(), so that it can be
+    # called for chunks of cells, see Term.iter_evaluate().
+    can_chunk = False
+    # The slice of the region cells of the current chunk, see
+    # Term.iter_evaluate().
+    chunk_cells = None
+    # The cache of the cell matrices, see Term.set_matrix_caching().
+    matrix_cache = None
 
     @staticmethod
     def new(name, integral, region, **kwargs):
@@ -869,6 +928,11 @@ class Term(Struct):
                 mat, par_name = self.args[ii]
                 if mat is not None:
                     mat_data = mat.get_data((region_name, iorder), par_name)
+                    if ((self.chunk_cells is not None)
+                        and isinstance(mat_data, nm.ndarray)
+                        and (mat_data.ndim == 4) and (mat_data.shape[0] > 1)):
+                        # Quadrature point data of all the region cells.
+                        mat_data = mat_data[self.chunk_cells]
 
                 else:
                     mat_data = None
@@ -1092,6 +1156,10 @@ class Term(Struct):
                                          get_saved=get_saved,
                                          return_key=return_key)
 
+        if self.chunk_cells is not None:
+            ic = self.chunk_cells
+            out = (out[0].get_slice(ic.start, ic.stop),) + tuple(out[1:])
+
         return out
 
     def get_data_shape(self, variable):
@@ -1138,7 +1206,8 @@ class Term(Struct):
                                  integration=integration,
                                  step=step, time_derivative=time_derivative,
                                  is_trace=self.arg_traces[name], bf=bf,
-                                 trace_region=self.arg_trace_regions[name])
+                                 trace_region=self.arg_trace_regions[name],
+                                 cells=self.chunk_cells)
         return data
 
     def check_shapes(self, *args, **kwargs):
@@ -1384,6 +1453,41 @@ class Term(Struct):
         else:
             return out, status
 
+    def set_matrix_caching(self, enable=True):
+        """
+        Enable or disable caching of the term cell matrices in the 'weak'
+        evaluation mode with `diff_var`.
+
+        When enabled, the cell matrices are recomputed only if the data
+        returned by :func:`Term.get_matrix_fingerprint()` change, i.e. the
+        integral, the reference mappings, the material data or the
+        parameter variables data. It should be used only for terms whose
+        matrices do not depend on the state variables values.
+        """
+        self.matrix_cache = {} if enable else None
+
+    def get_matrix_fingerprint(self, args):
+        """
+        Get the data the term cell matrices depend on, for the term
+        arguments `args`, see :func:`Term.set_matrix_caching()`.
+        """
+        from sfepy.discrete.variables import FieldVariable
+
+        items = [self.integral, self.integral.order]
+        for arg in args:
+            if isinstance(arg, FieldVariable):
+                items.append(self.get_mapping(arg)[0])
+                if arg.is_parameter():
+                    items.append(arg().copy())
+
+            elif isinstance(arg, nm.ndarray):
+                items.append(arg.copy())
+
+            else:
+                items.append(arg)
+
+        return items
+
     def evaluate(self, mode='eval', diff_var=None,
                  standalone=True, ret_status=False, **kwargs):
         """
@@ -1469,35 +1573,54 @@ class Term(Struct):
 
                 shape = (n_elr, 1, n_row, n_col)
 
-            if shape[0] == 0:
-                vals = nm.zeros(shape, dtype=varr.dtype)
-                status = 0
+            entry = cache_key = None
+            if ((diff_var is not None)
+                and (self.matrix_cache is not None)
+                and not kwargs):
+                cache_key = (diff_var, term_mode)
+                fingerprint = self.get_matrix_fingerprint(args)
+                entry = self.matrix_cache.get(cache_key)
+                if ((entry is not None)
+                    and not _equal_fingerprints(entry[0], fingerprint)):
+                    entry = None
+
+            if entry is not None:
+                vals, iels, status = entry[1:]
 
             else:
-                _args = tuple(args) + (mode, term_mode, diff_var)
-                fargs = self.call_get_fargs(_args, kwargs)
+                if shape[0] == 0:
+                    vals = nm.zeros(shape, dtype=varr.dtype)
+                    status = 0
 
-                if varr.dtype == nm.float64:
-                    vals, status = self.eval_real(shape, fargs, mode,
-                                                  term_mode,
-                                                  diff_var, **kwargs)
+                else:
+                    _args = tuple(args) + (mode, term_mode, diff_var)
+                    fargs = self.call_get_fargs(_args, kwargs)
 
-                elif varr.dtype == nm.complex128:
-                    vals, status = self.eval_complex(shape, fargs, mode,
-                                                     term_mode,
-                                                     diff_var, **kwargs)
+                    if varr.dtype == nm.float64:
+                        vals, status = self.eval_real(shape, fargs, mode,
+                                                      term_mode,
+                                                      diff_var, **kwargs)
 
-                else:
-                    raise ValueError('unsupported term dtype! (%s)'
-                                     % varr.dtype)
+                    elif varr.dtype == nm.complex128:
+                        vals, status = self.eval_complex(shape, fargs, mode,
+                                                         term_mode,
+                                                         diff_var, **kwargs)
+
+                    else:
+                        raise ValueError('unsupported term dtype! (%s)'
+                                         % varr.dtype)
 
-            if not isinstance(vals, tuple):
-                vals *= self.sign
-                iels = self.get_assembling_cells(vals.shape)
+                if not isinstance(vals, tuple):
+                    vals *= self.sign
+                    iels = self.get_assembling_cells(vals.shape)
 
-            else:
-                vals = (self.sign * vals[0],) + vals[1:]
-                iels = None
+                else:
+                    vals = (self.sign * vals[0],) + vals[1:]
+                    iels = None
+
+                if cache_key is not None:
+                    self.matrix_cache[cache_key] = (fingerprint, vals, iels,
+                                                    status)
 
             out = (vals, iels)
 
@@ -1513,7 +1636,147 @@ class Term(Struct):
 
         return out
 
-    def assemble_to(self, asm_obj, val, iels, mode='vector', diff_var=None):
+    def get_chunk_size(self, shape, dtype):
+        """
+        Get the number of cells in a chunk of the cell values with the given
+        `shape` and `dtype`, so that the values fit into the
+        `'eval_memory_limit'` global option.
+
+        Returns None, if the chunking is not needed or not supported by the
+        term.
+        """
+        limit = goptions['eval_memory_limit']
+        if (not limit) or (not self.can_chunk):
+            return None
+
+        itemsize = nm.dtype(dtype).itemsize
+        if nm.dtype(dtype) == nm.complex128:
+            # Real and imaginary parts are evaluated separately.
+            itemsize *= 2
+
+        cell_size = max(int(nm.prod(shape[1:])) * itemsize, 1)
+        chunk_size = max(int(limit * 2**20) // cell_size, 1)
+        if chunk_size >= shape[0]:
+            return None
+
+        return chunk_size
+
+    def iter_evaluate(self, mode='weak', diff_var=None, **kwargs):
+        """
+        Evaluate the term in the 'weak' mode in chunks of cells, so that
+        the cell values of a single chunk do not exceed the
+        `'eval_memory_limit'` global option, see
+        :func:`Term.get_chunk_size()`.
+
+        Yields
+        ------
+        vals : array
+            The cell values of a chunk.
+        iels : array of ints
+            The local cell indices of the chunk.
+        status : int
+            The flag indicating evaluation success (0) or failure (nonzero).
+        """
+        if (mode != 'weak') or not self.can_chunk:
+            yield self.evaluate(mode=mode, diff_var=diff_var,
+                                standalone=False, ret_status=True, **kwargs)
+            return
+
+        kwargs = kwargs.copy()
+        term_mode = kwargs.pop('term_mode', None)
+
+        varr = self.get_virtual_variable()
+        n_elr, n_qpr, dim, n_enr, n_cr = self.get_data_shape(varr)
+        n_row = n_cr * n_enr
+        if diff_var is None:
+            shape = (n_elr, 1, n_row, 1)
+
+        else:
+            varc = self.get_variables(as_list=False)[diff_var]
+            n_elc, n_qpc, dim, n_enc, n_cc = self.get_data_shape(varc)
+            shape = (n_elr, 1, n_row, n_cc * n_enc)
+
+        chunk_size = self.get_chunk_size(shape, varr.dtype)
+        if ((chunk_size is None)
+            or ((diff_var is not None)
+                and (self.matrix_cache is not None))):
+            yield self.evaluate(mode=mode, diff_var=diff_var,
+                                standalone=False, ret_status=True,
+                                term_mode=term_mode, **kwargs)
+            return
+
+        self.check_shapes(*self.get_args(**kwargs))
+        iels = self.get_assembling_cells(shape)
+
+        for ii in range(0, n_elr, chunk_size):
+            ic = slice(ii, min(ii + chunk_size, n_elr))
+            cshape = (ic.stop - ic.start,) + shape[1:]
+
+            # The materials, mappings and variable values are obtained for
+            # the chunk cells only.
+            self.chunk_cells = ic
+            try:
+                args = self.get_args(**kwargs)
+                _args = tuple(args) + (mode, term_mode, diff_var)
+                cfargs = self.call_get_fargs(_args, kwargs)
+
+            finally:
+                self.chunk_cells = None
+
+            if varr.dtype == nm.float64:
+                vals, status = self.eval_real(cshape, cfargs, mode,
+                                              term_mode, diff_var, **kwargs)
+
+            elif varr.dtype == nm.complex128:
+                vals, status = self.eval_complex(cshape, cfargs, mode,
+                                                 term_mode, diff_var,
+                                                 **kwargs)
+
+            else:
+                raise ValueError('unsupported term dtype! (%s)' % varr.dtype)
+
+            vals *= self.sign
+
+            if goptions['check_term_finiteness']:
+                assert_(nm.isfinite(vals).all(),
+                        msg='"%s" term values not finite!' % self.get_str())
+
+            yield vals, iels[ic], status
+
+    def get_assembling_sign(self, diff_var):
+        """
+        Get the sign (scaling factor) of the term matrix w.r.t. the state
+        variable `diff_var`, that is applied when assembling. It is `1 / dt`
+        for time derivatives of `diff_var`.
+        """
+        sign = 1.0
+        if self.arg_derivatives[diff_var.name]:
+            if not self.is_quasistatic or (self.step > 0):
+                sign *= 1.0 / self.dt
+
+            else:
+                sign = 0.0
+
+        return sign
+
+    def get_assembling_dof_conns(self, diff_var):
+        """
+        Get the row and column DOF connectivities of the term matrix w.r.t.
+        the state variable `diff_var`.
+        """
+        vvar = self.get_virtual_variable()
+        dc_type = self.get_dof_conn_type()
+
+        rdc = vvar.get_dof_conn(dc_type)
+
+        is_trace = self.arg_traces[diff_var.name]
+        trace_region = self.arg_trace_regions[diff_var.name]
+        cdc = diff_var.get_dof_conn(dc_type, is_trace, trace_region)
+
+        return rdc, cdc
+
+    def assemble_to(self, asm_obj, val, iels, mode='vector', diff_var=None,
+                    offsets=None):
         """
         Assemble the results of term evaluation.
 
@@ -1521,6 +1784,10 @@ class Term(Struct):
         elements/cells `iels` into a vector or a CSR sparse matrix `asm_obj`,
         depending on `mode`.
 
+        In `'matrix'` mode, `offsets` can be given as the `(row, column)`
+        offsets of the DOF indices. They are subtracted from the indices, so
+        that a block of the global matrix can be assembled into `asm_obj`.
+
         For terms with a dynamic connectivity (e.g. contact terms), in
         `'matrix'` mode, return the extra COO sparse matrix instead. The extra
         matrix has to be added to the global matrix by the caller. By default,
@@ -1549,7 +1816,8 @@ class Term(Struct):
                 dc = vvar.get_dof_conn(dc_type)
                 assert_(val.shape[2] == dc.shape[1])
 
-                assemble(asm_obj, val, iels, 1.0, dc)
+                self._call_assemble(assemble, (asm_obj, val, iels, 1.0, dc),
+                                    iels, dc, asm_obj.shape[0])
 
             else:
                 vals, rows, var = val
@@ -1578,23 +1846,24 @@ class Term(Struct):
                 and (val.dtype == nm.float64)):
                 val = val.astype(nm.complex128)
 
-            sign = 1.0
-            if self.arg_derivatives[svar.name]:
-                if not self.is_quasistatic or (self.step > 0):
-                    sign *= 1.0 / self.dt
-
-                else:
-                    sign = 0.0
+            sign = self.get_assembling_sign(svar)
 
             if not isinstance(val, tuple):
-                rdc = vvar.get_dof_conn(dc_type)
-
-                is_trace = self.arg_traces[svar.name]
-                trace_region = self.arg_trace_regions[svar.name]
-                cdc = svar.get_dof_conn(dc_type, is_trace, trace_region)
+                rdc, cdc = self.get_assembling_dof_conns(svar)
                 assert_(val.shape[2:] == (rdc.shape[1], cdc.shape[1]))
 
-                assemble(tmd[0], tmd[1], tmd[2], val, iels, sign, rdc, cdc)
+                n_dof = asm_obj.shape[0]
+                ardc, acdc = rdc, cdc
+                if offsets is not None:
+                    # Negative indices mark DOFs that are not assembled.
+                    ardc = nm.where(rdc >= 0, rdc - offsets[0], rdc)
+                    acdc = nm.where(cdc >= 0, cdc - offsets[1], cdc)
+                    n_dof += offsets[0]
+
+                # Use the unshifted rdc for the cached cell coloring.
+                self._call_assemble(assemble, (tmd[0], tmd[1], tmd[2], val,
+                                               iels, sign, ardc, acdc),
+                                    iels, rdc, n_dof)
 
             else:
                 from scipy.sparse import coo_matrix
@@ -1607,6 +1876,9 @@ class Term(Struct):
                     active = (rows >= 0) & (cols >= 0)
                     vals, rows, cols = vals[active], rows[active], cols[active]
 
+                if offsets is not None:
+                    rows, cols = rows - offsets[0], cols - offsets[1]
+
                 extra = coo_matrix((sign * vals, (rows, cols)),
                                    shape=asm_obj.shape)
 
@@ -1614,3 +1886,67 @@ class Term(Struct):
             raise ValueError('unknown assembling mode! (%s)' % mode)
 
         return extra
+
+    def _get_assembling_groups(self, iels, dc, n_dof, n_thread):
+        """
+        Get groups of positions in `iels` that can be assembled
+        concurrently, i.e. the cells in a group do not share any row DOFs.
+        Each group is split into at most `n_thread` chunks. All the cells of
+        `dc` are colored only once, the colors are cached for the given `dc`
+        array and sliced by `iels`, so that the cell chunks of
+        :func:`Term.iter_evaluate()` do not need to be colored again.
+
+        Returns None, if the cells cannot be colored.
+        """
+        from sfepy.base.base import output
+        from sfepy.discrete.common.extmods.assemble import color_cells
+
+        cache = getattr(self, '_asm_colors', None)
+        if (cache is None) or (cache[0] is not dc):
+            cells = nm.arange(dc.shape[0], dtype=nm.int32)
+            colors, n_color = color_cells(cells, dc, n_dof)
+            if colors is None:
+                output('term %s: more than 64 colors needed,'
+                       ' threaded assembling not used!' % self.get_str())
+
+            cache = self._asm_colors = (dc, colors, n_color)
+
+        colors, n_color = cache[1:]
+        if colors is None:
+            return None
+
+        colors = colors[iels]
+        order = nm.argsort(colors, kind='stable').astype(nm.int32)
+        counts = nm.bincount(colors, minlength=n_color)
+        groups = []
+        for ii in nm.split(order, nm.cumsum(counts)[:-1]):
+            chunks = [nm.ascontiguousarray(chunk)
+                      for chunk in nm.array_split(ii, n_thread)
+                      if len(chunk)]
+            if len(chunks):
+                groups.append(chunks)
+
+        return groups
+
+    def _call_assemble(self, assemble, args, iels, dc, n_dof):
+        """
+        Call the low-level `assemble` function either serially or, if
+        `'assemble_n_threads'` global option allows it, in parallel
+        threads over groups of cells that do not share row DOFs.
+        """
+        n_thread = get_assembling_n_threads()
+        # Threads do not pay off for small numbers of cells.
+        if (n_thread < 2) or (len(iels) < 1000 * n_thread):
+            assemble(*args)
+            return
+
+        groups = self._get_assembling_groups(iels, dc, n_dof, n_thread)
+        if groups is None:
+            assemble(*args)
+            return
+
+        pool = _get_assembling_pool(n_thread)
+        for chunks in groups:
+            futures = [pool.submit(assemble, *args, ii=ii) for ii in chunks]
+            for future in futures:
+                future.result()
@@ -27,6 +27,7 @@ class DiffusionTerm(Term):
         - parameter_2 : :math:`r`
     """
     name = 'dw_diffusion'
+    can_chunk = True
     arg_types = (('material', 'virtual', 'state'),
                  ('material', 'parameter_1', 'parameter_2'))
     arg_shapes = {'material' : 'D, D', 'virtual' : (1, 'state'),
@@ -40,6 +40,7 @@ class DotProductTerm(Term):
         - parameter_2 : :math:`r` or :math:`\ul{w}`
     """
     name = 'dw_dot'
+    can_chunk = True
     arg_types = (('opt_material', 'virtual', 'state'),
                  ('opt_material', 'parameter_1', 'parameter_2'))
     arg_shapes_dict = {
@@ -43,6 +43,7 @@ class LinearElasticTerm(Term):
         - parameter_2 : :math:`\ul{u}`
     """
     name = 'dw_lin_elastic'
+    can_chunk = True
     arg_types = (('material', 'virtual', 'state'),
                  ('material', 'parameter_1', 'parameter_2'))
     arg_shapes = {'material' : 'S, S', 'virtual' : ('D', 'state'),
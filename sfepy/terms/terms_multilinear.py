@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import numpy as nm
 
 try:
@@ -21,6 +23,12 @@ try:
 except ImportError:
     jnp = jax = None
 
+try:
+    import numba
+
+except ImportError:
+    numba = None
+
 from pyparsing import (Word, Suppress, oneOf, OneOrMore, delimitedList,
                        Combine, alphas, alphanums, Literal)
 
@@ -29,6 +37,164 @@ from sfepy.base.timing import Timer
 from sfepy.mechanics.tensors import dim2sym
 from sfepy.terms.terms import Term
 
+# The in-memory cache of einsum contraction paths of all terms, bounded by
+# _paths_cache_size, see ETermBase.get_paths().
+_paths_cache = OrderedDict()
+_paths_cache_size = 1000
+
+def get_paths_key(backend, optimize, memory_limit, layout, expressions,
+                  operands):
+    """
+    Get a hash key of the einsum contraction paths of `expressions` with
+    `operands`. Only the operand shapes and dtypes enter the key.
+    """
+    import hashlib
+
+    sha1 = hashlib.sha1()
+    sha1.update(repr((backend, optimize, memory_limit, layout)).encode())
+    for expression, ops in zip(expressions, operands):
+        sha1.update(expression.encode())
+        sha1.update(repr([(op.shape, str(op.dtype)) for op in ops]).encode())
+
+    return sha1.hexdigest()
+
+def load_paths(cache_dir, key):
+    """
+    Load the einsum contraction paths and path information strings stored
+    under `key` in `cache_dir`.
+
+    Returns
+    -------
+    paths, path_infos : tuples or None
+        The paths and the path information strings, or None, if the paths are
+        not in the cache.
+    """
+    import json
+    import os.path as op
+
+    filename = op.join(cache_dir, 'paths-%s.json' % key)
+    if not op.exists(filename):
+        return None, None
+
+    try:
+        with open(filename, 'r') as fd:
+            data = json.load(fd)
+
+        # JSON stores tuples as lists.
+        paths = tuple(None if path is None
+                      else tuple(item if isinstance(item, str)
+                                 else tuple(item) for item in path)
+                      for path in data['paths'])
+        path_infos = tuple(data['path_infos'])
+
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+    return paths, path_infos
+
+def save_paths(cache_dir, key, paths, path_infos):
+    """
+    Save the einsum contraction paths and path information strings under
+    `key` in `cache_dir` as JSON, see :func:`write_file_atomic()
+    <sfepy.base.ioutils.write_file_atomic()>`.
+    """
+    import json
+    import os.path as op
+
+    from sfepy.base.ioutils import write_file_atomic
+
+    data = {
+        'paths' : [None if path is None
+                   else [item if isinstance(item, str)
+                         else [int(ii) for ii in item] for item in path]
+                   for path in paths],
+        'path_infos' : list(path_infos),
+    }
+    filename = op.join(cache_dir, 'paths-%s.json' % key)
+    write_file_atomic(filename, lambda fd: json.dump(data, fd), mode='w')
+
+_numba_kernels = {}
+
+def make_numba_kernel(expression, dtype=nm.float64):
+    """
+    Generate and compile a fused kernel evaluating the einsum `expression`
+    in a parallel loop over cells. The summation accumulator has the
+    output `dtype`.
+
+    The output subscripts have to start with the cell index 'c'. The kernel
+    loops over the output indices and then over the summation indices, and
+    the product of the operands is built incrementally, so that each operand
+    is multiplied in the outermost loop where all its indices are known. The
+    kernel signature is `kernel(out, *operands)` and it adds the result to
+    `out`.
+    """
+    subs, out_subs = expression.split('->')
+    subs = subs.split(',')
+    if not out_subs.startswith('c'):
+        raise ValueError('output subscripts do not start with "c"! (%s)'
+                         % expression)
+
+    # Summation indices shared by more operands go first.
+    sum_subs = sorted(set(''.join(subs)).difference(out_subs),
+                      key=lambda x: (-sum(x in sub for sub in subs), x))
+    loop_subs = list(out_subs) + sum_subs
+
+    levels = [max(loop_subs.index(letter) for letter in sub) for sub in subs]
+
+    ops = ['op%d' % io for io in range(len(subs))]
+    lines = ['def kernel(out, %s):' % ', '.join(ops)]
+    for letter in loop_subs:
+        io = [ii for ii, sub in enumerate(subs) if letter in sub][0]
+        lines.append('    n_%s = %s.shape[%d]'
+                     % (letter, ops[io], subs[io].index(letter)))
+
+    zero = '0j' if nm.issubdtype(dtype, nm.complexfloating) else '0.0'
+
+    n_out = len(out_subs)
+    ind = '    '
+    for ik, letter in enumerate(loop_subs):
+        if ik == n_out:
+            lines.append(ind + 'acc = %s' % zero)
+
+        lines.append(ind + 'for i_%s in %s(n_%s):'
+                     % (letter, 'prange' if ik == 0 else 'range', letter))
+        ind += '    '
+
+        factors = ['t%d' % (ik - 1) if ik > 0 else '1.0']
+        for io, sub in enumerate(subs):
+            if levels[io] == ik:
+                factors.append('%s[%s]' % (ops[io], ', '.join('i_%s' % ii
+                                                              for ii in sub)))
+        lines.append(ind + 't%d = %s' % (ik, ' * '.join(factors)))
+
+    last = 't%d' % (len(loop_subs) - 1)
+    oindex = ', '.join('i_%s' % ii for ii in out_subs)
+    if sum_subs:
+        lines.append(ind + 'acc += %s' % last)
+        lines.append('    ' * (n_out + 1) + 'out[%s] += acc' % oindex)
+
+    else:
+        lines.append(ind + 'out[%s] += %s' % (oindex, last))
+
+    namespace = {'prange' : numba.prange}
+    exec('\n'.join(lines), namespace)
+
+    return numba.njit(parallel=True)(namespace['kernel'])
+
+def get_numba_kernel(expression, dtype=nm.float64):
+    """
+    Get the compiled kernel of `expression` for the output `dtype`, see
+    :func:`make_numba_kernel()`. The kernels are cached for all terms in the
+    process.
+    """
+    key = (expression, nm.dtype(dtype).char)
+    kernel = _numba_kernels.get(key)
+    if kernel is None:
+        kernel = make_numba_kernel(expression, dtype=dtype)
+        _numba_kernels[key] = kernel
+
+    return kernel
+
 def _get_char_map(c1, c2):
     mm = {}
     for ic, char in enumerate(c1):
@@ -250,6 +416,7 @@ class ExpressionBuilder(Struct):
         self.operand_names = [[] for ia in range(n_add)]
         self.components = [[] for ia in range(n_add)]
         self.out_subscripts = ['c' for ia in range(n_add)]
+        self.diff_subscripts = ['' for ia in range(n_add)]
         self.ia = 0
         self.cache = cache
         self.aux_letters = iter(self._aux_letters)
@@ -399,6 +566,7 @@ class ExpressionBuilder(Struct):
                         self.add_psg(iic, ein, arg.name, iia)
 
             self.out_subscripts[self.ia] += out_letters
+            self.diff_subscripts[self.ia] = out_letters
             self.ia += 1
 
     def add_material_arg(self, arg, ii, ein):
@@ -645,6 +813,7 @@ class ETermBase(Term):
         'dask_threads' : da,
         'opt_einsum_dask_single' : oe and da,
         'opt_einsum_dask_threads' : oe and da,
+        'numba' : numba,
     }
 
     layout_letters = 'cqgvd0'
@@ -921,6 +1090,17 @@ class ETermBase(Term):
 
                 out[:] = _out.compute(scheduler=scheduler).reshape(out.shape)
 
+        elif self.backend == 'numba':
+            def eval_einsum(out, eshape, expressions, operands, paths):
+                out[...] = 0.0
+                for ia in range(n_add):
+                    subs, out_subs = expressions[ia].split('->')
+                    oshape = get_output_shape(out_subs, subs.split(','),
+                                              operands[ia])
+                    kernel = get_numba_kernel(expressions[ia],
+                                              dtype=out.dtype)
+                    kernel(out.reshape(oshape), *operands[ia])
+
         elif self.backend.startswith('opt_einsum_dask'):
             scheduler = {'opt_einsum_dask_single' : 'single-threaded',
                          'opt_einsum_dask_threads' : 'threads'}[self.backend]
@@ -953,8 +1133,44 @@ class ETermBase(Term):
         return get_einsum_ops(einfo.eargs, einfo.ebuilder, self.expr_cache)
 
     def get_paths(self, expressions, operands):
+        """
+        Get the einsum contraction paths of `expressions` with `operands`.
+
+        The paths are cached in memory for all terms in the process, keyed by
+        the expressions, the operand shapes, the layout and the backend
+        settings. At most `_paths_cache_size` recently used paths are kept.
+        If the `paths_cache_dir` backend argument is given, the paths are also
+        cached in that directory as JSON files, so that they can be shared
+        among processes and runs.
+        """
         memory_limit = self.backend_kwargs.get('memory_limit')
+        cache_dir = self.backend_kwargs.get('paths_cache_dir')
 
+        key = get_paths_key(self.backend, self.optimize, memory_limit,
+                            self.layout, expressions, operands)
+        paths, path_infos = _paths_cache.get(key, (None, None))
+        if paths is not None:
+            _paths_cache.move_to_end(key)
+            return paths, path_infos
+
+        if cache_dir is not None:
+            paths, path_infos = load_paths(cache_dir, key)
+
+        if paths is None:
+            paths, path_infos = self._get_paths(expressions, operands,
+                                                memory_limit)
+            path_infos = tuple(str(info) for info in path_infos)
+
+            if cache_dir is not None:
+                save_paths(cache_dir, key, paths, path_infos)
+
+        while len(_paths_cache) >= _paths_cache_size:
+            _paths_cache.popitem(last=False)
+        _paths_cache[key] = (paths, path_infos)
+
+        return paths, path_infos
+
+    def _get_paths(self, expressions, operands, memory_limit):
         if ('numpy' in self.backend) or self.backend.startswith('dask'):
             optimize = (self.optimize if memory_limit is None
                         else (self.optimize, memory_limit))
@@ -982,6 +1198,11 @@ class ETermBase(Term):
             paths = tuple(paths)
             path_infos = tuple(path_infos)
 
+        elif self.backend == 'numba':
+            # The fused kernels do not use contraction paths.
+            paths = (None,) * len(operands)
+            path_infos = ('fused numba kernel',) * len(operands)
+
         else:
             raise ValueError('unsupported backend! ({})'.format(self.backend))
 
@@ -1063,6 +1284,77 @@ class ETermBase(Term):
 
         return out
 
+    def get_matvec_function(self, diff_var):
+        """
+        Get a function applying the term matrices w.r.t. the state variable
+        `diff_var` in the cells to cell vectors, without evaluating the
+        matrices.
+
+        The einsum expressions of the matrices are contracted with the cell
+        vectors in place of the `diff_var` DOF axes.
+
+        Returns
+        -------
+        matvec : function
+            The function `matvec(xe, adjoint=False)`, where `xe` is the
+            array of the cell vectors of shape `(n_el, n_col)`, returning the
+            array of shape `(n_el, n_row)` of the products with the term
+            matrices or with their adjoints.
+        """
+        args = tuple(self.get_args()) + ('weak', None, diff_var)
+        self.get_function(*args)
+
+        einfo = self.einfos[diff_var]
+        ebuilder = einfo.ebuilder
+        operands = self.get_operands(diff_var)
+
+        vn_c = [arg.n_components for arg in einfo.eargs
+                if arg.kind == 'virtual'][0]
+        sn_c = [arg.n_components for arg in einfo.eargs
+                if (arg.kind == 'state') and (arg.name == diff_var)][0]
+
+        expressions = {}
+        for ia in range(ebuilder.n_add):
+            dsubs = ebuilder.diff_subscripts[ia]
+            vsubs = ebuilder.out_subscripts[ia][1:].replace(dsubs, '')
+            subscripts = ebuilder.subscripts[ia]
+            expressions[ia, False] = ebuilder.join_subscripts(
+                subscripts + ['c' + dsubs], 'c' + vsubs,
+            )
+            expressions[ia, True] = ebuilder.join_subscripts(
+                subscripts + ['c' + vsubs], 'c' + dsubs,
+            )
+
+        def _conj(ar):
+            return nm.conj(ar) if nm.iscomplexobj(ar) else ar
+
+        paths = {}
+        def matvec(xe, adjoint=False):
+            n_c = vn_c if adjoint else sn_c
+            n_el = xe.shape[0]
+            xe = xe.reshape((n_el, n_c, -1) if n_c > 1 else (n_el, -1))
+            if adjoint:
+                # A^H x = conj(A^T conj(x)).
+                xe = _conj(xe)
+
+            ye = 0
+            for ia in range(ebuilder.n_add):
+                key = (ia, adjoint)
+                ops = operands[ia] + [xe]
+                if key not in paths:
+                    paths[key] = nm.einsum_path(expressions[key], *ops,
+                                                optimize='greedy')[0]
+
+                ye = ye + nm.einsum(expressions[key], *ops,
+                                    optimize=paths[key])
+
+            if adjoint:
+                ye = _conj(ye)
+
+            return ye.reshape((n_el, -1))
+
+        return matvec
+
     def get_eval_shape(self, *args, **kwargs):
         mode, term_mode, diff_var = args[-3:]
         if diff_var is not None:
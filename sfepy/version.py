@@ -21,6 +21,7 @@ PYVISTA_MIN_VERSION='0.23.0'
 OPT_EINSUM_MIN_VERSION='3.0.0'
 JAX_MIN_VERSION='0.2.0'
 DASK_MIN_VERSION='2.0.0'
+NUMBA_MIN_VERSION='0.50.0'
 
 CYTHON_MIN_VERSION = '0.14.1'
 
@@ -47,7 +47,9 @@ helps = {
     'output_format' :
     'output file format, one of: {vtk, h5} [default: vtk]',
     'save_restart' :
-    'if given, save restart files according to the given mode.',
+    'if given, save restart files according to the given mode: -1 means'
+    ' keeping only the last restart file, n > 0 means saving checkpoint'
+    ' chains of n time steps.',
     'load_restart' :
     'if given, load the given restart file',
     'log' :
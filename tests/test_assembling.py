@@ -106,3 +106,99 @@ class Test(TestCommon):
                                   label1='assembled',
                                   label2='expected')
         return ok
+
+    def test_assemble_colored(self):
+        from sfepy.discrete.common.extmods.assemble import (assemble_vector,
+                                                            assemble_matrix,
+                                                            color_cells)
+
+        colors, n_color = color_cells(self.iels, self.conn, self.num)
+        self.report('colors:', colors, n_color)
+        ok = (n_color == 2) and (colors[0] != colors[1])
+
+        vec = nm.zeros(self.num, dtype=nm.float64)
+        mtx = sps.csr_matrix(nm.ones((self.num, self.num),
+                                     dtype=nm.float64))
+        mtx.data[:] = 0.0
+        for ic in range(n_color):
+            ii = nm.where(colors == ic)[0].astype(nm.int32)
+            assemble_vector(vec, self.vec_in_els, self.iels, 1, self.conn,
+                            ii=ii)
+            assemble_matrix(mtx.data, mtx.indptr, mtx.indices,
+                            self.mtx_in_els, self.iels, 1,
+                            self.conn, self.conn, ii=ii)
+
+        aux = nm.array([1, 1, 3, 2, 2], dtype=nm.float64)
+        _ok = self.compare_vectors(vec, aux,
+                                   label1='assembled',
+                                   label2='expected')
+        ok = ok and _ok
+
+        aux = nm.array([[1, 1, 1, 0, 0],
+                        [1, 1, 1, 0, 0],
+                        [1, 1, 3, 2, 2],
+                        [0, 0, 2, 2, 2],
+                        [0, 0, 2, 2, 2]], dtype=nm.float64)
+        _ok = self.compare_vectors(mtx, aux,
+                                   label1='assembled',
+                                   label2='expected')
+        ok = ok and _ok
+
+        return ok
+
+    def test_assemble_threads(self):
+        from sfepy.base.goptions import goptions
+        from sfepy.discrete import (FieldVariable, Material, Problem,
+                                    Equation, Equations, Integral)
+        from sfepy.discrete.fem import FEDomain, Field
+        from sfepy.terms import Term
+        from sfepy.mesh.mesh_generators import gen_block_mesh
+
+        # The threads are used only for enough cells.
+        mesh = gen_block_mesh([1, 1], [81, 81], [0, 0], verbose=False)
+        domain = FEDomain('domain', mesh)
+        omega = domain.create_region('Omega', 'all')
+        field = Field.from_args('fu', nm.float64, 1, omega, approx_order=1)
+
+        u = FieldVariable('u', 'unknown', field)
+        v = FieldVariable('v', 'test', field, primary_var_name='u')
+
+        m = Material('m', c=2.0, f=1.0)
+        integral = Integral('i', order=2)
+        t1 = Term.new('dw_laplace(m.c, v, u)',
+                      integral, omega, m=m, v=v, u=u)
+        t2 = Term.new('dw_volume_lvf(m.f, v)', integral, omega, m=m, v=v)
+        eqs = Equations([Equation('eq', t1 + t2)])
+
+        pb = Problem('assemble_threads', equations=eqs)
+        pb.time_update()
+        pb.update_materials()
+
+        ev = pb.get_evaluator()
+        vec = nm.random.RandomState(0).rand(pb.equations.variables.adi.ptr[-1])
+
+        n_thread0 = goptions['assemble_n_threads']
+        vals = []
+        try:
+            for n_thread in [1, 2]:
+                goptions['assemble_n_threads'] = n_thread
+                rvec = ev.eval_residual(vec).copy()
+                mtx = ev.eval_tangent_matrix(vec).copy()
+                vals.append((rvec, mtx))
+
+        finally:
+            goptions['assemble_n_threads'] = n_thread0
+
+        ok = getattr(t1, '_asm_colors', None) is not None
+        self.report('colored threaded assembling used:', ok)
+
+        (rvec0, mtx0), (rvec1, mtx1) = vals
+        _ok = nm.allclose(rvec1, rvec0, rtol=1e-12, atol=1e-12)
+        self.report('vectors equal:', _ok)
+        ok = ok and _ok
+
+        _ok = abs(mtx1 - mtx0).max() < 1e-12
+        self.report('matrices equal:', _ok)
+        ok = ok and _ok
+
+        return ok
@@ -184,6 +184,59 @@ class Test( TestCommon ):
 
         return True
 
+    def test_batched_material_function(self):
+        from sfepy.discrete import Material, Integral, Equation, Equations
+        from sfepy.discrete.functions import BatchedMaterialFunction
+        from sfepy.terms import Term
+
+        problem = self.problem
+        ts = problem.get_default_ts(step=0)
+
+        variables = problem.create_variables(['p', 'q'])
+        p, q = variables['p'], variables['q']
+        p.set_data(p.field.get_coor()[:, 0]**2)
+
+        calls = []
+        def get_k(ts, coors, inputs, outputs, history, **kwargs):
+            calls.append(coors.shape)
+            gp = inputs['grad_p']
+            outputs['k'][..., 0, 0] = 1.0 + gp[..., 0, 0]**2
+            history['n_call'] = history.get('n_call', 0) + 1
+
+        fun = BatchedMaterialFunction('get_k', get_k,
+                                      inputs={'grad_p' : ('p', 'grad')},
+                                      outputs={'k' : (1, 1)})
+        mat = Material('mb', function=fun)
+
+        omega = problem.domain.regions['Omega']
+        integral = Integral('i', order=2)
+        t1 = Term.new('dw_laplace(mb.k, q, p)', integral, omega,
+                      mb=mat, q=q, p=p)
+        t2 = Term.new('dw_dot(mb.k, q, p)', integral, omega,
+                      mb=mat, q=q, p=p)
+        eqs = Equations([Equation('eq', t1 + t2)])
+
+        mat.time_update(ts, eqs, mode='force', problem=problem)
+        # The terms share the data key -> a single call.
+        ok = len(calls) == 1
+        self.report('number of calls:', len(calls), ok)
+
+        qps = t1.get_physical_qps()
+        val = mat.get_data(t1.get_qp_key(), 'k')
+        _ok = nm.allclose(val.ravel(), 1.0 + 4.0 * qps.values[:, 0]**2,
+                          rtol=0.0, atol=1e-12)
+        self.report('batched values:', _ok)
+        ok = ok and _ok
+
+        buf = fun.buffers[t1.get_qp_key()]['k']
+        mat.time_update(ts, eqs, mode='force', problem=problem)
+        _ok = ((fun.buffers[t1.get_qp_key()]['k'] is buf)
+               and (fun.histories[t1.get_qp_key()]['n_call'] == 2))
+        self.report('buffers and history reused:', _ok)
+        ok = ok and _ok
+
+        return ok
+
     def test_ebc_functions(self):
         import os.path as op
         problem = self.problem
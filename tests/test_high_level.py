@@ -203,3 +203,211 @@ class Test(TestCommon):
         ok = ok and _ok
 
         return ok
+
+    def test_matrix_graph_cache(self):
+        from sfepy.discrete import (FieldVariable, Material, Problem,
+                                    Equation, Equations, Integral)
+        from sfepy.discrete.conditions import Conditions, EssentialBC
+        from sfepy.discrete.equations import get_matrix_graph_key
+        from sfepy.terms import Term
+
+        u = FieldVariable('u', 'unknown', self.field)
+        v = FieldVariable('v', 'test', self.field, primary_var_name='u')
+
+        m = Material('m', val=1.0)
+        integral = Integral('i', order=3)
+        t1 = Term.new('dw_dot(m.val, v, u)',
+                      integral, self.omega, m=m, v=v, u=u)
+        eqs = Equations([Equation('eq', t1)])
+
+        pb = Problem('graph', equations=eqs)
+        fix_u = EssentialBC('fix_u', self.gamma1, {'u.all' : 0.0})
+        pb.time_update(ebcs=Conditions([fix_u]))
+
+        cache_dir = op.join(self.options.out_dir, 'graph_cache')
+        mtx0 = eqs.create_matrix_graph(verbose=False)
+        mtx1 = eqs.create_matrix_graph(cache_dir=cache_dir, verbose=False)
+        mtx2 = eqs.create_matrix_graph(cache_dir=cache_dir, verbose=False)
+
+        ok = True
+        for mtx in (mtx1, mtx2):
+            _ok = ((mtx.shape == mtx0.shape)
+                   and nm.all(mtx.indptr == mtx0.indptr)
+                   and nm.all(mtx.indices == mtx0.indices))
+            self.report('cached graph equal:', _ok)
+            ok = ok and _ok
+
+        rdcs, cdcs = eqs.get_graph_conns()
+        key = get_matrix_graph_key(mtx0.shape, rdcs, cdcs)
+        _ok = op.exists(op.join(cache_dir, 'graph-%s.npz' % key))
+        self.report('graph stored in cache:', _ok)
+        ok = ok and _ok
+
+        pb.time_update(ebcs=Conditions([]))
+        rdcs, cdcs = eqs.get_graph_conns()
+        _ok = get_matrix_graph_key(eqs.variables.get_matrix_shape(),
+                                   rdcs, cdcs) != key
+        self.report('key changes with EBCs:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_matrix_free(self):
+        from sfepy.discrete import (FieldVariable, Material, Problem,
+                                    Equation, Equations, Integral)
+        from sfepy.discrete.conditions import Conditions, EssentialBC
+        from sfepy.terms import Term
+        from sfepy.mechanics.matcoefs import stiffness_from_lame
+
+        u = FieldVariable('u', 'unknown', self.field)
+        v = FieldVariable('v', 'test', self.field, primary_var_name='u')
+
+        m = Material('m', D=stiffness_from_lame(self.dim, 1.0, 1.0), rho=2.0)
+        integral = Integral('i', order=3)
+        t1 = Term.new('dw_lin_elastic(m.D, v, u)',
+                      integral, self.omega, m=m, v=v, u=u)
+        t2 = Term.new('dw_dot(m.rho, v, u)',
+                      integral, self.omega, m=m, v=v, u=u)
+        eqs = Equations([Equation('balance', t1 + t2)])
+
+        pb = Problem('matrix_free', equations=eqs)
+        fix_u = EssentialBC('fix_u', self.gamma1, {'u.all' : 0.0})
+        pb.time_update(ebcs=Conditions([fix_u]))
+        pb.update_materials()
+
+        ev = pb.get_evaluator()
+        vec = pb.equations.create_stripped_state_vector()
+        mtx = ev.eval_tangent_matrix(vec)
+        op = ev.eval_tangent_operator(vec)
+
+        x = nm.random.RandomState(0).rand(mtx.shape[1])
+        ok = op.shape == mtx.shape
+        _ok = nm.allclose(op.matvec(x), mtx * x, rtol=1e-12, atol=1e-12)
+        self.report('matvec:', _ok)
+        ok = ok and _ok
+
+        _ok = nm.allclose(op.rmatvec(x), mtx.T * x, rtol=1e-12, atol=1e-12)
+        self.report('rmatvec:', _ok)
+        ok = ok and _ok
+
+        # The cell matrices of both terms are summed, no other arrays are
+        # stored.
+        vals = t1.evaluate(mode='weak', diff_var='u', standalone=False)[0]
+        mtx_nbytes = mtx.data.nbytes + mtx.indices.nbytes + mtx.indptr.nbytes
+        self.report('operator memory: %d, cell matrices of one term: %d,'
+                    ' CSR matrix: %d' % (op.nbytes, vals.nbytes, mtx_nbytes))
+        _ok = (len(op.blocks) == 1) and (op.nbytes == vals.nbytes)
+        self.report('operator memory:', _ok)
+        ok = ok and _ok
+
+        # The multi-linear terms are applied without the cell matrices.
+        t3 = Term.new('de_lin_elastic(m.D, v, u)',
+                      integral, self.omega, m=m, v=v, u=u)
+        t4 = Term.new('de_dot(m.rho, v, u)',
+                      integral, self.omega, m=m, v=v, u=u)
+        pb.set_equations_instance(Equations([Equation('balance', t3 + t4)]))
+        pb.time_update(ebcs=Conditions([fix_u]))
+        pb.update_materials()
+
+        ev = pb.get_evaluator()
+        op = ev.eval_tangent_operator(vec)
+
+        _ok = (op.nbytes == 0)
+        self.report('no cell matrices:', _ok)
+        ok = ok and _ok
+
+        _ok = nm.allclose(op.matvec(x), mtx * x, rtol=1e-12, atol=1e-12)
+        self.report('e-terms matvec:', _ok)
+        ok = ok and _ok
+
+        _ok = nm.allclose(op.rmatvec(x), mtx.T * x, rtol=1e-12, atol=1e-12)
+        self.report('e-terms rmatvec:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_matrix_caching(self):
+        from sfepy.discrete import (FieldVariable, Material, Problem,
+                                    Equation, Equations, Integral)
+        from sfepy.terms import Term
+
+        u = FieldVariable('u', 'unknown', self.field)
+        v = FieldVariable('v', 'test', self.field, primary_var_name='u')
+
+        m = Material('m', rho=2.0)
+        integral = Integral('i', order=3)
+        term = Term.new('dw_dot(m.rho, v, u)',
+                        integral, self.omega, m=m, v=v, u=u)
+        eqs = Equations([Equation('mass', term)])
+
+        pb = Problem('matrix_caching', equations=eqs)
+        pb.time_update()
+        pb.update_materials()
+
+        term.set_matrix_caching()
+        val0 = term.evaluate(mode='weak', diff_var='u', standalone=False)[0]
+        val1 = term.evaluate(mode='weak', diff_var='u', standalone=False)[0]
+        ok = val1 is val0
+        self.report('cached values reused:', ok)
+
+        key = m.get_keys(region_name=self.omega.name)[0]
+        rho = m.get_data(key, 'rho')
+        rho *= 3.0
+        val2 = term.evaluate(mode='weak', diff_var='u', standalone=False)[0]
+        _ok = (val2 is not val0) and nm.allclose(val2, 3.0 * val0)
+        self.report('cache invalidated on material change:', _ok)
+        ok = ok and _ok
+
+        term.set_matrix_caching(False)
+        val3 = term.evaluate(mode='weak', diff_var='u', standalone=False)[0]
+        _ok = (val3 is not val2) and nm.allclose(val3, val2)
+        self.report('caching disabled:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_output_session(self):
+        from sfepy.discrete import (FieldVariable, Material, Problem,
+                                    Equation, Equations, Integral)
+        from sfepy.terms import Term
+
+        u = FieldVariable('u', 'unknown', self.field)
+        v = FieldVariable('v', 'test', self.field, primary_var_name='u')
+
+        m = Material('m', rho=2.0)
+        integral = Integral('i', order=3)
+        term = Term.new('dw_dot(m.rho, v, u)',
+                        integral, self.omega, m=m, v=v, u=u)
+        eqs = Equations([Equation('mass', term)])
+
+        pb = Problem('output_session', equations=eqs)
+        ok = not pb.keep_output_open
+        self.report('files not kept open by default:', ok)
+
+        pb.setup_output(output_format='h5', keep_output_open=True,
+                        max_output_open=2)
+        pb.open_output_session()
+
+        filenames = [op.join(self.options.out_dir,
+                             'test_output_session_%d.h5' % ii)
+                     for ii in range(3)]
+        mios = [pb._get_output_io(filename) for filename in filenames[:2]]
+        # Use the first file again, so that the second one is closed when
+        # the third one is opened.
+        mios.append(pb._get_output_io(filenames[0]))
+        mios.append(pb._get_output_io(filenames[2]))
+
+        _ok = ((list(pb.output_ios.keys()) == [filenames[0], filenames[2]])
+               and (mios[2] is mios[0])
+               and (mios[0].session is not None)
+               and (mios[1].session is None))
+        self.report('number of open files bounded:', _ok)
+        ok = ok and _ok
+
+        pb.close_output()
+        _ok = ((pb.output_ios is None)
+               and all(mio.session is None for mio in mios))
+        self.report('files closed:', _ok)
+        ok = ok and _ok
+
+        return ok
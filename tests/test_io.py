@@ -69,3 +69,178 @@ class Test( TestCommon ):
         assert_( test == test2 )
 
         return True
+
+    def test_background_writer(self):
+        import threading
+        from sfepy.base.ioutils import BackgroundWriter
+
+        writer = BackgroundWriter(queue_size=1)
+
+        written = []
+        def write(ii, data):
+            written.append((ii, data.sum()))
+
+        data = nm.arange(10.0)
+        for ii in range(5):
+            writer.submit(write, ii, data * ii)
+        writer.flush()
+
+        self.report('written:', written)
+        ok = written == [(ii, 45.0 * ii) for ii in range(5)]
+
+        def fail():
+            raise IOError('write failed')
+
+        try:
+            # The error is raised either by submit() or by flush().
+            writer.submit(fail)
+            writer.submit(write, 5, data)
+            writer.flush()
+
+        except IOError:
+            _ok = len(written) == 5
+
+        else:
+            _ok = False
+
+        self.report('error re-raised, later write skipped:', _ok)
+        ok = ok and _ok
+
+        def get_thread_name(ii):
+            written.append((ii, 0.0))
+            return threading.current_thread().name
+
+        writer.submit(write, 6, data)
+        name = writer.call(get_thread_name, 7)
+        _ok = ((name == writer.name) and (written[-2][0] == 6)
+               and (written[-1][0] == 7))
+        self.report('call in writer thread after pending writes:', _ok)
+        ok = ok and _ok
+
+        try:
+            writer.call(fail)
+
+        except IOError:
+            _ok = writer.is_running()
+
+        else:
+            _ok = False
+
+        self.report('call error re-raised:', _ok)
+        ok = ok and _ok
+
+        writer.close()
+        _ok = not writer.is_running()
+        self.report('closed:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_parse_array(self):
+        from sfepy.base.ioutils import parse_array
+
+        text = '# comment\n1 2.5 3\n\n4 5 6e0 # comment\n'
+        val = parse_array(text, comments='#')
+        ok = (val.shape == (2, 3)) and nm.allclose(val, [[1, 2.5, 3],
+                                                         [4, 5, 6]])
+        self.report('floats:', ok)
+
+        val = parse_array(['1,2', '3.0,4'], dtype=nm.int32, sep=',')
+        _ok = (val.dtype == nm.int32) and (val == [[1, 2], [3, 4]]).all()
+        self.report('integers:', _ok)
+        ok = ok and _ok
+
+        try:
+            parse_array('1 2\n3', n_col=2)
+
+        except ValueError:
+            _ok = True
+
+        else:
+            _ok = False
+
+        self.report('wrong size detected:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_checkpoints(self):
+        from sfepy.base.ioutils import HDF5Checkpoints
+        from sfepy.base.ioutils import pt
+        if pt is None:
+            self.report('skipped (no pytables)')
+            return True
+        filename = op.join(self.options.out_dir, 'checkpoints.h5')
+
+        chk = HDF5Checkpoints(filename, mode='w')
+
+        u0 = nm.zeros(100)
+        u1 = nm.linspace(0, 1, 100)
+        u2 = 2 * u1
+        n_news = []
+        n_news.append(chk.save(0, {'step' : nm.asarray(0), 'u/0' : u0,
+                                   'u/1' : u0}))
+        n_news.append(chk.save(1, {'step' : nm.asarray(1), 'u/0' : u1,
+                                   'u/1' : u0}))
+        n_news.append(chk.save(2, {'step' : nm.asarray(2), 'u/0' : u2,
+                                   'u/1' : u1}, info={'a' : 1}))
+        self.report('written arrays:', n_news)
+        ok = n_news == [2, 2, 2]
+
+        chk = HDF5Checkpoints(filename)
+        _ok = (chk.n_snapshot == 3) and (chk.get_keys() == [0, 1, 2])
+        self.report('snapshots:', _ok)
+        ok = ok and _ok
+
+        key, arrays, info = chk.load()
+        _ok = ((key == 2) and (arrays['step'] == 2) and (info == {'a' : 1})
+               and nm.all(arrays['u/0'] == u2)
+               and nm.all(arrays['u/1'] == u1))
+        self.report('last snapshot:', _ok)
+        ok = ok and _ok
+
+        key, arrays, info = chk.load(1)
+        _ok = ((key == 1) and (arrays['step'] == 1)
+               and nm.all(arrays['u/0'] == u1)
+               and nm.all(arrays['u/1'] == u0))
+        self.report('snapshot 1:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_restart_checkpoints(self):
+        from sfepy import data_dir
+        from sfepy.base.conf import ProblemConf, get_standard_keywords
+        from sfepy.base.ioutils import pt
+        from sfepy.discrete import Problem
+        if pt is None:
+            self.report('skipped (no pytables)')
+            return True
+
+        filename = op.join(data_dir, 'examples/diffusion/time_poisson.py')
+        required, other = get_standard_keywords()
+
+        def create_problem(**options):
+            options['output_dir'] = self.options.out_dir
+            conf = ProblemConf.from_file(filename, required, other,
+                                         override={'options' : options})
+            return Problem.from_conf(conf)
+
+        # 11 time steps in chains of 3 snapshots, the last 2 chains kept.
+        pb = create_problem(save_restart=3, restart_keep=2)
+        state = pb.solve(save_results=False)
+        restart_filenames = pb._restart_filenames[:]
+        self.report('restart files:', restart_filenames)
+        ok = (len(restart_filenames) == 2) and all(op.exists(fname)
+                                                   for fname in
+                                                   restart_filenames)
+
+        # Restart from the last snapshot of the first kept chain.
+        pb = create_problem(load_restart=restart_filenames[0])
+        state1 = pb.solve(save_results=False)
+
+        _ok = nm.allclose(state1(), state(), atol=1e-12, rtol=0.0)
+        self.report('restarted solution equals the full one:', _ok)
+        ok = ok and _ok
+
+        return ok
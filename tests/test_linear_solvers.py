@@ -77,7 +77,13 @@ solvers = {
              {'method' : 'superlu',
               'warn' : True,}
     ),
+    'd03' : ('ls.scipy_direct',
+             {'method' : 'umfpack',
+              'reuse_symbolic' : True,
+              'warn' : True,}
+    ),
     'd10' : ('ls.mumps', {}),
+    'd11' : ('ls.mumps', {'reuse_symbolic' : True}),
     'i00' : ('ls.pyamg',
              {'method' : 'ruge_stuben_solver',
               'accel' : 'cg',
@@ -147,6 +153,22 @@ solvers = {
         'i_max'      : 1,
         'eps_a'      : 1e-10,
     }),
+    'newton-lag' : ('nls.newton', {
+        'i_max'      : 1,
+        'eps_a'      : 1e-10,
+        'mtx_lag'    : 2,
+    }),
+    'newton-ew' : ('nls.newton', {
+        'i_max'      : 20,
+        'eps_a'      : 1e-10,
+        'forcing'    : 'ew2',
+        'reuse_x0'   : True,
+    }),
+    'jfnk' : ('nls.jfnk', {
+        'i_max'      : 10,
+        'eps_a'      : 1e-10,
+        'pc_lag'     : 5,
+    }),
 }
 
 
@@ -303,3 +325,200 @@ class Test(TestCommon):
             self.report('sol0 == 2 * sol2:', _ok); ok = ok and _ok
 
         return ok
+
+    def test_matrix_stamps(self):
+        from sfepy.discrete.state import State
+        from sfepy.linalg.sparse import get_matrix_stamp
+        from sfepy.solvers.ls import _get_matrix_change
+
+        self.problem.init_solvers(ls_conf=self.problem.solver_confs['d00'])
+        nls = self.problem.get_nls()
+
+        state0 = State(self.problem.equations.variables)
+        state0.apply_ebc()
+        vec0 = state0.get_reduced()
+
+        self.problem.update_materials()
+
+        mtx = nls.fun_grad(vec0)
+        stamp0 = get_matrix_stamp(mtx)
+        change, digest0 = _get_matrix_change(mtx, (0, ''))
+        ok = (stamp0 is not None) and (change == 'full')
+        self.report('new matrix:', stamp0, change, ok)
+
+        change, digest1 = _get_matrix_change(mtx, digest0)
+        _ok = (change == 'none') and (digest1 == digest0)
+        self.report('same matrix:', change, _ok)
+        ok = ok and _ok
+
+        mtx = nls.fun_grad(vec0)
+        stamp1 = get_matrix_stamp(mtx)
+        change, digest2 = _get_matrix_change(mtx, digest1)
+        _ok = ((stamp1[0] == stamp0[0]) and (stamp1[1] > stamp0[1])
+               and (change == 'numeric'))
+        self.report('reassembled matrix:', stamp1, change, _ok)
+        ok = ok and _ok
+
+        change, digest3 = _get_matrix_change(2 * mtx, digest2)
+        _ok = (change == 'full') and (digest3[1] != digest2[1])
+        self.report('unstamped matrix:', change, _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_inexact_newton(self):
+        from sfepy.base.base import IndexedStruct
+
+        confs = self.problem.solver_confs
+
+        status = IndexedStruct()
+        self.problem.init_solvers(status=status, ls_conf=confs['i20'],
+                                  nls_conf=confs['newton-ew'], force=True)
+        self.problem.solve()
+        status = status.nls_status
+
+        self.report('condition: %d, err0: %.3e, err: %.3e'
+                    % (status.condition, status.err0, status.err))
+        self.report('nonlinear iterations:', status.n_iter)
+        self.report('linear solves: %d, iterations: %d'
+                    % (status.ls_n_solve, status.ls_n_iter))
+        self.report('forcing terms:', status.etas)
+
+        ok = ((status.condition == 0)
+              and (status.ls_n_solve == status.n_iter == len(status.etas))
+              and (status.etas[0] == 0.5)
+              and all(eta <= 0.9 for eta in status.etas))
+
+        self.problem.init_solvers(ls_conf=confs['d00'],
+                                  nls_conf=confs['newton'], force=True)
+
+        return ok
+
+    def test_mtx_lag(self):
+        import numpy as nm
+        from sfepy.base.base import IndexedStruct
+
+        confs = self.problem.solver_confs
+        ls_conf = confs['d00'].copy()
+        ls_conf.use_presolve = True
+        ls_conf.reuse_symbolic = True
+
+        status = IndexedStruct()
+        self.problem.init_solvers(status=status, ls_conf=ls_conf,
+                                  nls_conf=confs['newton-lag'], force=True)
+        ls = self.problem.get_nls().lin_solver
+
+        ok = True
+        states = []
+        n_fun_grads = []
+        solves = []
+        ctxs = []
+        for ii in range(4):
+            states.append(self.problem.solve())
+            n_fun_grads.append(status.nls_status.n_fun_grad)
+            solves.append(ls.solve)
+            ctxs.append(getattr(ls, 'umfpack_ctx', None))
+
+            _ok = status.nls_status.condition == 0
+            ok = ok and _ok
+
+        self.report('converged:', ok)
+
+        # The matrix from the first call is lagged in the next two calls.
+        self.report('tangent matrix evaluations:', n_fun_grads)
+        _ok = n_fun_grads == [1, 0, 0, 1]
+        ok = ok and _ok
+
+        _ok = (solves[1] is solves[0]) and (solves[2] is solves[0])
+        self.report('factorization reused with lagged matrix:', _ok)
+        ok = ok and _ok
+
+        if ls.um is not None:
+            # The matrix reassembled in place has the same sparsity
+            # pattern -> numeric factorization only.
+            _ok = (solves[3] is not solves[0]) and (ctxs[3] is ctxs[0])
+            self.report('numeric refactorization only:', _ok)
+            ok = ok and _ok
+
+        _ok = all(nm.allclose(state(), states[0](), atol=1e-10, rtol=0.0)
+                  for state in states[1:])
+        self.report('same solutions:', _ok)
+        ok = ok and _ok
+
+        self.problem.init_solvers(ls_conf=confs['d00'],
+                                  nls_conf=confs['newton'], force=True)
+
+        return ok
+
+    def test_jfnk(self):
+        import numpy as nm
+        from sfepy.base.base import IndexedStruct
+
+        confs = self.problem.solver_confs
+
+        status = IndexedStruct()
+        self.problem.init_solvers(status=status, ls_conf=confs['d00'],
+                                  nls_conf=confs['jfnk'], force=True)
+        state = self.problem.solve()
+        status = status.nls_status
+
+        self.report('condition: %d, err0: %.3e, err: %.3e'
+                    % (status.condition, status.err0, status.err))
+        self.report('nonlinear iterations:', status.n_iter)
+        self.report('Krylov iterations:', status.ls_n_iter)
+        self.report('residual evaluations:', status.n_fun)
+        self.report('tangent matrix evaluations:', status.n_fun_grad)
+
+        ok = (status.condition == 0) and (status.n_fun_grad == 1)
+
+        self.problem.init_solvers(ls_conf=confs['d00'],
+                                  nls_conf=confs['newton'], force=True)
+        state0 = self.problem.solve()
+
+        _ok = nm.allclose(state(), state0(), atol=1e-8, rtol=0.0)
+        self.report('same solution as Newton:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_precond_reuse(self):
+        from sfepy.base.base import Struct
+        from sfepy.discrete.state import State
+        from sfepy.solvers.ls import _PrecondReuse, _get_matrix_change
+
+        self.problem.init_solvers(ls_conf=self.problem.solver_confs['d00'])
+        nls = self.problem.get_nls()
+
+        state0 = State(self.problem.equations.variables)
+        state0.apply_ebc()
+        vec0 = state0.get_reduced()
+
+        self.problem.update_materials()
+
+        conf = Struct(name='pc', verbose=False, pc_max_reuse=2,
+                      pc_iter_growth=0.5, pc_numeric_update=True)
+        policy = _PrecondReuse()
+
+        mtx = nls.fun_grad(vec0)
+        mtxs = [mtx, mtx, None, None, None, None, None, 2 * mtx]
+        n_iters = [10, 10, 12, 12, 10, 20, 10, 10]
+
+        actions = []
+        digest = (0, '')
+        for ii, mtx in enumerate(mtxs):
+            if mtx is None:
+                # Reassembled in place -> the same sparsity pattern.
+                mtx = nls.fun_grad(vec0)
+
+            change, digest = _get_matrix_change(mtx, digest)
+            action = policy.get_action(conf, mtx, change, ii > 0,
+                                       has_numeric=True)
+            policy.update(action, mtx, digest)
+            policy.set_n_iter(n_iters[ii])
+            actions.append(action)
+
+        self.report('actions:', actions)
+        ok = actions == ['rebuild', 'keep', 'reuse', 'reuse', 'numeric',
+                         'reuse', 'rebuild', 'reuse']
+
+        return ok
@@ -369,3 +369,112 @@ class Test(TestCommon):
             ok = ok and _ok
 
         return ok
+
+    def test_probe_series(self):
+        from sfepy import data_dir
+        from sfepy.discrete.probes import LineProbe
+
+        ok = True
+        for name in ['meshes/3d/block.mesh', 'meshes/2d/square_quad.mesh']:
+            self.report(name)
+
+            u = prepare_variable(op.join(data_dir, name), n_components=2)
+
+            bbox = u.field.domain.get_mesh_bounding_box()
+            probe = LineProbe(bbox[0] + 1e-3, bbox[1] - 1e-3, -10,
+                              share_geometry=False)
+
+            dofs = u()
+            series = [dofs, 2.0 * dofs, -dofs]
+            for mode in ['val', 'grad']:
+                pars, vals = probe(u, mode=mode)
+                spars, svals = probe.probe_series(u, iter(series), mode=mode)
+
+                _ok = nm.allclose(spars, pars)
+                for coef, sval in zip([1.0, 2.0, -1.0], svals):
+                    _ok = _ok and nm.allclose(sval, coef * vals,
+                                              rtol=1e-12, atol=1e-12)
+
+                self.report('%s: %d points, same as probe(): %s'
+                            % (mode, len(pars), _ok))
+                ok = ok and _ok
+
+        return ok
+
+    def test_interpolation_operator(self):
+        from sfepy import data_dir
+
+        ok = True
+        for name in ['meshes/3d/block.mesh', 'meshes/2d/square_unit_tri.mesh']:
+            self.report(name)
+
+            u = prepare_variable(op.join(data_dir, name), n_components=3)
+
+            bbox = u.field.domain.get_mesh_bounding_box()
+            # Some points are outside of the mesh.
+            coors = nm.c_[tuple([nm.linspace(ii[0] - 0.1, ii[1] + 0.1, 100)
+                                 for ii in bbox.T])]
+
+            for mode in ['val', 'grad']:
+                vals = u.evaluate_at(coors, mode=mode, close_limit=0.0)
+
+                iop = u.get_interpolation_operator(coors, mode=mode,
+                                                   close_limit=0.0)
+                ivals = u.evaluate_with(iop)
+
+                _ok = nm.allclose(ivals, vals, rtol=1e-12, atol=1e-12,
+                                  equal_nan=True)
+                self.report('%s: same as evaluate_at(): %s' % (mode, _ok))
+                ok = ok and _ok
+
+                _ok = iop is u.get_interpolation_operator(coors, mode=mode,
+                                                          close_limit=0.0)
+                self.report('%s: operator reused: %s' % (mode, _ok))
+                ok = ok and _ok
+
+            # Only the recently used operators are kept.
+            field = u.field
+            for ii in range(field.max_interp_operators + 2):
+                u.get_interpolation_operator(coors + 1e-3 * ii)
+
+            _ok = len(field.interp_operators) == field.max_interp_operators
+            self.report('operator cache bounded: %s' % _ok)
+            ok = ok and _ok
+
+        return ok
+
+    def test_bbox_strategy(self):
+        from sfepy import data_dir
+
+        ok = True
+        for name in ['meshes/3d/block.mesh', 'meshes/3d/cylinder.mesh',
+                     'meshes/2d/square_unit_tri.mesh']:
+            self.report(name)
+
+            u = prepare_variable(op.join(data_dir, name), n_components=1)
+
+            bbox = u.field.domain.get_mesh_bounding_box()
+            coors = nm.c_[tuple([nm.linspace(ii[0] - 0.1, ii[1] + 0.1, 1000)
+                                 for ii in bbox.T])]
+
+            for close_limit in [0.0, 0.5]:
+                vals, st = u.evaluate_at(coors, close_limit=close_limit,
+                                         ret_status=True)[::2]
+                bvals, bst = u.evaluate_at(coors, strategy='bbox',
+                                           close_limit=close_limit,
+                                           ret_status=True)[::2]
+
+                ii = nm.where(st == 0)[0]
+                _ok = ((bst[ii] == 0).all()
+                       and nm.allclose(bvals[ii], vals[ii],
+                                       rtol=0.0, atol=1e-12))
+                self.report('close_limit %s: %d points inside: %s'
+                            % (close_limit, len(ii), _ok))
+                ok = ok and _ok
+
+            _ok = (u.field.get_cell_index().n_cell
+                   == u.field.region.get_n_cells())
+            self.report('index cached:', _ok)
+            ok = ok and _ok
+
+        return ok
@@ -21,7 +21,10 @@ filename_meshes = ['/meshes/3d/cylinder.mesh',
                    '/meshes/various_formats/msh_tri.msh',
                    '/meshes/various_formats/msh_tetra.msh',
                    '/meshes/various_formats/xyz_quad.xyz',
-                   '/meshes/various_formats/xyz_tet.xyz']
+                   '/meshes/various_formats/xyz_tet.xyz',
+                   '/meshes/various_formats/gambit_tet.neu',
+                   '/meshes/various_formats/ansys_tet.cdb',
+                   '/meshes/various_formats/hypermesh_tet.hmascii']
 filename_meshes = [data_dir + name for name in filename_meshes]
 
 def mesh_hook(mesh, mode):
@@ -54,7 +57,8 @@ class Test(TestCommon):
     """Write test names explicitely to impose a given order of evaluation."""
     tests = ['test_read_meshes', 'test_compare_same_meshes',
              'test_read_dimension', 'test_write_read_meshes',
-             'test_hdf5_meshio']
+             'test_hdf5_meshio', 'test_hdf5_time_major',
+             'test_hdf5_session', 'test_mmap_meshio', 'test_xdmf_index']
 
     @staticmethod
     def from_conf(conf, options):
@@ -411,3 +415,181 @@ class Test(TestCommon):
             self.assert_equal(val, data[key])
 
         return True
+
+    def test_hdf5_time_major(self):
+        import numpy as nm
+        from sfepy.base.base import Struct
+        from sfepy.discrete.fem import Mesh
+        from sfepy.discrete.fem.meshio import MeshIO, HDF5TimeMajorMeshIO
+        from sfepy.solvers.ts import TimeStepper
+
+        conf_dir = op.dirname(__file__)
+        mesh = Mesh.from_file(data_dir + '/meshes/various_formats/small3d.mesh',
+                              prefix_dir=conf_dir)
+
+        filename = op.join(self.options.out_dir, 'test_time_major.h5')
+        ts = TimeStepper(0, 1, n_step=5)
+
+        wio = HDF5TimeMajorMeshIO(filename)
+        vals = []
+        for step, time in ts:
+            out = {
+                'u' : Struct(name='output_data', mode='vertex',
+                             data=nm.full((mesh.n_nod, 3), time),
+                             dofs=None),
+                'e' : Struct(name='output_data', mode='cell',
+                             data=nm.full((mesh.n_el, 1, 6, 1), step + 1.0),
+                             dofs=None),
+            }
+            wio.write(filename, mesh, out=out, ts=ts, step_chunk=2)
+            vals.append(out)
+
+        io = MeshIO.any_from_filename(filename)
+        steps, times, nts = io.read_times()
+        ok = (steps == nm.arange(ts.n_step)).all()
+        ok = ok and nm.allclose(times, ts.times)
+        self.report('steps and times:', ok)
+
+        for step in range(ts.n_step):
+            out = io.read_data(step)
+            for key in ['u', 'e']:
+                _ok = ((out[key].mode == vals[step][key].mode)
+                       and (out[key].data == vals[step][key].data).all())
+                if not _ok:
+                    self.report('wrong data of "%s" in step %d!'
+                                % (key, step))
+                ok = ok and _ok
+
+        mode, nname = io.read_data_header('u')
+        th = io.read_time_history(nname, [0, 2])
+        _ok = ((mode == 'vertex') and (th[2].shape == (ts.n_step, 3))
+               and nm.allclose(th[2][:, 0], ts.times))
+        self.report('vertex time history:', _ok)
+        ok = ok and _ok
+
+        mode, nname = io.read_data_header('e')
+        th = io.read_time_history(nname, [1])
+        _ok = ((mode == 'cell') and (th[1].shape == (ts.n_step, 6))
+               and nm.allclose(th[1][:, 0], nm.arange(ts.n_step) + 1.0))
+        self.report('cell time history:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_hdf5_session(self):
+        import numpy as nm
+        from sfepy.base.base import Struct
+        from sfepy.discrete.fem import Mesh
+        from sfepy.discrete.fem.meshio import (MeshIO, HDF5MeshIO,
+                                               HDF5TimeMajorMeshIO)
+        from sfepy.solvers.ts import TimeStepper
+
+        conf_dir = op.dirname(__file__)
+        mesh = Mesh.from_file(data_dir + '/meshes/various_formats/small3d.mesh',
+                              prefix_dir=conf_dir)
+
+        ts = TimeStepper(0, 1, n_step=5)
+
+        ok = True
+        for io_class in [HDF5MeshIO, HDF5TimeMajorMeshIO]:
+            filename = op.join(self.options.out_dir,
+                               'test_session_%s.h5' % io_class.format)
+
+            wio = io_class(filename)
+            wio.open_session(flush_every=2)
+            for step, time in ts:
+                out = {
+                    'u' : Struct(name='output_data', mode='vertex',
+                                 data=nm.full((mesh.n_nod, 3), time),
+                                 dofs=None),
+                }
+                wio.write(filename, mesh, out=out, ts=ts)
+
+            _ok = wio.session.fd.isopen
+            wio.close_session()
+            _ok = _ok and (wio.session is None)
+            self.report('%s: file kept open in session:' % io_class.format,
+                        _ok)
+            ok = ok and _ok
+
+            io = MeshIO.any_from_filename(filename)
+            _ok = io.read_last_step() == (ts.n_step - 1)
+            for step in range(ts.n_step):
+                out = io.read_data(step)
+                _ok = _ok and nm.allclose(out['u'].data, ts.times[step])
+
+            self.report('%s: data written in session:' % io_class.format,
+                        _ok)
+            ok = ok and _ok
+
+        return ok
+
+    def test_mmap_meshio(self):
+        import numpy as nm
+        from sfepy.discrete.fem import Mesh
+
+        conf_dir = op.dirname(__file__)
+        mesh0 = Mesh.from_file(data_dir
+                               + '/meshes/various_formats/small3d.mesh',
+                               prefix_dir=conf_dir)
+
+        filename = op.join(self.options.out_dir, 'test_mesh_mmap.smm')
+        mesh0.write(filename, io='auto')
+        mesh1 = Mesh.from_file(filename)
+
+        ok = self._compare_meshes(mesh0, mesh1, 'cv')
+        ok = sum(ok) == len(ok)
+        self.report('meshes equal:', ok)
+
+        _ok = not mesh1.coors.flags.owndata
+        self.report('coordinates memory-mapped:', _ok)
+        ok = ok and _ok
+
+        mesh1.coors[:] += 1.0
+        mesh2 = Mesh.from_file(filename)
+        _ok = nm.allclose(mesh2.coors, mesh0.coors)
+        self.report('file unchanged by mesh changes:', _ok)
+        ok = ok and _ok
+
+        return ok
+
+    def test_xdmf_index(self):
+        import xml.etree.ElementTree as et
+        import numpy as nm
+        from sfepy.base.base import Struct
+        from sfepy.discrete.fem import Mesh
+        from sfepy.discrete.fem.meshio import HDF5XdmfMeshIO
+        from sfepy.solvers.ts import TimeStepper
+
+        conf_dir = op.dirname(__file__)
+        mesh = Mesh.from_file(data_dir + '/meshes/various_formats/small3d.mesh',
+                              prefix_dir=conf_dir)
+
+        ts = TimeStepper(0, 1, n_step=3)
+
+        part_filenames = [op.join(self.options.out_dir,
+                                  'test_xdmf_part_%d.h5' % ip)
+                          for ip in range(2)]
+        for step, time in ts:
+            for ip, filename in enumerate(part_filenames):
+                out = {
+                    'u' : Struct(name='output_data', mode='vertex',
+                                 data=nm.full((mesh.n_nod, 1), ip + time),
+                                 dofs=None),
+                }
+                mesh.write(filename, io=HDF5XdmfMeshIO(filename), out=out,
+                           ts=ts)
+
+        filename = op.join(self.options.out_dir, 'test_xdmf_index.xdmf')
+        HDF5XdmfMeshIO.write_xdmf_index(filename, part_filenames)
+
+        root = et.parse(filename).getroot()
+        steps = root.find('Domain').find('Grid').findall('Grid')
+        ok = len(steps) == ts.n_step
+        for et_step in steps:
+            ok = (ok and (et_step.get('CollectionType') == 'Spatial')
+                  and (len(et_step.findall('Grid')) == len(part_filenames)))
+
+        self.report('XDMF index structure:', ok)
+
+        return ok
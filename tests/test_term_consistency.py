@@ -273,3 +273,116 @@ class Test(TestCommon):
             self.report('failed')
 
         return ok
+
+    def test_eterm_paths_cache(self):
+        import os.path as op
+        import sfepy.terms.terms_multilinear as tm
+        from sfepy.discrete.evaluate import eval_equations
+
+        problem = self.problem
+        problem.set_equations()
+        problem.time_update(ebcs={}, epbcs={})
+
+        cache_dir = op.join(self.options.out_dir, 'eterm_paths_cache')
+
+        vals = []
+        for ii in range(2):
+            tm._paths_cache.clear()
+
+            equations, variables = problem.create_evaluable(
+                'de_laplace.i.Omega(ts, us)', mode='weak',
+            )
+            term = equations[0].terms[0]
+            term.set_backend(paths_cache_dir=cache_dir)
+
+            mtx = eval_equations(equations, variables, mode='weak',
+                                 dw_mode='matrix')
+            vals.append(mtx.toarray())
+
+            key = list(tm._paths_cache.keys())[0]
+            ok = op.exists(op.join(cache_dir, 'paths-%s.json' % key))
+            self.report('paths stored in cache:', ok)
+            if not ok: break
+
+        else:
+            ok = nm.allclose(vals[0], vals[1], rtol=0, atol=1e-14)
+            self.report('results equal:', ok)
+
+        return ok
+
+    def test_eterm_numba_backend(self):
+        import sfepy.terms.terms_multilinear as tm
+        from sfepy.discrete.evaluate import eval_equations
+
+        if tm.numba is None:
+            self.report('numba not available, skipping')
+            return True
+
+        problem = self.problem
+        problem.set_equations()
+        problem.time_update(ebcs={}, epbcs={})
+
+        # The problem equations contain the scalar variables only.
+        var_dict = problem.create_variables(['us', 'ts', 'uv', 'tv']).as_dict()
+
+        ok = True
+        for expr in ['de_laplace.i.Omega(ts, us)',
+                     'de_dot.i.Omega(tv, uv)',
+                     'de_div_grad.i.Omega(tv, uv)']:
+            vals = []
+            for backend in ['numpy', 'numba']:
+                equations, variables = problem.create_evaluable(
+                    expr, mode='weak', try_equations=False, var_dict=var_dict,
+                )
+                term = equations[0].terms[0]
+                term.set_backend(backend=backend)
+
+                mtx = eval_equations(equations, variables, mode='weak',
+                                     dw_mode='matrix')
+                vals.append(mtx.toarray())
+
+            _ok = nm.allclose(vals[0], vals[1], rtol=1e-12, atol=1e-12)
+            self.report('%s: %s' % (expr, _ok))
+            ok = ok and _ok
+
+        return ok
+
+    def test_chunked_evaluation(self):
+        from sfepy.base.goptions import goptions
+        from sfepy.discrete import Material
+        from sfepy.mechanics.matcoefs import stiffness_from_lame
+
+        problem = self.problem
+        problem.set_equations()
+        problem.time_update(ebcs={}, epbcs={})
+
+        uv = problem.create_variables(['uv'])['uv']
+        uv.set_data(nm.arange(uv.n_dof, dtype=uv.dtype))
+
+        mc = Material('mc', D=stiffness_from_lame(dim, 1.0, 2.0))
+
+        ok = True
+        for expr in ['dw_dot.i.Omega(tv, uv)',
+                     'dw_lin_elastic.i.Omega(mc.D, tv, uv)']:
+            vals = []
+            for limit in [0, 1e-3]:
+                goptions['eval_memory_limit'] = limit
+                try:
+                    mtx = problem.evaluate(expr, try_equations=False,
+                                           mode='weak', dw_mode='matrix',
+                                           uv=uv, mc=mc)
+                    vec = problem.evaluate(expr, try_equations=False,
+                                           mode='weak', dw_mode='vector',
+                                           uv=uv, mc=mc)
+
+                finally:
+                    goptions['eval_memory_limit'] = 0
+
+                vals.append((mtx.toarray(), vec))
+
+            _ok = ((vals[0][0] == vals[1][0]).all()
+                   and (vals[0][1] == vals[1][1]).all())
+            self.report('%s: chunked == unchunked: %s' % (expr, _ok))
+            ok = ok and _ok
+
+        return ok
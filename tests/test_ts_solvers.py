@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+import os.path as op
+
+import numpy as nm
+
+from sfepy.base.testing import TestCommon
+
+class Test(TestCommon):
+
+    @staticmethod
+    def from_conf(conf, options):
+        return Test(conf=conf, options=options)
+
+    def _create_problem(self, **options):
+        from sfepy import data_dir
+        from sfepy.base.conf import ProblemConf, get_standard_keywords
+        from sfepy.discrete import Problem
+
+        filename = op.join(data_dir,
+                           'examples/linear_elasticity/elastodynamic.py')
+        required, other = get_standard_keywords()
+        conf = ProblemConf.from_file(
+            filename, required, other,
+            override={'options' : dict(output_dir=self.options.out_dir,
+                                       **options)}
+        )
+        pb = Problem.from_conf(conf, init_solvers=False)
+        pb.set_conf_solvers(conf.solvers, conf.options)
+
+        return pb
+
+    def _solve(self, pb, ts_name, **kwargs):
+        """
+        Solve the problem `pb` using the time-stepping solver `ts_name` with
+        the parameters modified by `kwargs`.
+        """
+        from sfepy.base.base import IndexedStruct
+
+        ts_conf = pb.solver_confs[ts_name].copy()
+        for key, val in kwargs.items():
+            setattr(ts_conf, key, val)
+
+        status = IndexedStruct()
+        pb.init_solvers(status=status, ts_conf=ts_conf, force=True)
+        state = pb.solve(status=status, save_results=False)
+
+        return state
+
+    def test_central_difference(self):
+        pb = self._create_problem()
+        vv_conf = pb.solver_confs['tsvv']
+        cd_conf = pb.solver_confs['tscd']
+
+        # The velocity-Verlet solution with a small time step is the
+        # reference.
+        t1 = vv_conf.t1 / 3.0
+        state0 = self._solve(pb, 'tsvv', t1=t1, dt=0.1 * vv_conf.dt)
+        u0 = state0('u')
+
+        ok = True
+        for wave_speed, dt_safety in [(cd_conf.wave_speed, 0.9),
+                                      (None, 0.5)]:
+            pb = self._create_problem()
+            state = self._solve(pb, 'tscd', t1=t1, wave_speed=wave_speed,
+                                dt_safety=dt_safety)
+            ts = pb.get_solver().ts
+            u = state('u')
+            err = nm.linalg.norm(u - u0) / nm.linalg.norm(u0)
+            self.report('wave speed: %s, dt: %e, n_step: %d, rel. error: %e'
+                        % (wave_speed, ts.dt, ts.n_step, err))
+
+            _ok = (nm.isfinite(u).all() and (ts.dt < vv_conf.dt)
+                   and (err < 0.2))
+            self.report('central difference agrees with velocity-Verlet:',
+                        _ok)
+            ok = ok and _ok
+
+        return ok
+
+    def test_block_matrices(self):
+        ok = True
+        for active_only in [True, False]:
+            self.report('active_only:', active_only)
+            pb = self._create_problem(active_only=active_only)
+            n_conf = pb.solver_confs['tsn']
+            self._solve(pb, 'tsn', t1=2 * n_conf.dt)
+
+            tss = pb.get_solver()
+            _ok = bool(tss.pattern)
+            self.report('shared sparsity pattern:', _ok)
+            ok = ok and _ok
+
+            # The blocks assembled separately are equal to the blocks of the
+            # matrix assembled for the stacked vector.
+            i3 = pb.equations.variables.adi.ptr[-1] // 3
+            vec = nm.zeros(3 * i3, dtype=nm.float64)
+            mtxs = tss.get_block_matrices(vec, i3)
+            _ok = mtxs is not None
+            self.report('blocks assembled separately:', _ok)
+            ok = ok and _ok
+            if not _ok: continue
+
+            mtxs0 = tss.get_stacked_matrices(tss.nls, vec, i3)
+            for name, mtx, mtx0 in zip(['M', 'C', 'K'], mtxs, mtxs0):
+                scale = max(abs(mtx0).max(), 1.0)
+                err = abs(mtx - mtx0).max() / scale
+                self.report('%s: max. rel. difference: %e' % (name, err))
+                ok = ok and (err < 1e-12)
+
+            M, C, K = mtxs
+            M0, C0, K0 = mtxs0
+            Kt = tss.get_effective_matrix(M, C, K, 1.0, 0.5, 0.25)
+            Kt0 = M0 + 0.5 * C0 + 0.25 * K0
+            err = abs(Kt - Kt0).max() / abs(Kt0).max()
+            self.report('effective matrix: max. rel. difference: %e' % err)
+            ok = ok and (Kt.nnz == len(tss.pattern[1])) and (err < 1e-12)
+
+        return ok